@@ -0,0 +1,179 @@
+# Admission control: per-user token buckets per endpoint class and a concurrency cap on expensive routes.
+# Requests over budget are rejected before the handler runs (429 / 503 with Retry-After), so an abusive
+# client cannot tie up workers or database connections needed by everyone else's CRUD traffic.
+# All of this state is per worker process. The configured limits are for the whole deployment and are
+# divided by the worker count, so a client whose requests are spread over the workers gets about the
+# configured rate in total; that is approximate, since one worker may see more of a client's requests.
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+# Monotonic clock for bucket refill
+import time
+from typing import Dict, Tuple
+
+from flask import g, jsonify, request, session
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import metrics
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# Worker processes sharing the limits (gunicorn.conf.py exports its worker count; 1 under the dev server)
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def _per_worker(name: str, default: float) -> float:
+    # This worker's share of a deployment-wide limit, never below one request
+    return max(1.0, _env_float(name, default) / WORKER_COUNT)
+
+
+def _rate_per_worker(name: str, default: float) -> float:
+    return _env_float(name, default) / WORKER_COUNT
+
+
+# Endpoint class -> (tokens per second, burst size) for this worker. Tune the deployment-wide values with
+# ADMISSION_<CLASS>_RATE / _BURST.
+CLASS_LIMITS: Dict[str, Tuple[float, float]] = {
+    "crud": (_rate_per_worker("ADMISSION_CRUD_RATE", 20), _per_worker("ADMISSION_CRUD_BURST", 60)),
+    "analytics": (_rate_per_worker("ADMISSION_ANALYTICS_RATE", 1), _per_worker("ADMISSION_ANALYTICS_BURST", 10)),
+    "auth": (_rate_per_worker("ADMISSION_AUTH_RATE", 0.5), _per_worker("ADMISSION_AUTH_BURST", 10)),
+}
+
+# Flask endpoint name -> class; unlisted endpoints (health, metrics, SSE) are not limited.
+ENDPOINT_CLASSES: Dict[str, str] = {
+    "list_tasks": "crud",
+    "task_counts": "crud",
+    "create_task": "crud",
+    "update_task": "crud",
+    "delete_task": "crud",
+    "bulk_update_tasks": "crud",
+    "add_item": "crud",
+    "update_item": "crud",
+    "toggle_item": "crud",
+    "remove_item": "crud",
+    "reorder_items": "crud",
+    "get_user": "crud",
+    "analytics_summary": "analytics",
+    "analytics_cfd": "analytics",
+    "analytics_streak": "analytics",
+    "analytics_dashboard": "analytics",
+    "analytics_lead_time": "analytics",
+    "completed_tasks": "analytics",
+    "create_report": "crud",
+    "list_reports": "crud",
+    "get_report": "crud",
+    "report_result": "crud",
+    "cancel_report": "crud",
+    "register": "auth",
+    "login": "auth",
+}
+
+# Classes that also hold a slot in the concurrency cap while running; the cap is per deployment and each
+# worker enforces its share
+CAPPED_CLASSES = {"analytics"}
+ANALYTICS_MAX_CONCURRENCY = int(_per_worker("ANALYTICS_MAX_CONCURRENCY", 8))
+# How long a capped request may wait for a free slot before being shed
+ANALYTICS_QUEUE_SECONDS = _env_float("ANALYTICS_QUEUE_SECONDS", 0.05)
+# Reverse proxies in front of the app (0 = clients connect directly). Anonymous requests are limited per
+# client address, which behind a proxy is the proxy's own; with N > 0 the address (and scheme) comes from the
+# last N hops of X-Forwarded-For / -Proto instead. Never set it without a proxy that overwrites those headers,
+# or clients can pick their own bucket. app.config["TRUSTED_PROXIES"] takes precedence.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+# Idle buckets are pruned once the table grows past this many entries
+MAX_BUCKETS = int(os.getenv("ADMISSION_MAX_BUCKETS", "50000"))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token; returns 0 if admitted, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+_lock = threading.Lock()
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_slots = threading.BoundedSemaphore(ANALYTICS_MAX_CONCURRENCY)
+
+
+def _prune(now: float) -> None:
+    # Drop buckets that have been idle long enough to be full again
+    stale = [key for key, b in _buckets.items() if b.rate > 0 and now - b.updated > b.burst / b.rate]
+    for key in stale:
+        del _buckets[key]
+
+
+def check_rate(client_key: str, endpoint_class: str) -> float:
+    """Return 0 when the request is admitted, otherwise the Retry-After delay in seconds."""
+    rate, burst = CLASS_LIMITS[endpoint_class]
+    key = (client_key, endpoint_class)
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if len(_buckets) >= MAX_BUCKETS:
+                _prune(time.monotonic())
+            bucket = _buckets[key] = TokenBucket(rate, burst)
+        return bucket.take()
+
+
+def _reject(status: int, message: str, retry_after: float):
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_app(app) -> None:
+    """Register before/teardown hooks enforcing rate limits and the analytics concurrency cap."""
+    proxies = int(app.config.get("TRUSTED_PROXIES", TRUSTED_PROXIES))
+    if proxies:
+        # Wraps the WSGI app, so remote_addr is the forwarded client before any hook runs
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+
+    @app.before_request
+    def _admit():
+        # On by default; off under app.testing unless ADMISSION_ENABLED is set explicitly
+        if not app.config.get("ADMISSION_ENABLED", not app.testing):
+            return None
+        endpoint_class = ENDPOINT_CLASSES.get(request.endpoint or "")
+        if endpoint_class is None or request.method == "OPTIONS":
+            return None
+        user_id = session.get("user_id")
+        client_key = f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+
+        retry_after = check_rate(client_key, endpoint_class)
+        if retry_after > 0:
+            metrics.incr(f"admission.{endpoint_class}.rate_limited")
+            return _reject(429, "Too many requests. Please slow down.", retry_after)
+
+        if endpoint_class in CAPPED_CLASSES:
+            if not _slots.acquire(timeout=ANALYTICS_QUEUE_SECONDS):
+                metrics.incr(f"admission.{endpoint_class}.shed")
+                return _reject(503, "Server busy. Please retry shortly.", 1)
+            g.admission_slot = True
+        metrics.incr(f"admission.{endpoint_class}.admitted")
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        if g.pop("admission_slot", False):
+            _slots.release()
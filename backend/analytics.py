@@ -0,0 +1,276 @@
+# Analytics SQL: set-based queries used by the /api/analytics/* endpoints.
+# Computation stays in Postgres so results are exact regardless of history length.
+# Queries read the tasks_all view (live tasks plus the month-partitioned archive) so archived history counts.
+
+from __future__ import annotations
+
+# Summary stats in a single scan: FILTER aggregates cover both the requested window and the
+# fixed 7-day "this week" count, so the table is read once for the wider of the two ranges.
+# Parameters: user_id, days.
+SUMMARY_SELECT = """
+SELECT
+    COUNT(*) FILTER (WHERE completed_at >= NOW() - (%(days)s::int) * INTERVAL '1 day') AS total_completed,
+    COUNT(*) FILTER (
+        WHERE completed_at >= NOW() - (%(days)s::int) * INTERVAL '1 day' AND DATE(completed_at) <= due_date
+    ) AS completed_on_time,
+    AVG(EXTRACT(EPOCH FROM (completed_at - created_at)))
+        FILTER (WHERE completed_at >= NOW() - (%(days)s::int) * INTERVAL '1 day') AS avg_completion_seconds,
+    COUNT(*) FILTER (WHERE completed_at >= NOW() - INTERVAL '7 days') AS tasks_this_week
+FROM tasks_all
+WHERE user_id = %(user_id)s
+    AND completed = true
+    AND completed_at IS NOT NULL
+    AND completed_at >= NOW() - GREATEST(%(days)s::int, 7) * INTERVAL '1 day'
+"""
+
+# Cumulative flow per day over the window ending today: for each day D, tasks created on or before D
+# are Done if completed_at <= D, else In-Progress if completion_percent > 0, else Backlog.
+# Tasks completed before the window are Done on every day of it, so they are only counted (from the
+# (user_id, completed_at) indexes) and the per-day join reads open tasks and those completed in the window,
+# which lets the planner prune archive partitions older than the window.
+# Parameters: user_id, days, today.
+CFD_SELECT = """
+SELECT
+    day,
+    before_window.done + COUNT(t.id) FILTER (WHERE DATE(t.completed_at) <= day) AS done,
+    COUNT(t.id) FILTER (
+        WHERE (t.completed_at IS NULL OR DATE(t.completed_at) > day) AND COALESCE(t.completion_percent, 0) > 0
+    ) AS in_progress,
+    COUNT(t.id) FILTER (
+        WHERE (t.completed_at IS NULL OR DATE(t.completed_at) > day) AND COALESCE(t.completion_percent, 0) <= 0
+    ) AS backlog
+FROM (
+    SELECT gs::date AS day
+    FROM generate_series(%(today)s::date - (%(days)s::int - 1), %(today)s::date, INTERVAL '1 day') AS gs
+) AS days
+CROSS JOIN (
+    SELECT COUNT(*) AS done
+    FROM tasks_all
+    WHERE user_id = %(user_id)s AND completed_at < %(today)s::date - (%(days)s::int - 1)
+) AS before_window
+LEFT JOIN tasks_all t
+    ON t.user_id = %(user_id)s
+    AND DATE(t.created_at) <= day
+    AND (t.completed_at IS NULL OR t.completed_at >= %(today)s::date - (%(days)s::int - 1))
+GROUP BY day, before_window.done
+"""
+
+# JSON array of CFD points, rendered by Postgres. Expects a `cfd` relation shaped like CFD_SELECT.
+CFD_JSON_AGG = """
+COALESCE(json_agg(
+    json_build_object('date', day, 'backlog', backlog, 'in_progress', in_progress, 'done', done)
+    ORDER BY day
+), '[]')::text
+"""
+
+CFD_SQL = f"WITH cfd AS ({CFD_SELECT}) SELECT {CFD_JSON_AGG} FROM cfd"
+
+# On-time completion streak.
+#
+# Rules (unchanged from the original Python walk, minus its 365-row truncation):
+# - A day counts when at least one task was completed on or before its due date that day.
+#   Days with only late completions are treated exactly like days with no completions.
+# - Walking back from the most recent on-time day, consecutive on-time days may be separated
+#   by at most ONE missing day (gap of 2 calendar days); a larger gap ends the streak.
+#   Only on-time days are counted, so "Mon, Wed, Thu" is a streak of 3.
+# - The streak is current only if the most recent on-time day is today or yesterday
+#   (the same one-day tolerance applied to "today"); otherwise it is 0.
+#
+# The run ending at the latest on-time day is kept in task_counters.streak_days / streak_last_day
+# by write-path triggers (see counters.STREAK_DDL), so reading it is a single primary-key lookup;
+# only the "is it still current" check depends on today. Parameters: user_id, today.
+STREAK_SQL = """
+SELECT COALESCE((
+    SELECT CASE WHEN streak_last_day >= %(today)s::date - 1 THEN streak_days ELSE 0 END
+    FROM task_counters
+    WHERE user_id = %(user_id)s
+), 0)
+"""
+
+# Whole dashboard (summary, CFD and streak) in one statement / one round trip.
+# Parameters: user_id, days, today.
+DASHBOARD_SQL = f"""
+WITH summary AS ({SUMMARY_SELECT}),
+cfd AS ({CFD_SELECT})
+SELECT
+    s.total_completed,
+    s.completed_on_time,
+    s.avg_completion_seconds,
+    s.tasks_this_week,
+    (SELECT {CFD_JSON_AGG} FROM cfd) AS cfd_json,
+    ({STREAK_SQL}) AS streak
+FROM summary s
+"""
+
+
+# Lead-time distribution (created_at -> completed_at, in hours) over completed tasks in the window:
+# percentiles and a histogram overall, per priority and per on-time/late, in one grouped statement.
+LEAD_TIME_PERCENTILES = (0.5, 0.75, 0.9, 0.95)
+# Histogram bucket lower bounds in hours (1h, 4h, 1d, 3d, 1w, 2w, 30d); bucket 0 is "under 1h"
+LEAD_TIME_BUCKET_HOURS = (1, 4, 24, 72, 168, 336, 720)
+LEAD_TIME_BUCKET_LABELS = ("<1h", "1-4h", "4-24h", "1-3d", "3-7d", "7-14d", "14-30d", "30d+")
+
+_BUCKET_COUNTS = ",\n    ".join(
+    f"COUNT(*) FILTER (WHERE bucket = {i})" for i in range(len(LEAD_TIME_BUCKET_HOURS) + 1)
+)
+
+# Parameters: user_id, days. Rows: (dimension, key, count, percentiles[], mean, max, *bucket counts).
+LEAD_TIME_SQL = f"""
+WITH done AS (
+    SELECT
+        priority,
+        DATE(completed_at) <= due_date AS on_time,
+        (GREATEST(EXTRACT(EPOCH FROM completed_at - created_at), 0) / 3600.0)::float8 AS hours
+    FROM tasks_all
+    WHERE user_id = %(user_id)s
+        AND completed = true
+        AND completed_at IS NOT NULL
+        AND completed_at >= NOW() - (%(days)s::int) * INTERVAL '1 day'
+),
+bucketed AS (
+    SELECT priority, on_time, hours,
+           width_bucket(hours, ARRAY[{', '.join(str(h) for h in LEAD_TIME_BUCKET_HOURS)}]::float8[]) AS bucket
+    FROM done
+)
+SELECT
+    CASE WHEN GROUPING(priority) = 0 THEN 'priority' WHEN GROUPING(on_time) = 0 THEN 'timeliness' ELSE 'all' END,
+    CASE
+        WHEN GROUPING(priority) = 0 THEN priority
+        WHEN GROUPING(on_time) = 0 THEN CASE WHEN on_time THEN 'on_time' ELSE 'late' END
+        ELSE 'all'
+    END,
+    COUNT(*),
+    percentile_cont(ARRAY[{', '.join(str(p) for p in LEAD_TIME_PERCENTILES)}]::float8[]) WITHIN GROUP (ORDER BY hours),
+    AVG(hours),
+    MAX(hours),
+    {_BUCKET_COUNTS}
+FROM bucketed
+GROUP BY GROUPING SETS ((), (priority), (on_time))
+"""
+
+
+def _sqlite_percentile(p: float) -> str:
+    # percentile_cont via linear interpolation between the ranks around p * (n - 1)
+    pos = f"({p} * (n - 1))"
+    lo = f"CAST({pos} AS INTEGER)"
+    return (
+        f"SUM(CASE WHEN rn = {lo} THEN hours * (1 - ({pos} - {lo})) "
+        f"WHEN rn = {lo} + 1 THEN hours * ({pos} - {lo}) ELSE 0 END)"
+    )
+
+
+def _sqlite_bucket() -> str:
+    cases = " ".join(f"WHEN hours < {h} THEN {i}" for i, h in enumerate(LEAD_TIME_BUCKET_HOURS))
+    return f"CASE {cases} ELSE {len(LEAD_TIME_BUCKET_HOURS)} END"
+
+
+# SQLite fallback (db_sqlite.py schema; no percentile_cont, width_bucket or GROUPING SETS): same rows, with
+# the percentiles as separate columns. Parameters: :user_id, :days.
+LEAD_TIME_SQL_SQLITE = f"""
+WITH done AS (
+    SELECT
+        priority,
+        DATE(completed_at) <= due_date AS on_time,
+        MAX((julianday(completed_at) - julianday(created_at)) * 24.0, 0) AS hours
+    FROM tasks
+    WHERE user_id = :user_id
+        AND completed = 1
+        AND completed_at IS NOT NULL
+        AND completed_at >= datetime('now', '-' || :days || ' days')
+),
+grouped AS (
+    SELECT 'all' AS dimension, 'all' AS key, hours FROM done
+    UNION ALL
+    SELECT 'priority', priority, hours FROM done
+    UNION ALL
+    SELECT 'timeliness', CASE WHEN on_time THEN 'on_time' ELSE 'late' END, hours FROM done
+),
+ranked AS (
+    SELECT dimension, key, hours, {_sqlite_bucket()} AS bucket,
+           ROW_NUMBER() OVER (PARTITION BY dimension, key ORDER BY hours) - 1 AS rn,
+           COUNT(*) OVER (PARTITION BY dimension, key) AS n
+    FROM grouped
+)
+SELECT
+    dimension,
+    key,
+    COUNT(*),
+    {", ".join(_sqlite_percentile(p) for p in LEAD_TIME_PERCENTILES)},
+    AVG(hours),
+    MAX(hours),
+    {_BUCKET_COUNTS}
+FROM ranked
+GROUP BY dimension, key
+"""
+
+
+def lead_time_payload(rows, days: int, sqlite: bool = False) -> dict:
+    """Shape LEAD_TIME_SQL (or LEAD_TIME_SQL_SQLITE) rows for the API; times are in hours."""
+    n_pct = len(LEAD_TIME_PERCENTILES)
+    empty = {"count": 0, "mean": None, "max": None,
+             **{f"p{round(p * 100)}": None for p in LEAD_TIME_PERCENTILES},
+             "histogram": [0] * len(LEAD_TIME_BUCKET_LABELS)}
+    groups = {"all": {"all": empty}, "priority": {}, "timeliness": {}}
+    for row in rows:
+        dimension, key, count = row[0], row[1], row[2]
+        if sqlite:
+            percentiles, rest = row[3:3 + n_pct], row[3 + n_pct:]
+        else:
+            percentiles, rest = row[3] or [None] * n_pct, row[4:]
+        mean, max_hours, buckets = rest[0], rest[1], rest[2:]
+        groups[dimension][key] = {
+            "count": count,
+            "mean": round(float(mean), 2) if count and mean is not None else None,
+            "max": round(float(max_hours), 2) if count and max_hours is not None else None,
+            **{
+                f"p{round(p * 100)}": round(float(v), 2) if count and v is not None else None
+                for p, v in zip(LEAD_TIME_PERCENTILES, percentiles)
+            },
+            "histogram": [int(b) for b in buckets],
+        }
+    return {
+        "time_window_days": days,
+        "unit": "hours",
+        "buckets": [
+            {"label": label, "min_hours": lower, "max_hours": upper}
+            for label, lower, upper in zip(
+                LEAD_TIME_BUCKET_LABELS,
+                (0,) + LEAD_TIME_BUCKET_HOURS,
+                LEAD_TIME_BUCKET_HOURS + (None,),
+            )
+        ],
+        "overall": groups["all"]["all"],
+        "by_priority": {p: groups["priority"].get(p, empty) for p in ("P1", "P2", "P3")},
+        "by_timeliness": {k: groups["timeliness"].get(k, empty) for k in ("on_time", "late")},
+    }
+
+
+def summary_payload(row, days: int) -> dict:
+    """Shape (total_completed, completed_on_time, avg_completion_seconds, tasks_this_week) for the API."""
+    total_completed = row[0] or 0
+    completed_on_time = row[1] or 0
+    avg_completion_seconds = float(row[2]) if row[2] is not None else 0.0
+    tasks_this_week = row[3] or 0
+
+    on_time_rate = (
+        completed_on_time / total_completed if total_completed > 0 else 0.0
+    )
+
+    # Convert seconds → minutes / hours / days
+    return {
+        "total_completed": total_completed,
+        "completed_on_time": completed_on_time,
+        "on_time_rate": round(on_time_rate, 2),
+        "avg_completion_days": avg_completion_seconds / 86400.0,
+        "avg_completion_hours": round(avg_completion_seconds / 3600.0, 2),
+        "avg_completion_minutes": round(avg_completion_seconds / 60.0, 2),
+        "tasks_completed_this_week": tasks_this_week,
+        "time_window_days": days,
+    }
+
+
+def streak_payload(streak: int) -> dict:
+    return {
+        "on_time_streak_days": streak,
+        "current_streak": streak > 0,
+    }
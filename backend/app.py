@@ -3,43 +3,70 @@
 from __future__ import annotations
 
 # called in create_task() to generate a new UUID for each task before it’s written to the database
-from uuid import uuid4
+from uuid import UUID, uuid4
 # read environment variables for FLASK_SECRET_KEY, CORS_ORIGINS, etc., via os.getenv
 import os
+# session write timestamps for read-your-writes routing
+import time
 # used for validating due dates, capturing completion timestamps, and computing analytics windows
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 
 
 # Flask instantiates the web object
 # jsonify serializes data to JSON responses
 # accesses incoming payloads/headers
 # session stores the logged-in user’s ID/username
-from flask import Flask, jsonify, request, session
-from flask_cors import CORS
+from flask import Flask, Response, jsonify, request, session, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import logging
 
-from db import db_cursor, init_schema
-import json
+from db import close_pools, db_cursor, db_read_cursor, init_schema
+from events import acquire_stream_slot, broker, publish_task_event, release_stream_slot, sse_busy, sse_stream
+import admission
+import archive
+import compression
+import cors
+import health
+import jobs
+import metrics
+import profiling
+import queries
+import scheduler
+import shards
+import timeouts
+import tracing
+from analytics import lead_time_payload, streak_payload, summary_payload
+from coalesce import WriteCoalescer
+from counters import counts_payload
+from task_cache import task_cache
+from task_items import apply_item_operation
+import serialization
+from serialization import OrjsonProvider, dumps_bytes, raw_json_response
 
 # Load environment variables and configure logging/app settings.
 load_dotenv()
 # Structured app logging; INFO by default for request/DB diagnostics.
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s in %(module)s: %(message)s")
 app = Flask(__name__)
+# orjson for every jsonify() response and request.get_json() body.
+app.json = OrjsonProvider(app)
 # Secret used to sign session cookies; ensure a strong value in production.
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-change-me")
-# CORS: allow frontend origins and send cookies (supports_credentials=True) for session auth.
-allowed_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173")
-allowed_origins = [o.strip() for o in allowed_origins_env.split(",") if o.strip()]
-CORS(
-    app,
-    supports_credentials=True,
-    origins=allowed_origins,
-    resources={r"/api/*": {"origins": allowed_origins}},
-)
-app.logger.info("CORS allowed origins: %s", ", ".join(allowed_origins))
+# CORS: allow frontend origins (CORS_ORIGINS) with cookies for session auth; registered first so
+# preflights are answered before admission control and routing.
+cors.init_app(app)
+app.logger.info("CORS allowed origins: %s", ", ".join(sorted(cors.ALLOWED_ORIGINS)))
+# Per-user token buckets and an analytics concurrency cap, checked before handlers run.
+admission.init_app(app)
+# Statement budgets per endpoint class; cancelled queries answer 503 + Retry-After.
+timeouts.init_app(app)
+# Negotiated gzip/br/zstd compression for JSON and event-stream responses.
+compression.init_app(app)
+profiling.init_app(app)
+tracing.init_app(app)
+# Requests for users being moved between shards answer 503 + Retry-After.
+shards.init_app(app)
 
 # Diagnostics: verify DB connectivity on startup and log server version.
 def _log_db_connection() -> None:
@@ -70,6 +97,51 @@ else:
     # Ensure base schema exists and lightweight migrations have been applied.
     init_schema()
     app.logger.info("Database schema ensured (tables: users, tasks)")
+    # Don't carry startup connections across a preload fork; workers open their own pools lazily.
+    close_pools()
+
+# Upper bounds for ?days= windows; larger values are clamped rather than scanned.
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "366"))
+HISTORY_MAX_DAYS = int(os.getenv("HISTORY_MAX_DAYS", "3660"))
+
+
+# Helper: read ?days= and clamp it to [1, max_days].
+def _window_days(default: int, max_days: int) -> int:
+    days = request.args.get('days', default, type=int)
+    return min(max(days, 1), max_days)
+
+
+# Background archiver (ARCHIVE_INTERVAL_SECONDS > 0), due-date scheduler (SCAN_INTERVAL_SECONDS > 0) and
+# report workers (REPORT_WORKERS > 0) start lazily in each serving process, after any fork.
+@app.before_request
+def _start_background_jobs():
+    archive.ensure_background_archiver()
+    scheduler.ensure_background_scheduler()
+    jobs.ensure_workers()
+
+
+# Helper: remember when this session last wrote, so its reads stay on the primary briefly.
+def _mark_write() -> None:
+    session["last_write_at"] = time.time()
+
+
+# Response header with the user's task list version after a write; the same version is in the write's
+# task event, so the client can skip refetching for changes it already applied.
+LIST_VERSION_HEADER = "X-List-Version"
+
+
+# Helper: set the list version header on a write response (no header when the write bumped nothing).
+def _with_list_version(response, version: int | None):
+    if version is not None:
+        response.headers[LIST_VERSION_HEADER] = str(version)
+    return response
+
+
+# Helper: read-only cursor for analytics/history on the user's shard; replica-routed unless the session
+# just wrote.
+def _read_cursor(user_id: int):
+    return db_read_cursor(fresh_since=session.get("last_write_at"), user_id=user_id)
+
 
 # Helper: raises PermissionError if no logged-in user in the session cookie.
 def _require_user_id() -> int:
@@ -82,8 +154,8 @@ def _require_user_id() -> int:
 @app.get("/api/users/<int:user_id>")
 def get_user(user_id: int):
     # Public endpoint to fetch username by id (used for restoring UI state on refresh)
-    with db_cursor() as cur:
-        cur.execute("SELECT id, username FROM users WHERE id = %s", (user_id,))
+    with db_cursor(user_id, writing=False) as cur:
+        queries.execute(cur, "user_by_id", {"user_id": user_id})
         row = cur.fetchone()
     if not row:
         return jsonify({"message": "User not found."}), 404
@@ -93,115 +165,82 @@ def get_user(user_id: int):
 @app.post("/api/register")
 def register():
     # Auth: create a user with validation, unique username check, and session login.
-    # Set CORS headers explicitly
-    origin = request.headers.get('Origin')
-    allowed_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173")
-    allowed_origins = [o.strip() for o in allowed_origins_env.split(",") if o.strip()]
-    
     payload = request.get_json(silent=True) or request.form or {}
     username = (payload.get("username") or "").strip()
     password = payload.get("password") or ""
     
     # Enhanced validation
     if not username or not password:
-        response = jsonify({"message": "Username and password are required."})
-        response.status_code = 400
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return jsonify({"message": "Username and password are required."}), 400
     
     if len(username) < 3:
-        response = jsonify({"message": "Username must be at least 3 characters long."})
-        response.status_code = 400
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return jsonify({"message": "Username must be at least 3 characters long."}), 400
     
     if len(password) < 6:
-        response = jsonify({"message": "Password must be at least 6 characters long."})
-        response.status_code = 400
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return jsonify({"message": "Password must be at least 6 characters long."}), 400
 
-    password_hash = generate_password_hash(password)
+    with tracing.span("password.hash"):
+        password_hash = generate_password_hash(password)
 
+    taken = f"Username '{username}' already exists. Please choose another one."
     try:
-        with db_cursor() as cur:
-            # Check if username already exists
-            cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-            if cur.fetchone():
-                response = jsonify({"message": f"Username '{username}' already exists. Please choose another one."})
-                response.status_code = 400
-                if origin and origin in allowed_origins:
-                    response.headers['Access-Control-Allow-Origin'] = origin
-                    response.headers['Access-Control-Allow-Credentials'] = 'true'
-                return response
-            
-            cur.execute(
-                "INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id",
-                (username, password_hash),
-            )
-            new_id = cur.fetchone()[0]
+        if shards.sharded():
+            # The directory on shard 0 reserves the name and a global id, then the row goes to its shard
+            allocated = shards.allocate_user(username)
+            if allocated is None:
+                return jsonify({"message": taken}), 400
+            new_id, shard = allocated
+            try:
+                with db_cursor(shard=shard) as cur:
+                    queries.execute(cur, "user_insert_with_id", {
+                        "user_id": new_id, "username": username, "password_hash": password_hash,
+                    })
+            except Exception:
+                shards.release_user(new_id)
+                raise
+        else:
+            # One statement: a taken username inserts nothing and returns no row
+            with db_cursor() as cur:
+                queries.execute(cur, "user_insert", {"username": username, "password_hash": password_hash})
+                row = cur.fetchone()
+            if row is None:
+                return jsonify({"message": taken}), 400
+            new_id = row[0]
     except Exception as e:
         app.logger.error(f"Registration error: {str(e)}")
-        response = jsonify({"message": "Registration failed. Please try again."})
-        response.status_code = 400
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return jsonify({"message": "Registration failed. Please try again."}), 400
 
     session["user_id"] = new_id
     session["username"] = username
-    response = jsonify({"id": new_id, "username": username})
-    response.status_code = 201
-    if origin and origin in allowed_origins:
-        response.headers['Access-Control-Allow-Origin'] = origin
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-    return response
+    return jsonify({"id": new_id, "username": username}), 201
 
 
 @app.post("/api/login")
 def login():
     # Auth: verify credentials, set session, and return user basics.
-    # Set CORS headers explicitly
-    origin = request.headers.get('Origin')
-    allowed_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173")
-    allowed_origins = [o.strip() for o in allowed_origins_env.split(",") if o.strip()]
-    
     payload = request.get_json(silent=True) or request.form or {}
     username = (payload.get("username") or "").strip()
     password = payload.get("password") or ""
     if not username or not password:
-        response = jsonify({"message": "Username and password are required."})
-        response.status_code = 400
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
-
-    with db_cursor() as cur:
-        cur.execute("SELECT id, password_hash FROM users WHERE username = %s", (username,))
-        row = cur.fetchone()
-    if not row or not check_password_hash(row[1], password):
-        response = jsonify({"message": "Invalid credentials."})
-        response.status_code = 401
-        if origin and origin in allowed_origins:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
+        return jsonify({"message": "Username and password are required."}), 400
+
+    # Sharded: the directory maps the name to an id, and the id to the shard holding the credentials
+    shard, row = 0, None
+    if shards.sharded():
+        user_id = shards.locate_username(username)
+        shard = shards.shard_for(user_id, writing=False) if user_id is not None else None
+    if shard is not None:
+        with db_cursor(shard=shard) as cur:
+            queries.execute(cur, "user_credentials", {"username": username})
+            row = cur.fetchone()
+    with tracing.span("password.verify"):
+        valid = bool(row) and check_password_hash(row[1], password)
+    if not valid:
+        return jsonify({"message": "Invalid credentials."}), 401
 
     session["user_id"] = row[0]
     session["username"] = username
-    response = jsonify({"id": row[0], "username": username})
-    if origin and origin in allowed_origins:
-        response.headers['Access-Control-Allow-Origin'] = origin
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-    return response
+    return jsonify({"id": row[0], "username": username})
 
 
 @app.post("/api/logout")
@@ -232,31 +271,23 @@ def list_tasks():
     except PermissionError:
         return jsonify({"message": "Unauthorized"}), 401
 
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT id::text, name, due_date, priority, completed, COALESCE(actionable_items, '[]'::jsonb), completion_percent, COALESCE(total_time, 1)
-            FROM tasks
-            WHERE user_id = %s
-            ORDER BY due_date ASC, created_at ASC
-            """,
-            (user_id,),
-        )
-        rows = cur.fetchall()
-    tasks = [
-        {
-            "id": r[0],
-            "name": r[1],
-            "dueDate": r[2].isoformat(),
-            "priority": r[3],
-            "completed": r[4],
-            "actionableItems": r[5],
-            "completionPercent": r[6],
-            "totalTime": r[7],
-        }
-        for r in rows
-    ]
-    return jsonify(tasks)
+    # Unchanged users are served from the per-process cache (task_cache.py) without touching Postgres.
+    use_cache = task_cache.usable(session.get("last_write_at"))
+    body = task_cache.get(user_id) if use_cache else None
+    if body is None:
+        ticket = task_cache.ticket(user_id) if use_cache else None
+        # Reads aren't fenced, so the list stays available while the user is moved between shards
+        with db_cursor(user_id, writing=False) as cur:
+            queries.execute(cur, "task_list", {"user_id": user_id})
+            body = cur.fetchone()[0].encode("utf-8")
+        if use_cache:
+            task_cache.put(user_id, body, ticket)
+    if write_coalescer is not None:
+        pending = write_coalescer.pending_for(user_id)
+        if pending:
+            tasks = [_overlay_changes(t, pending.get(t["id"], {})) for t in serialization.loads(body)]
+            return jsonify(tasks)
+    return raw_json_response(body)
 
 
 @app.post("/api/tasks")
@@ -302,137 +333,174 @@ def create_task():
         return jsonify({"message": "Completion percent must be between 0 and 100."}), 400
 
     task_id = uuid4()
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO tasks (id, user_id, name, due_date, priority, actionable_items, completion_percent, total_time)
-            VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s, %s)
-            RETURNING id::text, name, due_date, priority, completed, actionable_items, completion_percent, total_time
-            """,
-            (str(task_id), user_id, name, due_date, priority, json.dumps(actionable_items), completion_percent, total_time),
-        )
-        row = cur.fetchone()
-    new_task = {
-        "id": row[0],
-        "name": row[1],
-        "dueDate": row[2].isoformat(),
-        "priority": row[3],
-        "completed": row[4],
-        "actionableItems": row[5],
-        "completionPercent": row[6],
-        "totalTime": row[7],
-    }
-    return jsonify(new_task), 201
+    with db_cursor(user_id) as cur:
+        queries.execute(cur, "task_insert", {
+            "task_id": str(task_id),
+            "user_id": user_id,
+            "name": name,
+            "due_date": due_date,
+            "priority": priority,
+            "actionable_items": dumps_bytes(actionable_items).decode("utf-8"),
+            "completion_percent": completion_percent,
+            "total_time": total_time,
+        })
+        body, version, _ = cur.fetchone()
+    _mark_write()
+    return _with_list_version(raw_json_response(body, 201), version)
 
 
-@app.patch("/api/tasks/<task_id>")
-def update_task(task_id: str):
-    # Tasks: partial update; handles completed_at when toggling completion.
-    # Validates due date format and bounds for completionPercent.
-    try:
-        user_id = _require_user_id()
-    except PermissionError:
-        return jsonify({"message": "Unauthorized"}), 401
+# Maps tasks columns accepted by updates to their key in the task JSON (for pending-write overlays).
+_TASK_COLUMN_KEYS = {
+    "name": "name",
+    "due_date": "dueDate",
+    "priority": "priority",
+    "completed": "completed",
+    "actionable_items": "actionableItems",
+    "completion_percent": "completionPercent",
+    "total_time": "totalTime",
+}
 
-    payload = request.get_json(silent=True) or {}
-    fields = []
-    values = []
+
+def _parse_task_changes(payload: dict) -> dict:
+    # Validate a partial task payload and return {column: value}.
+    # Raises ValueError with a user-facing message on invalid input.
+    changes = {}
 
     if "name" in payload:
         name = (payload.get("name") or "").strip()
         if not name:
-            return jsonify({"message": "Task name cannot be empty."}), 400
-        fields.append("name = %s")
-        values.append(name)
+            raise ValueError("Task name cannot be empty.")
+        changes["name"] = name
 
     if "dueDate" in payload:
         due_date = (payload.get("dueDate") or "").strip()
         if not due_date:
-            return jsonify({"message": "Due date cannot be empty."}), 400
+            raise ValueError("Due date cannot be empty.")
         
         # Validate due date format only (allow past dates for updates)
         try:
             datetime.strptime(due_date, "%Y-%m-%d").date()
         except ValueError:
-            return jsonify({"message": "Invalid due date format. Please use YYYY-MM-DD."}), 400
+            raise ValueError("Invalid due date format. Please use YYYY-MM-DD.")
         
-        fields.append("due_date = %s")
-        values.append(due_date)
+        changes["due_date"] = due_date
 
     if "priority" in payload:
         priority = (payload.get("priority") or "").strip()
         if priority not in {"P1", "P2", "P3"}:
-            return jsonify({"message": "Priority must be P1, P2, or P3."}), 400
-        fields.append("priority = %s")
-        values.append(priority)
+            raise ValueError("Priority must be P1, P2, or P3.")
+        changes["priority"] = priority
 
     if "completed" in payload:
         completed = payload.get("completed")
         if not isinstance(completed, bool):
-            return jsonify({"message": "Completed must be a boolean value."}), 400
-        fields.append("completed = %s")
-        values.append(completed)
+            raise ValueError("Completed must be a boolean value.")
+        changes["completed"] = completed
         
-        # Set completed_at timestamp when marking as complete
-        if completed:
-            fields.append("completed_at = %s")
-            values.append(datetime.now())
-        else:
-            # Clear completed_at if unmarking as complete
-            fields.append("completed_at = %s")
-            values.append(None)
+        # Set completed_at timestamp when marking as complete; clear it when unmarking
+        changes["completed_at"] = datetime.now() if completed else None
 
     if "actionableItems" in payload:
         items = payload.get("actionableItems") or []
         if not items or len(items) == 0:
-            return jsonify({"message": "At least one actionable item is required."}), 400
-        fields.append("actionable_items = %s::jsonb")
-        values.append(json.dumps(items))
+            raise ValueError("At least one actionable item is required.")
+        changes["actionable_items"] = items
 
     if "completionPercent" in payload:
         try:
             cp = int(payload.get("completionPercent"))
         except Exception:
-            return jsonify({"message": "Completion percent must be an integer."}), 400
+            raise ValueError("Completion percent must be an integer.")
         if cp < 0 or cp > 100:
-            return jsonify({"message": "Completion percent must be between 0 and 100."}), 400
-        fields.append("completion_percent = %s")
-        values.append(cp)
+            raise ValueError("Completion percent must be between 0 and 100.")
+        changes["completion_percent"] = cp
 
     if "totalTime" in payload:
         try:
             tt = int(payload.get("totalTime"))
         except Exception:
-            return jsonify({"message": "Total time must be an integer."}), 400
+            raise ValueError("Total time must be an integer.")
         if tt < 1:
-            return jsonify({"message": "Total time must be at least 1 hour."}), 400
-        fields.append("total_time = %s")
-        values.append(tt)
+            raise ValueError("Total time must be at least 1 hour.")
+        changes["total_time"] = tt
+
+    return changes
+
+
+def _apply_task_changes(cur, user_id: int, task_id: str, changes: dict) -> tuple[bool, str | None, int, bool]:
+    # Write validated changes with the fixed-shape prepared UPDATE (queries.TASK_UPDATE), which also
+    # publishes the change event; returns (found, task JSON, list version, changed).
+    queries.execute(cur, "task_update", queries.task_update_params(user_id, task_id, changes))
+    found, body, version, changed, _ = cur.fetchone()
+    return found, body, version, changed
+
+
+def _flush_coalesced_changes(user_id: int, task_id: str, changes: dict) -> None:
+    # Accepted before any shard move fence, and flushed well within the move's grace period
+    with db_cursor(shard=shards.shard_for(user_id, writing=False)) as cur:
+        _apply_task_changes(cur, user_id, task_id, changes)
 
-    if not fields:
+
+def _overlay_changes(task: dict, changes: dict) -> dict:
+    # Apply not-yet-flushed column changes on top of a task JSON object.
+    for column, value in changes.items():
+        key = _TASK_COLUMN_KEYS.get(column)
+        if key is not None:
+            task[key] = value
+    return task
+
+
+# Optional write coalescing: TASK_WRITE_COALESCE_MS > 0 merges PATCH bursts per task into one UPDATE.
+# Off by default and for single-worker deployments only (see coalesce.py).
+_coalesce_ms = int(os.getenv("TASK_WRITE_COALESCE_MS", "0"))
+write_coalescer = (
+    WriteCoalescer(_coalesce_ms / 1000.0, _flush_coalesced_changes) if _coalesce_ms > 0 else None
+)
+
+
+@app.patch("/api/tasks/<task_id>")
+def update_task(task_id: str):
+    # Tasks: partial update; handles completed_at when toggling completion.
+    # Validates due date format and bounds for completionPercent.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        changes = _parse_task_changes(payload)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if not changes:
         return jsonify({"message": "Nothing to update."}), 400
 
-    values.extend([user_id, task_id])
-    with db_cursor() as cur:
-        cur.execute(
-            f"UPDATE tasks SET {', '.join(fields)} WHERE user_id = %s AND id = %s RETURNING id::text, name, due_date, priority, completed, COALESCE(actionable_items,'[]'::jsonb), completion_percent, COALESCE(total_time, 1)",
-            tuple(values),
-        )
-        row = cur.fetchone()
-    if not row:
+    if write_coalescer is not None:
+        # Coalesced: confirm the task exists, queue the change, and answer with the merged view
+        # so this worker reads its own writes before the batch is flushed.
+        with db_cursor(user_id) as cur:
+            queries.execute(cur, "task_get", {"user_id": user_id, "task_id": task_id})
+            row = cur.fetchone()
+        if not row:
+            return jsonify({"message": "Task not found."}), 404
+        failed = write_coalescer.take_failed(user_id)
+        if failed:
+            # Earlier coalesced changes were dropped after retries; make the client reload before editing on
+            return jsonify({"message": "Some recent changes could not be saved. Please reload.", "failedTaskIds": failed}), 409
+        write_coalescer.submit(user_id, task_id, changes)
+        _mark_write()
+        pending = write_coalescer.pending_for(user_id).get(task_id, changes)
+        return jsonify(_overlay_changes(serialization.loads(row[0]), pending))
+
+    with db_cursor(user_id) as cur:
+        found, body, version, changed = _apply_task_changes(cur, user_id, task_id, changes)
+    if not found:
         return jsonify({"message": "Task not found."}), 404
-
-    task = {
-        "id": row[0],
-        "name": row[1],
-        "dueDate": row[2].isoformat(),
-        "priority": row[3],
-        "completed": row[4],
-        "actionableItems": row[5],
-        "completionPercent": row[6],
-        "totalTime": row[7],
-    }
-    return jsonify(task)
+    # Unchanged: nothing was written, so no event and the version stays the same
+    if changed:
+        _mark_write()
+    return _with_list_version(raw_json_response(body), version)
 
 
 @app.delete("/api/tasks/<task_id>")
@@ -443,12 +511,252 @@ def delete_task(task_id: str):
     except PermissionError:
         return jsonify({"message": "Unauthorized"}), 401
 
-    with db_cursor() as cur:
-        cur.execute("DELETE FROM tasks WHERE user_id = %s AND id = %s", (user_id, task_id))
-        deleted = cur.rowcount
-    if deleted == 0:
+    if write_coalescer is not None:
+        write_coalescer.discard(user_id, task_id)
+    with db_cursor(user_id) as cur:
+        queries.execute(cur, "task_delete", {"user_id": user_id, "task_id": task_id})
+        row = cur.fetchone()
+    if row is None:
         return jsonify({"message": "Task not found."}), 404
-    return "", 204
+    _mark_write()
+    return _with_list_version(app.response_class(status=204), row[1])
+
+
+# ----- Bulk operations: one set-based UPDATE per request instead of a PATCH per task -----
+
+# Largest |shiftDays| accepted for bulk reschedules
+BULK_MAX_SHIFT_DAYS = 3650
+
+
+def _parse_bulk_filter(spec: dict) -> dict:
+    # Validate a bulk filter ({"priority", "completed", "overdue", "dueBefore", "dueFrom", "ids"}) and
+    # return TASK_BULK_UPDATE filter parameters. Raises ValueError with a user-facing message.
+    filters = {}
+
+    if "priority" in spec:
+        priorities = spec.get("priority")
+        if isinstance(priorities, str):
+            priorities = [priorities]
+        if not isinstance(priorities, list) or not priorities or any(p not in {"P1", "P2", "P3"} for p in priorities):
+            raise ValueError("Filter priority must be P1, P2, P3 or a list of them.")
+        filters["priorities"] = priorities
+
+    if "completed" in spec:
+        if not isinstance(spec.get("completed"), bool):
+            raise ValueError("Filter completed must be a boolean value.")
+        filters["is_completed"] = spec["completed"]
+
+    for key, param in (("dueBefore", "due_before"), ("dueFrom", "due_from")):
+        if key in spec:
+            try:
+                filters[param] = datetime.strptime(str(spec.get(key) or "").strip(), "%Y-%m-%d").date()
+            except ValueError:
+                raise ValueError(f"Filter {key} must be a date in YYYY-MM-DD format.")
+
+    # Overdue: not completed and due before today
+    if spec.get("overdue") is True:
+        if filters.get("is_completed") is True:
+            raise ValueError("Filter overdue cannot be combined with completed: true.")
+        filters["is_completed"] = False
+        today = date.today()
+        filters["due_before"] = min(filters.get("due_before", today), today)
+
+    if "ids" in spec:
+        ids = spec.get("ids")
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("Filter ids must be a non-empty list.")
+        try:
+            filters["ids"] = [str(UUID(str(task_id))) for task_id in ids]
+        except ValueError:
+            raise ValueError("Filter ids must be task ids.")
+
+    return filters
+
+
+@app.post("/api/tasks/bulk")
+def bulk_update_tasks():
+    # Tasks: apply one change to every task matching a filter, e.g.
+    #   {"filter": {"priority": "P3", "dueBefore": "2025-01-01"}, "set": {"completed": true}}
+    #   {"filter": {"overdue": true}, "shiftDays": 7}
+    #   {"filter": {"dueFrom": "...", "dueBefore": "..."}, "set": {"priority": "P1"}, "returnIds": true}
+    # "set" is validated like PATCH /api/tasks/<id>; an empty filter matches all of the user's tasks.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    spec = payload.get("filter")
+    updates = payload.get("set") or {}
+    shift_days = payload.get("shiftDays") or 0
+    if not isinstance(spec, dict):
+        return jsonify({"message": "A filter object is required."}), 400
+    if not isinstance(updates, dict):
+        return jsonify({"message": "Set must be an object."}), 400
+    if "name" in updates or "actionableItems" in updates:
+        return jsonify({"message": "Name and actionable items cannot be changed in bulk."}), 400
+    if not isinstance(shift_days, int) or isinstance(shift_days, bool) or abs(shift_days) > BULK_MAX_SHIFT_DAYS:
+        return jsonify({"message": f"Shift days must be an integer between -{BULK_MAX_SHIFT_DAYS} and {BULK_MAX_SHIFT_DAYS}."}), 400
+    try:
+        filters = _parse_bulk_filter(spec)
+        changes = _parse_task_changes(updates)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if shift_days and "due_date" in changes:
+        return jsonify({"message": "Use either dueDate or shiftDays, not both."}), 400
+    if not changes and not shift_days:
+        return jsonify({"message": "Nothing to update."}), 400
+
+    # Pending coalesced PATCHes were made first; write them before the bulk change lands on top.
+    if write_coalescer is not None:
+        write_coalescer.flush_all(user_id)
+    return_ids = payload.get("returnIds") is True
+    with db_cursor(user_id) as cur:
+        queries.execute(cur, "task_bulk_update", queries.task_bulk_params(
+            user_id, changes, filters, shift_days=shift_days, return_ids=return_ids,
+        ))
+        count, ids, version = cur.fetchone()
+        # One event for the whole change: subscribers refetch once rather than per task.
+        if count:
+            publish_task_event(cur, user_id, "bulk", None, version=version)
+    if count:
+        _mark_write()
+    body = {"updated": count}
+    if return_ids:
+        body["ids"] = ids or []
+    return _with_list_version(jsonify(body), version)
+
+
+# ----- Actionable items: item-level operations (payload and write cost proportional to the change) -----
+
+def _item_operation(task_id: str, operation: str, **params):
+    # Shared handler body: run one item operation and publish the change, mapping failures to 404/400.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    # Pending coalesced PATCHes were made first; write them before the item change lands on top.
+    if write_coalescer is not None:
+        write_coalescer.flush_all(user_id)
+    with db_cursor(user_id) as cur:
+        result = apply_item_operation(cur, user_id, task_id, operation, **params)
+        if result is None:
+            queries.execute(cur, "task_exists", {"user_id": user_id, "task_id": task_id})
+            exists = cur.fetchone() is not None
+    if result is None:
+        if not exists:
+            return jsonify({"message": "Task not found."}), 404
+        if operation == "remove":
+            return jsonify({"message": "Item not found, or it is the last actionable item."}), 400
+        return jsonify({"message": "Item not found."}), 400
+    body, version = result
+    _mark_write()
+    return _with_list_version(raw_json_response(body), version)
+
+
+@app.post("/api/tasks/<task_id>/items")
+def add_item(task_id: str):
+    # Append one actionable item: {"text": "..."}
+    payload = request.get_json(silent=True) or {}
+    text = (payload.get("text") or "").strip()
+    if not text:
+        return jsonify({"message": "Item text is required."}), 400
+    return _item_operation(task_id, "add", text=text)
+
+
+@app.patch("/api/tasks/<task_id>/items/<int:index>")
+def update_item(task_id: str, index: int):
+    # Edit one item's text and/or checked state: {"text": "...", "done": true}
+    payload = request.get_json(silent=True) or {}
+    text = None
+    if "text" in payload:
+        text = (payload.get("text") or "").strip()
+        if not text:
+            return jsonify({"message": "Item text cannot be empty."}), 400
+    done = payload.get("done")
+    if done is not None and not isinstance(done, bool):
+        return jsonify({"message": "Done must be a boolean value."}), 400
+    if text is None and done is None:
+        return jsonify({"message": "Nothing to update."}), 400
+    return _item_operation(task_id, "set", index=index, text=text, done=done)
+
+
+@app.post("/api/tasks/<task_id>/items/<int:index>/toggle")
+def toggle_item(task_id: str, index: int):
+    # Flip one item's checked state
+    return _item_operation(task_id, "toggle", index=index)
+
+
+@app.delete("/api/tasks/<task_id>/items/<int:index>")
+def remove_item(task_id: str, index: int):
+    # Remove one item; the last remaining item cannot be removed
+    return _item_operation(task_id, "remove", index=index)
+
+
+@app.post("/api/tasks/<task_id>/items/reorder")
+def reorder_items(task_id: str):
+    # Move one item: {"from": 0, "to": 2}
+    payload = request.get_json(silent=True) or {}
+    from_index = payload.get("from")
+    to_index = payload.get("to")
+    if not isinstance(from_index, int) or not isinstance(to_index, int) or from_index < 0 or to_index < 0:
+        return jsonify({"message": "From and to must be non-negative integers."}), 400
+    return _item_operation(task_id, "reorder", from_index=from_index, to_index=to_index)
+
+
+@app.get("/api/tasks/events")
+def task_events():
+    # Live updates: Server-Sent Events stream of created/updated/deleted events for the current user.
+    # EventSource resends the last received id in Last-Event-ID on reconnect; missed events are replayed
+    # from the per-process buffer, or a "reset" event tells the client to refetch the list.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # Each open stream pins a worker thread; past the per-worker cap the client is told to reconnect later
+    # (a 200 with a long retry, since EventSource gives up for good on an error status).
+    if not acquire_stream_slot():
+        metrics.incr("sse.busy")
+        return Response(sse_busy(), mimetype="text/event-stream", headers=headers)
+    try:
+        sub = broker.subscribe(user_id, last_event_id)
+    except Exception:
+        release_stream_slot()
+        raise
+    response = Response(stream_with_context(sse_stream(sub)), mimetype="text/event-stream", headers=headers)
+
+    # Runs when the response is closed, even if the stream was never iterated
+    @response.call_on_close
+    def _close_stream():
+        broker.unsubscribe(sub)
+        release_stream_slot()
+
+    return response
+
+
+@app.get("/api/tasks/counts")
+def task_counts():
+    # Counts: open, overdue, due today and completed per priority, read from the trigger-maintained
+    # counter tables (counters.py) instead of scanning the task list.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "task_counts", {"user_id": user_id, "today": date.today()})
+        row = cur.fetchone()
+
+    return jsonify(counts_payload(row))
 
 
 # ==================== ANALYTICS ENDPOINTS ====================
@@ -463,62 +771,14 @@ def analytics_summary():
         return jsonify({"message": "Unauthorized"}), 401
     
     # Get days parameter (default 30)
-    days = request.args.get('days', 30, type=int)
+    days = _window_days(30, ANALYTICS_MAX_DAYS)
     
-    with db_cursor() as cur:
-        # Get completed tasks in the time window
-        cur.execute(
-            """
-            SELECT 
-                COUNT(*) as total_completed,
-                COUNT(CASE WHEN DATE(completed_at) <= due_date THEN 1 END) as completed_on_time,
-                AVG(EXTRACT(EPOCH FROM (completed_at - created_at))) AS avg_completion_seconds
-            FROM tasks
-            WHERE user_id = %s 
-                AND completed = true 
-                AND completed_at IS NOT NULL
-                AND completed_at >= NOW() - (%s::int) * INTERVAL '1 day'
-            """,
-            (user_id, days)
-        )
+    # Window stats and the 7-day count come from one scan (FILTER aggregates).
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_summary", {"user_id": user_id, "days": days})
         row = cur.fetchone()
-        
-        total_completed = row[0] or 0
-        completed_on_time = row[1] or 0
-        avg_completion_seconds = float(row[2]) if row[2] is not None else 0.0
-
-        # Convert seconds → minutes / hours / days
-        avg_completion_minutes = avg_completion_seconds / 60.0
-        avg_completion_hours = avg_completion_seconds / 3600.0
-        avg_completion_days = avg_completion_seconds / 86400.0
-        
-        on_time_rate = (
-            completed_on_time / total_completed if total_completed > 0 else 0.0
-        )
-        
-        # Get tasks completed this week
-        cur.execute(
-            """
-            SELECT COUNT(*)
-            FROM tasks
-            WHERE user_id = %s 
-                AND completed = true
-                AND completed_at >= NOW() - INTERVAL '7 days'
-            """,
-            (user_id,)
-        )
-        tasks_this_week = cur.fetchone()[0] or 0
-    
-    return jsonify({
-        "total_completed": total_completed,
-        "completed_on_time": completed_on_time,
-        "on_time_rate": round(on_time_rate, 2),
-        "avg_completion_days": avg_completion_days,
-        "avg_completion_hours": round(avg_completion_hours, 2),
-        "avg_completion_minutes": round(avg_completion_minutes, 2),
-        "tasks_completed_this_week": tasks_this_week,
-        "time_window_days": days
-    })
+
+    return jsonify(summary_payload(row, days))
 
 
 @app.get("/api/analytics/streak")
@@ -530,64 +790,12 @@ def analytics_streak():
     except PermissionError:
         return jsonify({"message": "Unauthorized"}), 401
     
-    # Get completed tasks ordered by completion date
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT 
-                DATE(completed_at) as completion_date,
-                CASE 
-                    WHEN DATE(completed_at) <= due_date THEN true
-                    ELSE false
-                END as on_time
-            FROM tasks
-            WHERE user_id = %s 
-                AND completed = true
-                AND completed_at IS NOT NULL
-            ORDER BY completed_at DESC
-            LIMIT 365
-            """,
-            (user_id,)
-        )
-        rows = cur.fetchall()
-    
-    if not rows:
-        return jsonify({"on_time_streak_days": 0, "current_streak": False})
-    
-    # Group by date and check if at least one task was completed on-time each day
-    from collections import defaultdict
-    daily_on_time = defaultdict(bool)
-    
-    for row in rows:
-        completion_date = row[0]
-        on_time = row[1]
-        # If any task on this day was on-time, mark the day as on-time
-        if on_time:
-            daily_on_time[completion_date] = True
-    
-    # Create sorted list of dates
-    sorted_dates = sorted(daily_on_time.keys(), reverse=True)
-    
-    # Calculate current streak
-    streak = 0
-    today = date.today()
-    expected_date = today
-    
-    for completion_date in sorted_dates:
-        # Allow 1 day gap tolerance
-        if (expected_date - completion_date).days <= 1:
-            if daily_on_time[completion_date]:
-                streak += 1
-                expected_date = completion_date - timedelta(days=1)
-            else:
-                break
-        else:
-            break
-    
-    return jsonify({
-        "on_time_streak_days": streak,
-        "current_streak": streak > 0
-    })
+    # Streak read from the trigger-maintained counters row (see analytics.STREAK_SQL).
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_streak", {"user_id": user_id, "today": date.today()})
+        streak = cur.fetchone()[0] or 0
+
+    return jsonify(streak_payload(streak))
 
 
 @app.get("/api/analytics/cfd")
@@ -599,68 +807,55 @@ def analytics_cfd():
     except PermissionError:
         return jsonify({"message": "Unauthorized"}), 401
     
-    days = request.args.get('days', 30, type=int)
+    days = _window_days(30, ANALYTICS_MAX_DAYS)
     
-    with db_cursor() as cur:
-        # Get all tasks for the user
-        cur.execute(
-            """
-            SELECT 
-                id,
-                created_at,
-                completed,
-                completed_at,
-                completion_percent
-            FROM tasks
-            WHERE user_id = %s
-            ORDER BY created_at
-            """,
-            (user_id,)
-        )
-        tasks = cur.fetchall()
-    
-    # Generate data for each day
-    from datetime import timedelta
-    
-    today = date.today()
-    start_date = today - timedelta(days=days-1)
-    
-    cfd_data = []
-    
-    for i in range(days):
-        current_date = start_date + timedelta(days=i)
-        backlog = 0
-        in_progress = 0
-        done = 0
-        
-        for task in tasks:
-            task_created = task[1].date() if task[1] else None
-            task_completed_at = task[3].date() if task[3] else None
-            completion_percent = task[4] or 0
-            
-            # Skip if task not created yet on this date
-            if not task_created or task_created > current_date:
-                continue
-            
-            # Check status on this date (per spec in Screenshot 4)
-            # If completed_at <= D → Done
-            if task_completed_at and task_completed_at <= current_date:
-                done += 1
-            # Else if created_at <= D and completion_percent > 0 → In-Progress
-            elif completion_percent > 0:
-                in_progress += 1
-            # Else if created_at <= D and completion_percent == 0 → Backlog
-            else:
-                backlog += 1
-        
-        cfd_data.append({
-            "date": current_date.isoformat(),
-            "backlog": backlog,
-            "in_progress": in_progress,
-            "done": done
-        })
-    
-    return jsonify(cfd_data)
+    # Per-day bucket counts are computed and rendered to JSON by Postgres.
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_cfd", {"user_id": user_id, "days": days, "today": date.today()})
+        body = cur.fetchone()[0]
+
+    return raw_json_response(body)
+
+
+@app.get("/api/analytics/dashboard")
+def analytics_dashboard():
+    # Dashboard: summary, CFD and streak in one query, nested under their existing response shapes.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    days = _window_days(30, ANALYTICS_MAX_DAYS)
+
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_dashboard", {"user_id": user_id, "days": days, "today": date.today()})
+        row = cur.fetchone()
+
+    body = b"".join([
+        b'{"summary":', dumps_bytes(summary_payload(row[:4], days)),
+        b',"cfd":', row[4].encode("utf-8"),
+        b',"streak":', dumps_bytes(streak_payload(row[5] or 0)),
+        b"}",
+    ])
+    return raw_json_response(body)
+
+
+@app.get("/api/analytics/lead-time")
+def analytics_lead_time():
+    # Lead time (created -> completed) percentiles and histogram, overall / per priority / on-time vs late.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    days = _window_days(90, ANALYTICS_MAX_DAYS)
+
+    # All groupings come from one GROUPING SETS scan (see analytics.LEAD_TIME_SQL).
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_lead_time", {"user_id": user_id, "days": days})
+        rows = cur.fetchall()
+
+    return jsonify(lead_time_payload(rows, days))
 
 
 @app.get("/api/completed-tasks")
@@ -672,61 +867,146 @@ def completed_tasks():
         return jsonify({"message": "Unauthorized"}), 401
     
     # Get filter parameter (default: last year)
-    days = request.args.get('days', 365, type=int)
-    
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT 
-                id::text,
-                name,
-                due_date,
-                priority,
-                completed_at,
-                CASE 
-                    WHEN DATE(completed_at) <= due_date THEN true
-                    ELSE false
-                END as on_time
-            FROM tasks
-            WHERE user_id = %s 
-                AND completed = true
-                AND completed_at IS NOT NULL
-                AND completed_at >= NOW() - (%s::int) * INTERVAL '1 day'
-            ORDER BY completed_at DESC
-            """,
-            (user_id, days)
-        )
-        rows = cur.fetchall()
+    days = _window_days(365, HISTORY_MAX_DAYS)
     
-    tasks = [
-        {
-            "id": r[0],
-            "name": r[1],
-            "dueDate": r[2].isoformat(),
-            "priority": r[3],
-            "completedAt": r[4].isoformat() if r[4] else None,
-            "onTime": r[5]
-        }
-        for r in rows
-    ]
-    
-    return jsonify(tasks)
+    with _read_cursor(user_id) as cur:
+        queries.execute(cur, "completed_tasks", {"user_id": user_id, "days": days})
+        body = cur.fetchone()[0]
+
+    return raw_json_response(body)
+
+
+# ==================== REPORT JOBS ====================
+# Long-window reports run in the background (jobs.py): submit, poll, then download the result.
+
+@app.post("/api/reports")
+def create_report():
+    # Queue a report: {"kind": "cfd" | "history" | "lead_time", "days": 1825}; answers 202 with the job.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get("kind")
+    days = payload.get("days", 365)
+    if kind not in jobs.REPORTS:
+        return jsonify({"message": f"Kind must be one of: {', '.join(sorted(jobs.REPORTS))}."}), 400
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= jobs.REPORT_MAX_DAYS:
+        return jsonify({"message": f"Days must be an integer between 1 and {jobs.REPORT_MAX_DAYS}."}), 400
+
+    job = jobs.submit(user_id, kind, days)
+    if job is None:
+        response = jsonify({"message": "Too many reports in progress. Please wait for one to finish."})
+        response.status_code = 429
+        response.headers["Retry-After"] = "5"
+        return response
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = f"/api/reports/{job['id']}"
+    return response
+
+
+@app.get("/api/reports")
+def list_reports():
+    # The user's most recent report jobs, newest first.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+    return jsonify(jobs.list_jobs(user_id))
+
+
+@app.get("/api/reports/<uuid:job_id>")
+def get_report(job_id):
+    # Status and progress (0-100) of one job.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+    job = jobs.get(user_id, str(job_id))
+    if job is None:
+        return jsonify({"message": "Report not found."}), 404
+    return jsonify(job)
+
+
+@app.get("/api/reports/<uuid:job_id>/result")
+def report_result(job_id):
+    # The finished report's JSON; 409 while it is still queued or running, 410 once it has expired.
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+    found = jobs.result(user_id, str(job_id))
+    if found is None:
+        return jsonify({"message": "Report not found."}), 404
+    status, body = found
+    if status == "expired":
+        return jsonify({"message": "Report has expired. Please submit it again."}), 410
+    if status == "failed":
+        return jsonify({"message": "Report failed. Please submit it again."}), 500
+    if status != "done":
+        return jsonify({"message": "Report is not ready yet.", "status": status}), 409
+    return raw_json_response(body)
+
+
+@app.delete("/api/reports/<uuid:job_id>")
+def cancel_report(job_id):
+    # Cancel a job (or discard a finished one).
+    try:
+        user_id = _require_user_id()
+    except PermissionError:
+        return jsonify({"message": "Unauthorized"}), 401
+    if not jobs.cancel(user_id, str(job_id)):
+        return jsonify({"message": "Report not found."}), 404
+    return "", 204
+
+
+@app.get("/api/metrics")
+def metrics_snapshot():
+    # Per-process counters and timings (compression ratios, CPU time, ...).
+    # Set METRICS_TOKEN to require a matching X-Metrics-Token header.
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("X-Metrics-Token") != token:
+        return jsonify({"message": "Forbidden"}), 403
+    return jsonify({**metrics.snapshot(), "task_cache": task_cache.stats()})
+
+
+@app.get("/api/debug/profile/flamegraph")
+def profile_flamegraph():
+    # Collapsed stacks of this process's profiled requests (see profiling.py), for flamegraph.pl/speedscope.
+    # Requires PROFILE_TOKEN in the X-Profile-Token header.
+    if not profiling.PROFILE_TOKEN or request.headers.get(profiling.PROFILE_HEADER) != profiling.PROFILE_TOKEN:
+        return jsonify({"message": "Forbidden"}), 403
+    return Response(profiling.collapsed_stacks(), mimetype="text/plain")
+
+
+@app.get("/api/health/live")
+def health_live():
+    # Liveness: the process answers HTTP. No dependency checks, so DB trouble never restarts workers.
+    return jsonify(health.liveness())
+
+
+@app.get("/api/health/ready")
+def health_ready():
+    # Readiness: DB round trip (cached briefly), pool queues, schema version and cache/listener state.
+    # 503 tells the load balancer to drain this worker.
+    report, ready = health.readiness()
+    response = jsonify(report)
+    response.status_code = 200 if ready else 503
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.get("/api/test")
 def test_connection():
-    # Health/CORS probe: echoes origin and sets credentials headers if allowed.
-    origin = request.headers.get('Origin')
-    allowed_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173")
-    allowed_origins = [o.strip() for o in allowed_origins_env.split(",") if o.strip()]
-    
-    response = jsonify({"message": "Connection successful", "origin": origin})
-    if origin and origin in allowed_origins:
-        response.headers['Access-Control-Allow-Origin'] = origin
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-    return response
+    # Health/CORS probe: echoes origin; CORS headers come from cors.py like every other route.
+    return jsonify({"message": "Connection successful", "origin": request.headers.get('Origin')})
 
 
 if __name__ == "__main__":
     # Dev server only; use a production WSGI (e.g., gunicorn) for deployment.
+    # There is no separate job process in development, so reports run in-process unless REPORT_WORKERS is set.
+    if "REPORT_WORKERS" not in os.environ:
+        jobs.REPORT_WORKERS = 2
     app.run(debug=True, port=5000)
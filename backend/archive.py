@@ -0,0 +1,160 @@
+# Archival of old completed tasks into the month-partitioned `tasks_archive` table.
+# Rows are moved in small batches (DELETE ... RETURNING feeding an INSERT in one statement), each in its own
+# short transaction, so the hot `tasks` table only holds active and recently completed work.
+#
+#   python archive.py                 # archive everything eligible once, then exit (cron-friendly)
+#   python archive.py --older-than 30 --batch-size 500
+#
+# History and analytics read the `tasks_all` view (tasks UNION ALL tasks_archive), so archiving is invisible
+# to them; partition pruning on completed_at keeps windowed queries on recent partitions. Archived tasks no
+# longer appear in GET /api/tasks and can't be edited or deleted.
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+from db import SHARD_DSNS, db_cursor
+from events import publish_task_event
+
+logger = logging.getLogger(__name__)
+
+# Completed tasks older than this many days are archived
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+# Rows moved per transaction
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# Seconds between background archive passes; 0 disables the in-process archiver
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+# Advisory lock key so only one worker/process archives at a time
+ARCHIVE_LOCK_KEY = 0x7461736B  # "task"
+
+# Columns shared by tasks and tasks_archive, in table order
+COLUMNS = (
+    "id, user_id, name, due_date, priority, completed, actionable_items, "
+    "completion_percent, created_at, completed_at, total_time, actionable_done"
+)
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def ensure_partitions(cur, start: date, end: date) -> None:
+    """Create monthly tasks_archive partitions covering [start, end]."""
+    month = _month_start(start)
+    while month <= end:
+        upper = _next_month(month)
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS tasks_archive_{month:%Y_%m}
+            PARTITION OF tasks_archive FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')
+            """
+        )
+        month = upper
+
+
+def archive_batch(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                  shard: int = 0) -> int:
+    """Move one batch of old completed tasks on one shard into its archive; returns the number of rows moved."""
+    with db_cursor(shard=shard) as cur:
+        # Skip quietly if another process holds the archive lock
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (ARCHIVE_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            return 0
+        # Uses idx_tasks_completed_at to find the range of eligible rows without a full scan
+        cur.execute(
+            """
+            SELECT MIN(completed_at)::date, MAX(completed_at)::date
+            FROM tasks
+            WHERE completed AND completed_at < NOW() - (%s::int) * INTERVAL '1 day'
+            """,
+            (older_than_days,),
+        )
+        oldest, newest = cur.fetchone()
+        if oldest is None:
+            return 0
+        ensure_partitions(cur, oldest, newest)
+        cur.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM tasks
+                WHERE id IN (
+                    SELECT id FROM tasks
+                    WHERE completed AND completed_at < NOW() - (%s::int) * INTERVAL '1 day'
+                    ORDER BY completed_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {COLUMNS}
+            )
+            INSERT INTO tasks_archive ({COLUMNS})
+            SELECT {COLUMNS} FROM moved
+            RETURNING user_id
+            """,
+            (older_than_days, batch_size),
+        )
+        user_ids = [row[0] for row in cur.fetchall()]
+        # Archived tasks leave GET /api/tasks; bump the users' list versions and tell every worker
+        # (task-list caches, SSE clients)
+        cur.execute(
+            "UPDATE task_counters SET list_version = list_version + 1 WHERE user_id = ANY(%s) "
+            "RETURNING user_id, list_version",
+            (list(set(user_ids)),),
+        )
+        for user_id, version in cur.fetchall():
+            publish_task_event(cur, user_id, "archived", None, version=version)
+        return len(user_ids)
+
+
+def archive_all(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE, pause: float = 0.05) -> int:
+    """Archive batches on every shard until nothing eligible remains; returns the total moved."""
+    total = 0
+    for shard in range(len(SHARD_DSNS)):
+        while True:
+            moved = archive_batch(older_than_days, batch_size, shard)
+            total += moved
+            if moved < batch_size:
+                break
+            # Yield between batches so archiving never monopolizes I/O or locks
+            time.sleep(pause)
+    return total
+
+
+_archiver_pid: int | None = None
+
+
+def ensure_background_archiver() -> None:
+    """Start the periodic archiver thread in this process (no-op if disabled or already running)."""
+    global _archiver_pid
+    if ARCHIVE_INTERVAL_SECONDS <= 0 or _archiver_pid == os.getpid():
+        return
+    _archiver_pid = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                moved = archive_all()
+                if moved:
+                    logger.info("Archived %d completed tasks", moved)
+            except Exception:
+                logger.exception("Task archiver pass failed")
+            time.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+    threading.Thread(target=loop, name="task-archiver", daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old completed tasks into tasks_archive.")
+    parser.add_argument("--older-than", type=int, default=ARCHIVE_AFTER_DAYS, help="days since completion")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(f"Archived {archive_all(args.older_than, args.batch_size)} tasks")
@@ -0,0 +1,169 @@
+# Load benchmark: compares the Flask dev server with the gunicorn entry point on the same machine.
+#
+#   python bench.py --compare                 # start both servers, run identical load, print a table
+#   python bench.py --url http://127.0.0.1:5000 --path /api/tasks
+#
+# Each run registers a throwaway user, seeds a few tasks, then hammers one endpoint from N client threads
+# for a fixed duration. When pointing --url at your own server, raise the ADMISSION_* limits there first.
+# Results (requests/s and latency percentiles) are also appended to ../bench_output.txt.
+
+from __future__ import annotations
+
+import argparse
+import http.cookiejar
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+OUTPUT_FILE = BASE_DIR.parent / "bench_output.txt"
+
+
+def _opener():
+    jar = http.cookiejar.CookieJar()
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+
+
+def _call(opener, url: str, method: str = "GET", body: dict | None = None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with opener.open(req, timeout=30) as resp:
+        return resp.status, resp.read()
+
+
+def _login(base_url: str, seed_tasks: int, index: int):
+    # Register a unique user (which also logs in) and seed tasks so list/analytics return real data
+    opener = _opener()
+    username = f"bench_{os.getpid()}_{int(time.time() * 1000)}_{index}"
+    _call(opener, f"{base_url}/api/register", "POST", {"username": username, "password": "benchpass"})
+    due = (date.today() + timedelta(days=7)).isoformat()
+    for i in range(seed_tasks):
+        _call(opener, f"{base_url}/api/tasks", "POST", {
+            "name": f"Bench task {i}",
+            "dueDate": due,
+            "priority": ("P1", "P2", "P3")[i % 3],
+            "actionableItems": ["step one", "step two"],
+        })
+    return opener
+
+
+def run_load(base_url: str, path: str, concurrency: int, duration: float, seed_tasks: int) -> dict:
+    """Drive `path` from `concurrency` threads for `duration` seconds; return throughput and latency stats."""
+    openers = [_login(base_url, seed_tasks, i) for i in range(concurrency)]
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(opener):
+        nonlocal errors
+        local, local_errors = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                _call(opener, f"{base_url}{path}")
+                local.append(time.perf_counter() - start)
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=worker, args=(o,)) for o in openers]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def _wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _call(_opener(), f"{base_url}/api/test")
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def _start_server(kind: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    # Measure server throughput, not the per-user admission limits
+    for name in ("ADMISSION_CRUD_RATE", "ADMISSION_CRUD_BURST", "ADMISSION_ANALYTICS_RATE",
+                 "ADMISSION_ANALYTICS_BURST", "ADMISSION_AUTH_RATE", "ADMISSION_AUTH_BURST"):
+        env.setdefault(name, "1000000")
+    if kind == "dev":
+        cmd = [sys.executable, "-c", f"from app import app; app.run(port={port}, threaded=True)"]
+    else:
+        env["BIND"] = f"127.0.0.1:{port}"
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+    return subprocess.Popen(cmd, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _report(label: str, args, result: dict) -> str:
+    line = (
+        f"{label:<10} path={args.path} c={args.concurrency} t={args.duration:.0f}s "
+        f"rps={result['rps']:.1f} p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+        f"p99={result['p99_ms']:.1f}ms errors={result['errors']}"
+    )
+    print(line)
+    with OUTPUT_FILE.open("a", encoding="utf-8") as handle:
+        handle.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} cpus={os.cpu_count()} {line}\n")
+    return line
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to benchmark (ignored with --compare)")
+    parser.add_argument("--path", default="/api/tasks", help="endpoint to request")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--seed-tasks", type=int, default=50)
+    parser.add_argument("--compare", action="store_true", help="start dev server and gunicorn and benchmark both")
+    args = parser.parse_args()
+
+    if not args.compare:
+        _report("target", args, run_load(args.url, args.path, args.concurrency, args.duration, args.seed_tasks))
+        return
+
+    for kind, port in (("dev", 5101), ("gunicorn", 5102)):
+        proc = _start_server(kind, port)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_ready(base_url)
+            _report(kind, args, run_load(base_url, args.path, args.concurrency, args.duration, args.seed_tasks))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Write coalescing for bursts of PATCHes to the same task (slider drags, checkbox toggles).
+# Field changes for one (user, task) are merged in memory for a short window and written as a single
+# UPDATE. Pending changes stay visible to readers in this process until they are committed.
+# Opt-in and single-process only: the pending changes and their overlay live in one worker's memory, so
+# with several workers a read served by another process misses them. Enable it only with one worker.
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+# Monotonic deadlines for the flush window
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# (user_id, task_id)
+Key = Tuple[int, str]
+
+# Attempts per batch before a failing flush is given up; retries back off from the window (x2 each time)
+MAX_FLUSH_ATTEMPTS = int(os.getenv("TASK_WRITE_COALESCE_ATTEMPTS", "5"))
+
+
+class WriteCoalescer:
+    """
+    Merge per-task field updates and flush each task at most once per window.
+
+    `apply` is called as apply(user_id, task_id, changes) from the flusher thread,
+    where `changes` maps column name -> new value (later submissions win per column).
+    A failed flush is retried up to MAX_FLUSH_ATTEMPTS times; after that the task id is reported
+    by take_failed() so the next request from its user can say so.
+    """
+
+    def __init__(self, window_seconds: float, apply: Callable[[int, str, Dict[str, Any]], None]) -> None:
+        self.window_seconds = window_seconds
+        self._apply = apply
+        self._cond = threading.Condition()
+        # key -> [deadline, changes, failed attempts so far]
+        self._pending: Dict[Key, list] = {}
+        # Changes popped for flushing but not yet committed; still overlaid on reads
+        self._inflight: Dict[Key, Dict[str, Any]] = {}
+        # user_id -> task ids whose changes were given up after MAX_FLUSH_ATTEMPTS
+        self._failed: Dict[int, set] = {}
+        self._thread: threading.Thread | None = None
+        atexit.register(self.close)
+
+    def submit(self, user_id: int, task_id: str, changes: Dict[str, Any]) -> None:
+        key = (user_id, task_id)
+        with self._cond:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [time.monotonic() + self.window_seconds, dict(changes), 0]
+                metrics.incr("coalesce.batches")
+            else:
+                entry[1].update(changes)
+                metrics.incr("coalesce.merged")
+            self._ensure_thread()
+            self._cond.notify()
+
+    def pending_for(self, user_id: int) -> Dict[str, Dict[str, Any]]:
+        """Uncommitted changes for a user's tasks (task_id -> changes), for read-your-writes overlays."""
+        with self._cond:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (uid, task_id), changes in self._inflight.items():
+                if uid == user_id:
+                    result[task_id] = dict(changes)
+            for (uid, task_id), (_, changes, _) in self._pending.items():
+                if uid == user_id:
+                    result.setdefault(task_id, {}).update(changes)
+            return result
+
+    def discard(self, user_id: int, task_id: str) -> None:
+        """Drop pending changes for a task (e.g. it is being deleted)."""
+        with self._cond:
+            self._pending.pop((user_id, task_id), None)
+            self._failed.get(user_id, set()).discard(task_id)
+
+    def take_failed(self, user_id: int) -> list[str]:
+        """Task ids whose coalesced changes for `user_id` could not be written; each is reported once."""
+        with self._cond:
+            return sorted(self._failed.pop(user_id, ()))
+
+    def flush_all(self, user_id: int | None = None) -> None:
+        """
+        Write pending changes now (only `user_id`'s if given); called on shutdown and before bulk and item
+        writes. Raises the first flush error after putting the failed changes back in the queue.
+        """
+        with self._cond:
+            due = [(key, entry) for key, entry in self._pending.items() if user_id is None or key[0] == user_id]
+            for key, (_, changes, _) in due:
+                del self._pending[key]
+                self._inflight[key] = changes
+        error = None
+        for key, (_, changes, attempts) in due:
+            exc = self._flush(key, changes, attempts)
+            error = error or exc
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        """Flush everything on shutdown; failures are logged by the flush, not raised."""
+        try:
+            self.flush_all()
+        except Exception:
+            pass
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                next_deadline = min(entry[0] for entry in self._pending.values())
+                if next_deadline > now:
+                    self._cond.wait(next_deadline - now)
+                    continue
+                due = [(key, entry[1], entry[2]) for key, entry in self._pending.items() if entry[0] <= now]
+                for key, changes, _ in due:
+                    del self._pending[key]
+                    self._inflight[key] = changes
+            for key, changes, attempts in due:
+                self._flush(key, changes, attempts)
+
+    def _flush(self, key: Key, changes: Dict[str, Any], attempts: int) -> Exception | None:
+        # Write one batch; on failure requeue it with backoff (newer changes win) or give up. Returns the error.
+        user_id, task_id = key
+        try:
+            with metrics.timed("coalesce.flush"):
+                self._apply(user_id, task_id, changes)
+            error = None
+        except Exception as exc:
+            error = exc
+        with self._cond:
+            if self._inflight.get(key) is changes:
+                del self._inflight[key]
+            if error is None:
+                return None
+            attempts += 1
+            if attempts >= MAX_FLUSH_ATTEMPTS:
+                logger.error("Coalesced write for task %s failed %d times; dropping it", task_id, attempts, exc_info=error)
+                metrics.incr("coalesce.dropped")
+                self._failed.setdefault(user_id, set()).add(task_id)
+                return error
+            logger.warning("Coalesced write for task %s failed; retrying", task_id, exc_info=error)
+            metrics.incr("coalesce.retried")
+            entry = self._pending.get(key)
+            if entry is None:
+                deadline = time.monotonic() + self.window_seconds * 2 ** attempts
+                self._pending[key] = [deadline, changes, attempts]
+            else:
+                entry[1] = {**changes, **entry[1]}
+                entry[2] = max(entry[2], attempts)
+            self._ensure_thread()
+            self._cond.notify()
+        return error
@@ -0,0 +1,155 @@
+# Response compression negotiated from Accept-Encoding (zstd, br, gzip) for JSON and event-stream bodies.
+# brotli and zstandard are optional; encodings whose library is not installed are simply never offered.
+
+from __future__ import annotations
+
+# gzip via zlib (always available)
+import zlib
+import os
+# CPU time spent compressing, per encoding
+import time
+from typing import Callable, Dict, Iterable
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it the encoding is just not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # in requirements.txt; without it the encoding is just not offered
+    zstandard = None
+
+# Bodies smaller than this are sent as-is; headers and CPU outweigh the savings
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Content types worth compressing
+COMPRESSIBLE_TYPES = {"application/json", "text/event-stream", "text/plain", "text/csv"}
+# Server preference when the client accepts several encodings with equal q-values
+PREFERENCE = ("zstd", "br", "gzip")
+
+
+# Incremental compressors: each returns (compress(chunk) -> bytes, flush() -> bytes, finish() -> bytes)
+def _gzip_compressor():
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def _brotli_compressor():
+    c = brotli.Compressor(quality=5)
+    return c.process, c.flush, c.finish
+
+
+def _zstd_compressor():
+    c = zstandard.ZstdCompressor(level=3).compressobj()
+    return (
+        c.compress,
+        lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH),
+    )
+
+
+_FACTORIES: Dict[str, Callable] = {"gzip": _gzip_compressor}
+if brotli is not None:
+    _FACTORIES["br"] = _brotli_compressor
+if zstandard is not None:
+    _FACTORIES["zstd"] = _zstd_compressor
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick the best supported encoding from an Accept-Encoding header, honouring q-values."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    best, best_q = None, 0.0
+    for encoding in PREFERENCE:
+        if encoding not in _FACTORIES:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _record(encoding: str, raw: int, compressed: int, cpu: float) -> None:
+    metrics.incr(f"compression.{encoding}.responses")
+    metrics.incr(f"compression.{encoding}.bytes_in", raw)
+    metrics.incr(f"compression.{encoding}.bytes_out", compressed)
+    metrics.observe(f"compression.{encoding}.cpu_seconds", cpu)
+
+
+def compress_bytes(encoding: str, body: bytes) -> bytes:
+    compress, _, finish = _FACTORIES[encoding]()
+    start = time.process_time()
+    out = compress(body) + finish()
+    _record(encoding, len(body), len(out), time.process_time() - start)
+    return out
+
+
+def compress_stream(encoding: str, chunks: Iterable[bytes]):
+    """Compress a generator body chunk by chunk, flushing after each so streamed events aren't held back."""
+    compress, flush, finish = _FACTORIES[encoding]()
+    raw = compressed = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            start = time.process_time()
+            out = compress(chunk) + flush()
+            cpu += time.process_time() - start
+            raw += len(chunk)
+            compressed += len(out)
+            if out:
+                yield out
+        out = finish()
+        compressed += len(out)
+        if out:
+            yield out
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        _record(encoding, raw, compressed, cpu)
+
+
+def init_app(app) -> None:
+    """Register an after_request hook that compresses eligible responses."""
+
+    @app.after_request
+    def _compress_response(response):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        if "Content-Encoding" in response.headers or response.direct_passthrough:
+            return response
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(encoding, response.response)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < MIN_SIZE:
+                return response
+            response.set_data(compress_bytes(encoding, body))
+        response.headers["Content-Encoding"] = encoding
+        return response
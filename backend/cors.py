@@ -0,0 +1,62 @@
+# CORS for the /api routes: one after_request hook adds the headers, and preflights are answered in a
+# before_request hook without reaching routing, admission control or the handlers.
+# Allowed origins are parsed once at startup (CORS_ORIGINS, comma-separated); Access-Control-Max-Age lets
+# browsers cache each preflight instead of repeating OPTIONS before every non-simple request.
+
+from __future__ import annotations
+
+import os
+
+from flask import request
+
+# Parsed once; membership checks are a set lookup per request
+ALLOWED_ORIGINS = frozenset(
+    o.strip()
+    for o in os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if o.strip()
+)
+# Seconds browsers may cache a preflight result (Chromium caps this at 7200, Firefox at 86400)
+MAX_AGE = os.getenv("CORS_MAX_AGE", "86400")
+ALLOW_METHODS = "GET, POST, PUT, PATCH, DELETE, OPTIONS"
+# Response headers the frontend may read
+EXPOSE_HEADERS = "Retry-After, traceparent, X-List-Version"
+PATH_PREFIX = "/api/"
+
+
+def _allowed_origin() -> str | None:
+    origin = request.headers.get("Origin")
+    if origin in ALLOWED_ORIGINS and request.path.startswith(PATH_PREFIX):
+        return origin
+    return None
+
+
+def init_app(app) -> None:
+    """Register the preflight short-circuit (first before_request hook) and the CORS response headers."""
+
+    @app.before_request
+    def _preflight():
+        if request.method != "OPTIONS" or "Access-Control-Request-Method" not in request.headers:
+            return None
+        response = app.response_class(status=204)
+        origin = _allowed_origin()
+        response.vary.add("Origin")
+        if origin is not None:
+            response.headers["Access-Control-Allow-Methods"] = ALLOW_METHODS
+            requested = request.headers.get("Access-Control-Request-Headers")
+            if requested:
+                response.headers["Access-Control-Allow-Headers"] = requested
+                response.vary.add("Access-Control-Request-Headers")
+            response.headers["Access-Control-Max-Age"] = MAX_AGE
+        return response
+
+    @app.after_request
+    def _cors_headers(response):
+        origin = _allowed_origin()
+        if origin is not None:
+            response.headers["Access-Control-Allow-Origin"] = origin
+            response.headers["Access-Control-Allow-Credentials"] = "true"
+            if request.method != "OPTIONS":
+                response.headers["Access-Control-Expose-Headers"] = EXPOSE_HEADERS
+        if request.path.startswith(PATH_PREFIX):
+            response.vary.add("Origin")
+        return response
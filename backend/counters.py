@@ -0,0 +1,259 @@
+# Per-user task counters maintained by triggers on tasks/tasks_archive, plus a consistency check job.
+#
+#   python counters.py            # recompute every user's counters from scratch and report drift
+#   python counters.py --repair   # ...and overwrite drifted rows with the recomputed values
+#
+# task_counters holds open / completed-by-priority totals per user; task_due_counters holds open tasks per
+# (user, due_date), so "overdue" and "due today" are index range reads over a handful of rows.
+# task_counters also holds each user's list version, which task writes bump themselves (queries.py).
+
+from __future__ import annotations
+
+import argparse
+
+from db import SHARD_DSNS, db_cursor
+
+# Counter columns, in the order used by every query below
+COUNTER_COLUMNS = ("open_count", "completed_p1", "completed_p2", "completed_p3")
+
+# Ground truth recomputed from live and archived tasks
+EXPECTED_COUNTERS_SQL = """
+SELECT
+    user_id,
+    COUNT(*) FILTER (WHERE NOT completed) AS open_count,
+    COUNT(*) FILTER (WHERE completed AND priority = 'P1') AS completed_p1,
+    COUNT(*) FILTER (WHERE completed AND priority = 'P2') AS completed_p2,
+    COUNT(*) FILTER (WHERE completed AND priority = 'P3') AS completed_p3
+FROM tasks_all
+GROUP BY user_id
+"""
+
+EXPECTED_DUE_COUNTERS_SQL = """
+SELECT user_id, due_date, COUNT(*) AS open_count
+FROM tasks
+WHERE NOT completed
+GROUP BY user_id, due_date
+"""
+
+# Counts for one user; parameters: user_id, today.
+USER_COUNTS_SQL = """
+SELECT
+    COALESCE(c.open_count, 0),
+    COALESCE(c.completed_p1, 0),
+    COALESCE(c.completed_p2, 0),
+    COALESCE(c.completed_p3, 0),
+    (SELECT COALESCE(SUM(open_count), 0) FROM task_due_counters
+        WHERE user_id = %(user_id)s AND due_date < %(today)s),
+    (SELECT COALESCE(SUM(open_count), 0) FROM task_due_counters
+        WHERE user_id = %(user_id)s AND due_date = %(today)s)
+FROM (SELECT 1) AS one
+LEFT JOIN task_counters c ON c.user_id = %(user_id)s
+"""
+
+
+# On-time completion streak kept on task_counters (streak_days, streak_last_day) so reads are one row.
+# task_streak_refresh() recounts it exactly by walking back from the latest on-time day, one index probe per
+# day of the run (the rules are in analytics.py). task_streak_apply() keeps it current from row triggers:
+# a new latest on-time day extends or restarts the run in O(1), and changes older than the run's earliest
+# possible start (2 days back per counted day) can't touch it; only a change inside the run (an on-time task
+# uncompleted, deleted or completed late) pays for the recount.
+STREAK_DDL = """
+ALTER TABLE task_counters ADD COLUMN IF NOT EXISTS streak_days INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE task_counters ADD COLUMN IF NOT EXISTS streak_last_day DATE NULL;
+
+CREATE OR REPLACE FUNCTION task_streak_refresh(p_user INTEGER) RETURNS void AS $$
+    WITH RECURSIVE streak(d) AS (
+        (
+            SELECT DATE(completed_at)
+            FROM tasks_all
+            WHERE user_id = p_user AND completed = true AND DATE(completed_at) <= due_date
+            ORDER BY completed_at DESC
+            LIMIT 1
+        )
+        UNION ALL
+        SELECT (
+            SELECT MAX(DATE(t.completed_at))
+            FROM tasks_all t
+            WHERE t.user_id = p_user
+                AND t.completed = true
+                AND t.completed_at >= s.d - 2
+                AND t.completed_at < s.d
+                AND DATE(t.completed_at) <= t.due_date
+        )
+        FROM streak s
+        WHERE s.d IS NOT NULL
+    )
+    UPDATE task_counters
+    SET streak_days = (SELECT COUNT(d) FROM streak), streak_last_day = (SELECT MAX(d) FROM streak)
+    WHERE user_id = p_user;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION task_streak_apply() RETURNS trigger AS $$
+DECLARE
+    uid INTEGER;
+    old_day DATE;
+    new_day DATE;
+    run_days INTEGER;
+    last_day DATE;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.completed AND DATE(OLD.completed_at) <= OLD.due_date THEN
+        old_day := DATE(OLD.completed_at);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.completed AND DATE(NEW.completed_at) <= NEW.due_date THEN
+        new_day := DATE(NEW.completed_at);
+    END IF;
+    IF old_day IS NOT DISTINCT FROM new_day THEN
+        RETURN NULL;
+    END IF;
+    uid := CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END;
+    SELECT c.streak_days, c.streak_last_day INTO run_days, last_day
+    FROM task_counters c WHERE c.user_id = uid FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    IF last_day IS NOT NULL
+        AND (old_day IS NULL OR old_day < last_day - 2 * run_days)
+        AND (new_day IS NULL OR new_day >= last_day OR new_day < last_day - 2 * run_days)
+    THEN
+        IF new_day > last_day THEN
+            UPDATE task_counters SET
+                streak_days = CASE WHEN new_day - last_day <= 2 THEN run_days + 1 ELSE 1 END,
+                streak_last_day = new_day
+            WHERE user_id = uid;
+        END IF;
+        RETURN NULL;
+    END IF;
+    PERFORM task_streak_refresh(uid);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_streak_insert_delete ON tasks;
+CREATE TRIGGER tasks_streak_insert_delete
+    AFTER INSERT OR DELETE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION task_streak_apply();
+DROP TRIGGER IF EXISTS tasks_streak_update ON tasks;
+CREATE TRIGGER tasks_streak_update
+    AFTER UPDATE OF completed, completed_at, due_date ON tasks
+    FOR EACH ROW
+    WHEN (OLD.completed IS DISTINCT FROM NEW.completed
+          OR OLD.completed_at IS DISTINCT FROM NEW.completed_at
+          OR OLD.due_date IS DISTINCT FROM NEW.due_date)
+    EXECUTE FUNCTION task_streak_apply();
+DROP TRIGGER IF EXISTS tasks_archive_streak ON tasks_archive;
+CREATE TRIGGER tasks_archive_streak
+    AFTER INSERT OR DELETE ON tasks_archive
+    FOR EACH ROW EXECUTE FUNCTION task_streak_apply();
+"""
+
+
+def counts_payload(row) -> dict:
+    open_count, p1, p2, p3, overdue, due_today = row
+    return {
+        "open": open_count,
+        "overdue": int(overdue),
+        "dueToday": int(due_today),
+        "completed": {"P1": p1, "P2": p2, "P3": p3},
+        "completedTotal": p1 + p2 + p3,
+    }
+
+
+def seed_counters(cur) -> None:
+    """Fill empty counter tables from existing tasks (run in the same transaction that creates the triggers)."""
+    cur.execute("SELECT EXISTS (SELECT 1 FROM task_counters)")
+    if cur.fetchone()[0]:
+        return
+    cur.execute(
+        f"INSERT INTO task_counters (user_id, {', '.join(COUNTER_COLUMNS)}) {EXPECTED_COUNTERS_SQL}"
+    )
+    cur.execute(
+        f"INSERT INTO task_due_counters (user_id, due_date, open_count) {EXPECTED_DUE_COUNTERS_SQL}"
+    )
+
+
+def ensure_streak_counters(cur) -> None:
+    """Create the streak columns, functions and triggers; recount every user's streak when the columns are new."""
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM information_schema.columns"
+        " WHERE table_name = 'task_counters' AND column_name = 'streak_days')"
+    )
+    existed = cur.fetchone()[0]
+    cur.execute(STREAK_DDL)
+    if not existed:
+        cur.execute("SELECT task_streak_refresh(user_id) FROM task_counters")
+
+
+def check_counters(repair: bool = False) -> list[dict]:
+    """
+    Recompute all counters and compare with the trigger-maintained tables.
+
+    Returns one entry per drifted (user, counter) or (user, due_date); with repair=True each shard's
+    stored values are replaced inside a transaction that locks both counter tables against writers.
+    """
+    drift: list[dict] = []
+    for shard in range(len(SHARD_DSNS)):
+        with db_cursor(shard=shard) as cur:
+            _check_shard(cur, repair, drift)
+    return drift
+
+
+def _check_shard(cur, repair: bool, drift: list[dict]) -> None:
+    found_before = len(drift)
+    if repair:
+        # Block task writes (their triggers) so the recompute and the fix see the same state
+        cur.execute("LOCK TABLE task_counters, task_due_counters IN EXCLUSIVE MODE")
+    cols = ", ".join(COUNTER_COLUMNS)
+    cur.execute(
+        f"""
+        WITH expected AS ({EXPECTED_COUNTERS_SQL})
+        SELECT COALESCE(e.user_id, s.user_id),
+               {', '.join(f'COALESCE(e.{c}, 0)' for c in COUNTER_COLUMNS)},
+               {', '.join(f'COALESCE(s.{c}, 0)' for c in COUNTER_COLUMNS)}
+        FROM expected e
+        FULL JOIN task_counters s ON s.user_id = e.user_id
+        WHERE ({', '.join(f'COALESCE(e.{c}, 0)' for c in COUNTER_COLUMNS)})
+           IS DISTINCT FROM ({', '.join(f'COALESCE(s.{c}, 0)' for c in COUNTER_COLUMNS)})
+        """
+    )
+    n = len(COUNTER_COLUMNS)
+    for row in cur.fetchall():
+        user_id, expected, stored = row[0], row[1:1 + n], row[1 + n:]
+        for name, want, have in zip(COUNTER_COLUMNS, expected, stored):
+            if want != have:
+                drift.append({"user_id": user_id, "counter": name, "expected": want, "stored": have})
+
+    cur.execute(
+        f"""
+        WITH expected AS ({EXPECTED_DUE_COUNTERS_SQL})
+        SELECT COALESCE(e.user_id, s.user_id), COALESCE(e.due_date, s.due_date),
+               COALESCE(e.open_count, 0), COALESCE(s.open_count, 0)
+        FROM expected e
+        FULL JOIN task_due_counters s ON s.user_id = e.user_id AND s.due_date = e.due_date
+        WHERE COALESCE(e.open_count, 0) <> COALESCE(s.open_count, 0)
+        """
+    )
+    for user_id, due_date, want, have in cur.fetchall():
+        drift.append({"user_id": user_id, "counter": f"open_due_{due_date}", "expected": want, "stored": have})
+
+    if repair and len(drift) > found_before:
+        # Counts are replaced; list versions (bumped by task writes, not derived from tasks) are kept
+        cur.execute(f"UPDATE task_counters SET {', '.join(f'{c} = 0' for c in COUNTER_COLUMNS)}")
+        cur.execute(
+            f"INSERT INTO task_counters AS s (user_id, {cols}) {EXPECTED_COUNTERS_SQL} "
+            f"ON CONFLICT (user_id) DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in COUNTER_COLUMNS)}"
+        )
+        cur.execute("DELETE FROM task_due_counters")
+        cur.execute(f"INSERT INTO task_due_counters (user_id, due_date, open_count) {EXPECTED_DUE_COUNTERS_SQL}")
+        # Rows inserted above start without a streak
+        cur.execute("SELECT task_streak_refresh(user_id) FROM task_counters")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify trigger-maintained task counters against a full recount.")
+    parser.add_argument("--repair", action="store_true", help="overwrite drifted counters with recomputed values")
+    args = parser.parse_args()
+    found = check_counters(repair=args.repair)
+    for entry in found:
+        print(f"user={entry['user_id']} {entry['counter']}: expected={entry['expected']} stored={entry['stored']}")
+    print(f"{len(found)} drifted counter(s){' repaired' if args.repair and found else ''}")
+    raise SystemExit(1 if found and not args.repair else 0)
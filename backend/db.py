@@ -2,11 +2,22 @@
 from __future__ import annotations
 
 import os
+import itertools
+import select
+import socket
+import threading
+import time
 from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 
 import psycopg
 from dotenv import dotenv_values
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
+
+import metrics
+import tracing
 
 
 # --- Locate backend/.env regardless of where Python is run from ---
@@ -46,22 +57,373 @@ def _get_db_dsn() -> str:
     return dsn
 
 
+def _config(name: str, default: str) -> str:
+    return CONFIG.get(name) or os.getenv(name, default)
+
+
+# Connection pool sizing (per worker process)
+POOL_MIN_SIZE = int(_config("PGPOOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(_config("PGPOOL_MAX_SIZE", "10"))
+# Seconds to wait for a free pooled connection before failing the request
+POOL_TIMEOUT = float(_config("PGPOOL_TIMEOUT", "10"))
+
+# Shards (see shards.py): shard 0 is the primary above and also holds the user directory; PGSHARD_DSNS
+# (';'-separated) adds shards 1..N-1. An entry without '=' is a database name on the primary's server,
+# e.g. PGSHARD_DSNS="todoapp_shard1;todoapp_shard2" for local testing. The order must never change.
+SHARD_DSNS = [_get_db_dsn()] + [
+    d if "=" in d else make_conninfo(_get_db_dsn(), dbname=d)
+    for d in (part.strip() for part in _config("PGSHARD_DSNS", "").split(";"))
+    if d
+]
+
+# Read replicas of shard 0: ';'-separated libpq DSNs (e.g. "host=localhost port=5433 dbname=todoapp user=postgres")
+REPLICA_DSNS = [d.strip() for d in _config("PGREPLICA_DSNS", "").split(";") if d.strip()]
+# Replicas lagging more than this are skipped in favour of the primary
+REPLICA_MAX_LAG_SECONDS = float(_config("PGREPLICA_MAX_LAG_SECONDS", "5"))
+# How long a measured replica lag is trusted before it is re-checked
+REPLICA_LAG_CHECK_SECONDS = float(_config("PGREPLICA_LAG_CHECK_SECONDS", "2"))
+# After a session writes, its reads stay on the primary for this long (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(_config("PGREPLICA_READ_YOUR_WRITES_SECONDS", str(REPLICA_MAX_LAG_SECONDS)))
+
+# Statement budgets (ms) per endpoint class. Every class shares its shard's single pool; the budget is
+# applied per transaction with SET LOCAL, so it ends at commit/rollback and never leaks to the next
+# borrower, and a worker holds at most POOL_MAX_SIZE connections per database.
+STATEMENT_TIMEOUTS_MS = {
+    "crud": int(_config("PG_TIMEOUT_CRUD_MS", "2000")),
+    "analytics": int(_config("PG_TIMEOUT_ANALYTICS_MS", "10000")),
+    "export": int(_config("PG_TIMEOUT_EXPORT_MS", "60000")),
+}
+# Version of the schema init_schema() creates; bump it with every schema change. Recorded in the
+# schema_version table so readiness checks can tell a worker whose code is ahead of the database.
+SCHEMA_VERSION = 5
+
+# How often in-flight queries check whether their HTTP client has gone away
+DISCONNECT_POLL_SECONDS = float(_config("PG_DISCONNECT_POLL_SECONDS", "0.25"))
+
+# Budget class of the current request (set by timeouts.py); None = server default (CLIs, background jobs)
+statement_class: ContextVar[str | None] = ContextVar("statement_class", default=None)
+# Client socket of the current request; queries are cancelled when it closes mid-flight
+client_socket: ContextVar[socket.socket | None] = ContextVar("client_socket", default=None)
+
+# dsn -> pool
+_pools: dict[str, ConnectionPool] = {}
+_pools_pid: int | None = None
+_pools_lock = threading.Lock()
+# dsn -> (checked_at monotonic, lag seconds or None when unreachable)
+_replica_lag: dict[str, tuple[float, float | None]] = {}
+_replica_cycle = itertools.count()
+
+
+def _get_pool(dsn: str, name: str) -> ConnectionPool:
+    """
+    Return the process-local pool for `dsn`, creating it on first use.
+
+    Pools are opened lazily and discarded (without closing the inherited sockets)
+    when the process id changes, so a forked worker never shares connections with its parent.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _replica_lag.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(
+                dsn,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                name=name,
+                open=True,
+            )
+            _pools[dsn] = pool
+        return pool
+
+
+def close_pools() -> None:
+    """
+    Close every pool owned by this process.
+
+    Called after import-time startup work so a preloading WSGI master forks
+    without open connections; pools reopen lazily on first use in each worker.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid == os.getpid():
+            for pool in _pools.values():
+                pool.close()
+        _pools.clear()
+        _replica_lag.clear()
+        _pools_pid = None
+
+
+def reset_after_fork() -> None:
+    """Forget pools inherited from a parent process without closing their (shared) sockets."""
+    global _pools_pid, _pools_lock
+    _pools_lock = threading.Lock()
+    _pools.clear()
+    _replica_lag.clear()
+    _pools_pid = None
+
+
+class _DisconnectWatcher:
+    """
+    One background thread per process that cancels in-flight queries whose HTTP client disconnected.
+
+    Requests register (connection, client socket) for the duration of their transaction; every
+    DISCONNECT_POLL_SECONDS the thread peeks at each socket and sends a server-side cancel when the
+    peer has closed it, so an abandoned request stops holding a connection and a backend.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._watched: dict[int, tuple[psycopg.Connection, socket.socket, dict]] = {}
+        self._pid: int | None = None
+
+    @staticmethod
+    def _peer_closed(sock: socket.socket) -> bool:
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except BlockingIOError:
+            return False
+        except (OSError, ValueError):
+            return True
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(DISCONNECT_POLL_SECONDS)
+            with self._lock:
+                watched = list(self._watched.values())
+            for conn, sock, state in watched:
+                if not state["cancelled"] and self._peer_closed(sock):
+                    state["cancelled"] = True
+                    try:
+                        conn.cancel_safe()
+                    except Exception:
+                        pass
+
+    @contextmanager
+    def watch(self, conn: psycopg.Connection):
+        sock = client_socket.get()
+        if sock is None:
+            yield None
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._watched.clear()
+                threading.Thread(target=self._run, name="db-disconnect-watcher", daemon=True).start()
+            state = {"cancelled": False}
+            self._watched[id(conn)] = (conn, sock, state)
+        try:
+            yield state
+        finally:
+            with self._lock:
+                self._watched.pop(id(conn), None)
+
+
+_disconnect_watcher = _DisconnectWatcher()
+
+
+class ClientDisconnected(psycopg.errors.QueryCanceled):
+    """The query was cancelled because the HTTP client went away."""
+
+
+def _apply_budget(conn: psycopg.Connection, budget_class: str | None) -> None:
+    # Opens the transaction with the class's statement budget; SET LOCAL lapses when it ends.
+    if budget_class is not None:
+        conn.execute(f"SET LOCAL statement_timeout = {int(STATEMENT_TIMEOUTS_MS[budget_class])}")
+
+
 @contextmanager
-def db_cursor():
+def _budgeted(conn: psycopg.Connection, budget_class: str | None):
+    # Applies the budget, counts statement-timeout / disconnect cancellations per class and tells them
+    # apart for callers.
+    _apply_budget(conn, budget_class)
+    with _disconnect_watcher.watch(conn) as watch:
+        try:
+            yield
+        except psycopg.errors.QueryCanceled as exc:
+            if watch is not None and watch["cancelled"]:
+                metrics.incr(f"db.cancelled.client_disconnect.{budget_class}")
+                raise ClientDisconnected(str(exc)) from exc
+            metrics.incr(f"db.cancelled.statement_timeout.{budget_class}")
+            raise
+
+
+def _pool_name(shard: int) -> str:
+    return "primary" if shard == 0 else f"shard{shard}"
+
+
+def _user_shard(user_id: int, writing: bool) -> int:
+    # Imported here because shards.py itself imports db
+    from shards import shard_for
+
+    return shard_for(user_id, writing=writing)
+
+
+@contextmanager
+def db_cursor(user_id: int | None = None, shard: int | None = None, writing: bool = True):
     """
     Context manager for database operations with automatic connection management and commit.
+    Connections come from the pool of `user_id`'s shard (or of `shard`; shard 0 when neither is given);
+    the transaction commits on success and rolls back on error. Raises shards.UserMoving while the user
+    is being moved to another shard, unless writing=False (read-only work on the user's current shard).
+    Inside a request the transaction runs under the request's statement budget class (see timeouts.py).
     """
-    dsn = _get_db_dsn()
-    with psycopg.connect(dsn) as conn:
-        with conn.cursor() as cur:
+    if shard is None:
+        shard = 0 if user_id is None else _user_shard(user_id, writing=writing)
+    budget_class = statement_class.get()
+    with tracing.span("db.transaction", **{"db.role": "primary", "db.shard": shard}):
+        acquire = tracing.start_span("db.acquire")
+        with _get_pool(SHARD_DSNS[shard], _pool_name(shard)).connection() as conn:
+            acquire.end()
+            with _budgeted(conn, budget_class), conn.cursor() as cur:
+                yield tracing.traced_cursor(cur)
+                with tracing.span("db.commit"):
+                    conn.commit()
+
+
+def _measure_replica_lag(dsn: str) -> float | None:
+    # Replay lag in seconds (0 when fully caught up); None if the replica can't be reached.
+    try:
+        with _get_pool(dsn, "replica").connection(timeout=1) as conn:
+            row = conn.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            ).fetchone()
+        return float(row[0])
+    except Exception:
+        return None
+
+
+def _replica_lag_seconds(dsn: str) -> float | None:
+    now = time.monotonic()
+    cached = _replica_lag.get(dsn)
+    if cached is not None and now - cached[0] < REPLICA_LAG_CHECK_SECONDS:
+        return cached[1]
+    lag = _measure_replica_lag(dsn)
+    _replica_lag[dsn] = (now, lag)
+    return lag
+
+
+def _pick_replica(fresh_since: float | None) -> str | None:
+    # Choose a healthy replica round-robin, or None to use the primary.
+    if not REPLICA_DSNS:
+        return None
+    if fresh_since is not None and time.time() - fresh_since < READ_YOUR_WRITES_SECONDS:
+        return None
+    start = next(_replica_cycle)
+    for i in range(len(REPLICA_DSNS)):
+        dsn = REPLICA_DSNS[(start + i) % len(REPLICA_DSNS)]
+        lag = _replica_lag_seconds(dsn)
+        if lag is not None and lag <= REPLICA_MAX_LAG_SECONDS:
+            return dsn
+    return None
+
+
+@contextmanager
+def db_read_cursor(fresh_since: float | None = None, user_id: int | None = None):
+    """
+    Read-only variant of db_cursor() routed to a read replica when one is healthy.
+
+    `fresh_since` is the wall-clock time of the caller's last write; reads within
+    READ_YOUR_WRITES_SECONDS of it go to the primary so the caller sees its own changes.
+    Falls back to the primary when no replicas are configured, reachable, or caught up.
+    Reads of users on other shards go to that shard's primary (replicas are configured for shard 0 only)
+    and keep working while the user is being moved.
+    """
+    shard = 0 if user_id is None else _user_shard(user_id, writing=False)
+    dsn = _pick_replica(fresh_since) if shard == 0 else None
+    if dsn is None:
+        with db_cursor(shard=shard) as cur:
             yield cur
-            conn.commit()
+        return
+    budget_class = statement_class.get()
+    with tracing.span("db.transaction", **{"db.role": "replica"}):
+        acquire = tracing.start_span("db.acquire")
+        with _get_pool(dsn, "replica").connection() as conn:
+            acquire.end()
+            conn.read_only = True
+            with _budgeted(conn, budget_class), conn.cursor() as cur:
+                yield tracing.traced_cursor(cur)
+                with tracing.span("db.commit"):
+                    conn.commit()
+
+
+def pool_stats() -> dict[str, dict]:
+    """Size, idle connections and waiting requests of each of this process's pools, keyed by pool name."""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        pools = list(_pools.values())
+    stats = {}
+    for pool in pools:
+        raw = pool.get_stats()
+        size, idle = raw.get("pool_size", 0), raw.get("pool_available", 0)
+        stats[pool.name] = {
+            "size": size,
+            "max": raw.get("pool_max", pool.max_size),
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": raw.get("requests_waiting", 0),
+            "utilization": round((size - idle) / pool.max_size, 3),
+        }
+    return stats
+
+
+def probe_shard(shard: int, timeout: float) -> tuple[float, int | None]:
+    """
+    Round trip to a shard's primary through the pool request traffic uses, under the crud budget.
+
+    Returns (seconds, recorded schema version). Raises if no connection frees up within
+    `timeout` (pool exhausted) or the query fails or exceeds the crud statement budget.
+    """
+    started = time.perf_counter()
+    with _get_pool(SHARD_DSNS[shard], _pool_name(shard)).connection(timeout=timeout) as conn:
+        _apply_budget(conn, "crud")
+        version = conn.execute("SELECT max(version) FROM schema_version").fetchone()[0]
+    return time.perf_counter() - started, version
 
 
 def init_schema() -> None:
     """
-    Creates database tables if they don't exist and adds any missing columns to existing tables.
+    Creates database tables if they don't exist and adds any missing columns to existing tables,
+    on every shard, plus the user directory on shard 0.
     """
+    for shard in range(len(SHARD_DSNS)):
+        _init_shard_schema(shard)
+    _init_directory()
+
+
+def _init_directory() -> None:
+    # User directory (shards.py): every user's id, username and shard. Ids come from shard 0's
+    # users_id_seq so they are unique across shards. Users created before the directory are backfilled.
+    with db_cursor(shard=0) as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_directory (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                shard SMALLINT NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'active' CHECK (state IN ('active', 'moving')),
+                moved_at TIMESTAMPTZ NULL
+            );
+            INSERT INTO user_directory (user_id, username)
+            SELECT id, username FROM users
+            ON CONFLICT DO NOTHING;
+            """
+        )
+
+
+def _init_shard_schema(shard: int) -> None:
 
     # SQL to create users table with authentication fields
     create_users = (
@@ -93,7 +455,7 @@ def init_schema() -> None:
         """
     )
 
-    with db_cursor() as cur:
+    with db_cursor(shard=shard) as cur:
         # Create base tables
         cur.execute(create_users)
         cur.execute(create_tasks)
@@ -157,4 +519,226 @@ def init_schema() -> None:
             """
         )
 
+        # Checked state of each actionable item, aligned by index with actionable_items
+        cur.execute(
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'tasks' AND column_name = 'actionable_done'
+                ) THEN
+                    ALTER TABLE tasks ADD COLUMN actionable_done JSONB NOT NULL DEFAULT '[]';
+                END IF;
+            END$$;
+            """
+        )
+
+        # Completed-task lookups (streak, summary, history) scan only completed rows by time
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_user_completed_at ON tasks (user_id, completed_at) WHERE completed"
+        )
 
+        # Global, increasing ids for task change events (SSE Last-Event-ID resume)
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS task_event_seq")
+        # Event ids are time-ordered across shards: milliseconds since the epoch, then the shard (8 bits),
+        # then a per-shard counter (12 bits). SSE resume (Last-Event-ID) compares ids from any shard.
+        cur.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION next_task_event_id() RETURNS bigint AS $$
+                SELECT (floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint << 20)
+                    | ({int(shard)}::bigint << 12)
+                    | (nextval('task_event_seq') % 4096)
+            $$ LANGUAGE sql
+            """
+        )
+
+        # Archive of old completed tasks, range-partitioned by month of completion (see archive.py)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks_archive (
+                id UUID NOT NULL,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                due_date DATE NOT NULL,
+                priority TEXT NOT NULL,
+                completed BOOLEAN NOT NULL,
+                actionable_items JSONB NOT NULL DEFAULT '[]',
+                completion_percent INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL,
+                completed_at TIMESTAMPTZ NOT NULL,
+                total_time INTEGER NOT NULL DEFAULT 1,
+                actionable_done JSONB NOT NULL DEFAULT '[]',
+                PRIMARY KEY (id, completed_at)
+            ) PARTITION BY RANGE (completed_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_completed_at ON tasks_archive (user_id, completed_at);
+            ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS actionable_done JSONB NOT NULL DEFAULT '[]';
+            """
+        )
+        # Lets the archiver find the oldest eligible rows across all users
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_completed_at ON tasks (completed_at) WHERE completed"
+        )
+        # Read path for history/analytics: live and archived tasks together
+        cur.execute(
+            """
+            CREATE OR REPLACE VIEW tasks_all AS
+            SELECT id, user_id, name, due_date, priority, completed, actionable_items,
+                   completion_percent, created_at, completed_at, total_time
+            FROM tasks
+            UNION ALL
+            SELECT id, user_id, name, due_date, priority, completed, actionable_items,
+                   completion_percent, created_at, completed_at, total_time
+            FROM tasks_archive
+            """
+        )
+
+
+        # Per-user counters kept current by row triggers on tasks and tasks_archive (see counters.py).
+        # Only rows whose completed/priority/due_date change touch them, so slider and item edits stay cheap.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS task_counters (
+                user_id INTEGER PRIMARY KEY,
+                open_count INTEGER NOT NULL DEFAULT 0,
+                completed_p1 INTEGER NOT NULL DEFAULT 0,
+                completed_p2 INTEGER NOT NULL DEFAULT 0,
+                completed_p3 INTEGER NOT NULL DEFAULT 0
+            );
+            -- Bumped by every task list change (queries.LIST_VERSION_BUMP, archive.py); returned to clients after writes
+            ALTER TABLE task_counters ADD COLUMN IF NOT EXISTS list_version BIGINT NOT NULL DEFAULT 0;
+            CREATE TABLE IF NOT EXISTS task_due_counters (
+                user_id INTEGER NOT NULL,
+                due_date DATE NOT NULL,
+                open_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, due_date)
+            );
+
+            CREATE OR REPLACE FUNCTION task_counters_bump(
+                p_user INTEGER, p_completed BOOLEAN, p_priority TEXT, p_due DATE, p_delta INTEGER
+            ) RETURNS void AS $$
+            BEGIN
+                INSERT INTO task_counters AS c (user_id, open_count, completed_p1, completed_p2, completed_p3)
+                VALUES (
+                    p_user,
+                    CASE WHEN p_completed THEN 0 ELSE p_delta END,
+                    CASE WHEN p_completed AND p_priority = 'P1' THEN p_delta ELSE 0 END,
+                    CASE WHEN p_completed AND p_priority = 'P2' THEN p_delta ELSE 0 END,
+                    CASE WHEN p_completed AND p_priority = 'P3' THEN p_delta ELSE 0 END
+                )
+                ON CONFLICT (user_id) DO UPDATE SET
+                    open_count = c.open_count + EXCLUDED.open_count,
+                    completed_p1 = c.completed_p1 + EXCLUDED.completed_p1,
+                    completed_p2 = c.completed_p2 + EXCLUDED.completed_p2,
+                    completed_p3 = c.completed_p3 + EXCLUDED.completed_p3;
+                IF NOT p_completed THEN
+                    INSERT INTO task_due_counters AS d (user_id, due_date, open_count)
+                    VALUES (p_user, p_due, p_delta)
+                    ON CONFLICT (user_id, due_date) DO UPDATE SET open_count = d.open_count + EXCLUDED.open_count;
+                    DELETE FROM task_due_counters
+                    WHERE user_id = p_user AND due_date = p_due AND open_count = 0;
+                END IF;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION task_counters_apply() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM task_counters_bump(OLD.user_id, OLD.completed, OLD.priority, OLD.due_date, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM task_counters_bump(NEW.user_id, NEW.completed, NEW.priority, NEW.due_date, 1);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS tasks_counters_insert_delete ON tasks;
+            CREATE TRIGGER tasks_counters_insert_delete
+                AFTER INSERT OR DELETE ON tasks
+                FOR EACH ROW EXECUTE FUNCTION task_counters_apply();
+            DROP TRIGGER IF EXISTS tasks_counters_update ON tasks;
+            CREATE TRIGGER tasks_counters_update
+                AFTER UPDATE OF completed, priority, due_date, user_id ON tasks
+                FOR EACH ROW
+                WHEN (OLD.completed IS DISTINCT FROM NEW.completed
+                      OR OLD.priority IS DISTINCT FROM NEW.priority
+                      OR OLD.due_date IS DISTINCT FROM NEW.due_date
+                      OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+                EXECUTE FUNCTION task_counters_apply();
+            DROP TRIGGER IF EXISTS tasks_archive_counters ON tasks_archive;
+            CREATE TRIGGER tasks_archive_counters
+                AFTER INSERT OR DELETE ON tasks_archive
+                FOR EACH ROW EXECUTE FUNCTION task_counters_apply();
+            """
+        )
+        # Backfill once for databases that had tasks before the counters existed, in the same transaction
+        # that created the triggers (imported here because counters.py itself imports db)
+        from counters import ensure_streak_counters, seed_counters
+
+        seed_counters(cur)
+        ensure_streak_counters(cur)
+
+        # Due-date scanner (scheduler.py): keyset walk over open tasks by due date, and its event outbox
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_tasks_open_due ON tasks (due_date, id) WHERE NOT completed;
+            CREATE TABLE IF NOT EXISTS task_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                task_id UUID NOT NULL,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('due_soon', 'overdue')),
+                due_date DATE NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                processed_at TIMESTAMPTZ NULL,
+                UNIQUE (task_id, kind, due_date)
+            );
+            CREATE INDEX IF NOT EXISTS idx_task_outbox_pending ON task_outbox (id) WHERE processed_at IS NULL;
+            CREATE INDEX IF NOT EXISTS idx_task_outbox_due ON task_outbox (due_date) WHERE processed_at IS NOT NULL;
+            """
+        )
+
+        # Background report jobs (jobs.py); results are JSON bytes kept until expires_at
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id UUID PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                kind TEXT NOT NULL CHECK (kind IN ('cfd', 'history', 'lead_time')),
+                params JSONB NOT NULL DEFAULT '{}'::jsonb,
+                status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+                progress SMALLINT NOT NULL DEFAULT 0,
+                attempts SMALLINT NOT NULL DEFAULT 0,
+                result BYTEA NULL,
+                error TEXT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                started_at TIMESTAMPTZ NULL,
+                heartbeat_at TIMESTAMPTZ NULL,
+                finished_at TIMESTAMPTZ NULL,
+                expires_at TIMESTAMPTZ NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_report_jobs_queued ON report_jobs (created_at) WHERE status = 'queued';
+            CREATE INDEX IF NOT EXISTS idx_report_jobs_active ON report_jobs (user_id) WHERE status IN ('queued', 'running');
+            CREATE INDEX IF NOT EXISTS idx_report_jobs_user ON report_jobs (user_id, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_report_jobs_expires ON report_jobs (expires_at) WHERE expires_at IS NOT NULL;
+            """
+        )
+
+        # Schema version marker for readiness checks (single row)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version INTEGER NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        cur.execute(
+            """
+            INSERT INTO schema_version (version) VALUES (%s)
+            ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, applied_at = NOW()
+            WHERE schema_version.version < EXCLUDED.version
+            """,
+            (SCHEMA_VERSION,),
+        )
@@ -0,0 +1,323 @@
+# Live task change events: Postgres LISTEN/NOTIFY fan-out to per-connection Server-Sent Event streams.
+# Write paths call publish_task_event() inside their transaction, or embed task_event_sql() in the write
+# statement itself; NOTIFY is delivered on commit to the listener threads of every worker process (one per
+# shard), which push the event to that user's open SSE connections.
+
+from __future__ import annotations
+
+# Serialize event payloads for NOTIFY and SSE data lines
+import json
+import logging
+import os
+import queue
+import threading
+import time
+# Per-user replay rings (least recently active user first) used for Last-Event-ID resume
+from collections import OrderedDict, deque
+
+import psycopg
+
+from db import SHARD_DSNS
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel shared by all workers
+CHANNEL = "task_events"
+# Seconds between ": keepalive" comments so proxies don't close idle streams
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Max undelivered events per connection; a slow client past this gets a reset and is dropped
+SUBSCRIBER_BUFFER = int(os.getenv("SSE_BUFFER_SIZE", "100"))
+# Recent events kept per user so a reconnecting client can resume from Last-Event-ID. Rings are only kept
+# for users with a stream open on this worker, or closed within REPLAY_LINGER_SECONDS (a reconnect), and
+# hold id-only events (clients refetch the list on any event), so they are bounded by the open streams
+# rather than by every user who writes. A reconnect that lands on another worker gets a reset.
+REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "200"))
+REPLAY_LINGER_SECONDS = float(os.getenv("SSE_REPLAY_LINGER_SECONDS", "60"))
+# Users with a replay ring; past this the least recently active user's ring is evicted
+REPLAY_USERS = int(os.getenv("SSE_REPLAY_USERS", "1000"))
+# Open SSE streams per worker process. Under gthread every stream holds a thread for as long as it is open,
+# so the default keeps at least half of WEB_THREADS free for ordinary requests.
+MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", str(max(1, int(os.getenv("WEB_THREADS", "4")) // 2))))
+# Reconnect delay (ms) sent to clients turned away because their worker is at MAX_STREAMS
+BUSY_RETRY_MS = int(os.getenv("SSE_BUSY_RETRY_MS", "10000"))
+# NOTIFY payloads are capped at 8000 bytes; larger tasks are sent as id-only events
+MAX_INLINE_PAYLOAD = 7000
+
+
+def publish_task_event(
+    cur, user_id: int, kind: str, task_id: str | None, task_json: str | None = None, version: int | None = None
+) -> None:
+    """
+    Queue a task change notification in the caller's transaction.
+
+    Postgres only delivers NOTIFY when the transaction commits, so a rolled-back
+    write never reaches subscribers. The event id comes from next_task_event_id() and is
+    therefore unique across all worker processes and shards; ids follow the clock, not commit order. `task_json` is the
+    serialized task row, inlined when it fits in a NOTIFY payload; `version` is the user's list version
+    after the change, if the write bumped it.
+    """
+    if task_json is not None and len(task_json) > MAX_INLINE_PAYLOAD:
+        task_json = None
+    cur.execute(
+        """
+        SELECT pg_notify(%s, jsonb_strip_nulls(jsonb_build_object(
+            'id', next_task_event_id(), 'user', %s::int, 'type', %s::text,
+            'taskId', %s::text, 'task', %s::jsonb, 'version', %s::bigint
+        ))::text)
+        """,
+        (CHANNEL, user_id, kind, task_id, task_json, version),
+    )
+
+
+def task_event_sql(kind: str, task_id: str, task_json: str, version: str) -> str:
+    """
+    SQL expression queueing the same NOTIFY as publish_task_event(), for write statements that publish
+    their own change. `kind` is the event type; the other arguments are SQL expressions, and the
+    statement must bind %(user_id)s.
+    """
+    return f"""pg_notify('{CHANNEL}', jsonb_strip_nulls(jsonb_build_object(
+        'id', next_task_event_id(), 'user', %(user_id)s::int, 'type', '{kind}'::text, 'taskId', {task_id},
+        'task', CASE WHEN length({task_json}) <= {MAX_INLINE_PAYLOAD} THEN ({task_json})::jsonb END,
+        'version', {version}
+    ))::text)"""
+
+
+class Subscription:
+    """One SSE connection: a bounded queue of (event_id, event_type, data) tuples."""
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.queue: queue.Queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        # Set when events were dropped; the stream tells the client to refetch and closes
+        self.overflowed = False
+
+    def offer(self, item: tuple) -> None:
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+
+class TaskEventBroker:
+    """
+    Process-wide fan-out of NOTIFY events to local subscriptions.
+
+    One daemon thread per shard holds a dedicated LISTEN connection; the threads are
+    started lazily on first subscribe, so they are always created after a fork.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[Subscription]] = {}
+        # Events in arrival (commit) order per user, since the listeners last (re)connected
+        self._recent: OrderedDict[int, deque] = OrderedDict()
+        # user_id -> monotonic time their last stream on this worker closed
+        self._departed: dict[int, float] = {}
+        self._threads: dict[int, threading.Thread] = {}
+        self._pid: int | None = None
+        # Extra in-process callbacks (payload dict) invoked for every event
+        self._hooks: list = []
+        # Shards whose LISTEN connection is up; `_epoch` changes on every (re)connect and disconnect,
+        # since events published in between are lost to this process
+        self._connected: set[int] = set()
+        self._epoch = 0
+
+    def add_hook(self, callback) -> None:
+        """Register a callback invoked with every decoded event payload (the listener starts on first use)."""
+        self._hooks.append(callback)
+
+    def subscribe(self, user_id: int, last_event_id: int | None = None) -> Subscription:
+        self.ensure_listener()
+        sub = Subscription(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+            self._departed.pop(user_id, None)
+            if last_event_id is not None:
+                # Ids are taken before commit but NOTIFYs arrive in commit order, so a larger id is not
+                # necessarily newer: replay whatever arrived after the client's last event. When that event
+                # isn't held here (rolled out, evicted, or before this listener connected), the client refetches.
+                recent = list(self._recent.get(user_id, ()))
+                position = next((i for i, (event_id, _, _) in enumerate(recent) if event_id == last_event_id), None)
+                if position is None:
+                    sub.offer((None, "reset", "{}"))
+                else:
+                    for item in recent[position + 1:]:
+                        sub.offer(item)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+                    now = time.monotonic()
+                    self._departed[sub.user_id] = now
+                    self._forget_departed(now)
+
+    def _forget_departed(self, now: float) -> None:
+        # Drop the rings of users whose streams closed more than REPLAY_LINGER_SECONDS ago (caller holds _lock)
+        expired = [uid for uid, left in self._departed.items() if now - left >= REPLAY_LINGER_SECONDS]
+        for uid in expired:
+            del self._departed[uid]
+            self._recent.pop(uid, None)
+
+    def _replaying(self, user_id: int) -> bool:
+        # Whether events for this user are kept for a resume (caller holds _lock)
+        if user_id in self._subscribers:
+            return True
+        left = self._departed.get(user_id)
+        if left is not None and time.monotonic() - left < REPLAY_LINGER_SECONDS:
+            return True
+        self._departed.pop(user_id, None)
+        self._recent.pop(user_id, None)
+        return False
+
+    def dispatch(self, raw: str) -> None:
+        """Decode one NOTIFY payload and deliver it to hooks and the user's subscriptions."""
+        try:
+            payload = json.loads(raw)
+            event_id = int(payload["id"])
+            user_id = int(payload["user"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed task event: %r", raw)
+            return
+        for hook in self._hooks:
+            try:
+                hook(payload)
+            except Exception:
+                logger.exception("Task event hook failed")
+        kind = payload.pop("type", "changed")
+        payload.pop("user", None)
+        data = json.dumps(payload)
+        with self._lock:
+            for sub in self._subscribers.get(user_id, ()):
+                sub.offer((event_id, kind, data))
+            if not self._replaying(user_id):
+                return
+            if "task" in payload:
+                del payload["task"]
+                data = json.dumps(payload)
+            recent = self._recent.get(user_id)
+            if recent is None:
+                recent = self._recent[user_id] = deque(maxlen=REPLAY_SIZE)
+                if len(self._recent) > REPLAY_USERS:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(user_id)
+            recent.append((event_id, kind, data))
+
+    def is_listening(self) -> bool:
+        return (
+            self._pid == os.getpid()
+            and len(self._threads) == len(SHARD_DSNS)
+            and all(t.is_alive() for t in self._threads.values())
+        )
+
+    def is_connected(self) -> bool:
+        """Whether this process is currently receiving events (listener threads up and LISTEN active on every shard)."""
+        return len(self._connected) == len(SHARD_DSNS) and self.is_listening()
+
+    def epoch(self) -> int:
+        """Changes whenever a listener connects or drops; state derived from events must not span epochs."""
+        return self._epoch
+
+    def ensure_listener(self) -> None:
+        # Re-create the threads in a forked child; threads do not survive fork()
+        with self._lock:
+            if self.is_listening():
+                return
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._threads.clear()
+                self._connected.clear()
+                self._recent.clear()
+                self._departed.clear()
+            self._epoch += 1
+            for shard in range(len(SHARD_DSNS)):
+                thread = self._threads.get(shard)
+                if thread is None or not thread.is_alive():
+                    self._connected.discard(shard)
+                    thread = threading.Thread(
+                        target=self._listen_forever, args=(shard,), name=f"task-events-listener-{shard}", daemon=True,
+                    )
+                    self._threads[shard] = thread
+                    thread.start()
+
+    def _listen_forever(self, shard: int) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                with psycopg.connect(SHARD_DSNS[shard], autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    logger.info("Listening for task events on channel %s (shard %d)", CHANNEL, shard)
+                    with self._lock:
+                        self._epoch += 1
+                        self._connected.add(shard)
+                    backoff = 1.0
+                    while True:
+                        for notify in conn.notifies(timeout=HEARTBEAT_SECONDS):
+                            self.dispatch(notify.payload)
+                        # Periodic no-op keeps the connection checked while idle
+                        conn.execute("SELECT 1")
+            except Exception as e:
+                logger.error("Task event listener (shard %d) failed: %s; retrying in %.0fs", shard, e, backoff)
+                # Events published while disconnected cannot be replayed; force clients to refetch
+                with self._lock:
+                    self._connected.discard(shard)
+                    self._epoch += 1
+                    self._recent.clear()
+                    for subs in self._subscribers.values():
+                        for sub in subs:
+                            sub.offer((None, "reset", "{}"))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+broker = TaskEventBroker()
+
+
+def _format_event(event_id: int | None, kind: str, data: str) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def acquire_stream_slot() -> bool:
+    """Reserve one of this worker's MAX_STREAMS stream slots without blocking; release with release_stream_slot()."""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot() -> None:
+    _stream_slots.release()
+
+
+def sse_busy() -> str:
+    """A stream body that only tells EventSource to reconnect after BUSY_RETRY_MS; it holds no thread."""
+    return f"retry: {BUSY_RETRY_MS}\n\n"
+
+
+def sse_stream(sub: Subscription):
+    """Yield SSE frames for a subscription, with heartbeats, until the client goes away or falls behind."""
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        while True:
+            if sub.overflowed:
+                yield _format_event(None, "reset", "{}")
+                return
+            try:
+                event_id, kind, data = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield _format_event(event_id, kind, data)
+    finally:
+        broker.unsubscribe(sub)
@@ -0,0 +1,55 @@
+# Gunicorn configuration for the ToDoApp API (used as: gunicorn -c gunicorn.conf.py wsgi:app).
+# Graceful reload: `kill -HUP <master pid>` starts new workers and lets old ones finish in-flight requests.
+
+import multiprocessing
+import os
+
+from db import STATEMENT_TIMEOUTS_MS
+
+# Bind address (override with BIND, e.g. 0.0.0.0:8000 in containers)
+bind = os.getenv("BIND", "127.0.0.1:5000")
+
+# Worker sizing derived from CPU count: 2 * cores + 1 processes, each with a small thread pool.
+# Threads let DB waits overlap without one request pinning a process. Each open SSE stream holds a
+# thread for its whole life, so events.MAX_STREAMS caps them per worker (default: half of the threads).
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Published for the preloaded app: admission.py splits its deployment-wide limits between the workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# Import the app once in the master and fork; app.py closes its startup DB connections before the fork,
+# and pools, the task-event listener and the write coalescer are all created lazily per worker.
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+# Worker heartbeat timeout in seconds. Under gthread this is not a per-request limit: the master only
+# restarts a worker whose main loop stops checking in (e.g. a hung C call or a deadlock), and a slow
+# request on one of its threads does not count. Per-request limits are the Postgres statement budgets
+# (db.STATEMENT_TIMEOUTS_MS), so the default sits above the longest of them plus a margin for the
+# rest of the request, ensuring a stalled export is cancelled by Postgres before its worker is killed.
+timeout = int(os.getenv("REQUEST_TIMEOUT", str(max(STATEMENT_TIMEOUTS_MS.values()) // 1000 + 30)))
+# Time given to workers to finish in-flight requests on reload/shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth; jitter avoids restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Drop any pool references inherited from the master without touching the shared sockets
+    import db
+
+    db.reset_after_fork()
+
+
+def worker_exit(server, worker):
+    # Write out coalesced PATCHes before the worker goes away
+    from app import write_coalescer
+
+    if write_coalescer is not None:
+        write_coalescer.close()
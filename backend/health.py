@@ -0,0 +1,107 @@
+# Liveness and readiness checks for load balancers and orchestrators.
+#
+# Liveness only says the process can serve HTTP; it never touches the database, so a database outage
+# doesn't get every worker restarted. Readiness checks what this worker needs to serve traffic: a DB round
+# trip to every shard through its own crud pools (an exhausted or broken pool fails it), pool queues, the
+# schema version, and the task-event listener that keeps the task-list cache coherent. Failing readiness
+# answers 503 quickly, so the balancer drains the worker instead of waiting on timeouts.
+#
+# The DB probe result is cached for HEALTH_CACHE_SECONDS and only one thread probes at a time; concurrent
+# probes get the last result, so frequent checks from several balancers add no DB load.
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+import db
+import metrics
+from events import broker
+from task_cache import task_cache
+
+# Seconds a DB probe result is reused
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "2"))
+# Longest wait for a pooled connection during a probe; longer means the pool is exhausted
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "1"))
+# DB round trips slower than this mark the worker not ready
+HEALTH_MAX_DB_LATENCY_MS = float(os.getenv("HEALTH_MAX_DB_LATENCY_MS", "500"))
+# Requests queued for a connection in any pool beyond this mark the worker not ready
+HEALTH_MAX_POOL_WAITING = int(os.getenv("HEALTH_MAX_POOL_WAITING", str(db.POOL_MAX_SIZE)))
+
+_started_at = time.time()
+_probe_lock = threading.Lock()
+# (checked_at monotonic, result dict)
+_last_probe: tuple[float, dict] | None = None
+
+
+def _probe_db() -> dict:
+    # Every shard must answer; the slowest round trip and the oldest schema are reported
+    latencies, versions = [], []
+    for shard in range(len(db.SHARD_DSNS)):
+        try:
+            seconds, version = db.probe_shard(shard, HEALTH_DB_TIMEOUT)
+        except Exception as e:
+            metrics.incr("health.db_probe_failed")
+            return {"ok": False, "error": type(e).__name__, "shard": shard}
+        latencies.append(seconds)
+        versions.append(version or 0)
+    return {"ok": True, "latency_ms": round(max(latencies) * 1000, 1), "schema_version": min(versions),
+            "shards": len(latencies)}
+
+
+def db_status() -> dict:
+    """Latest DB probe result, refreshed at most once per HEALTH_CACHE_SECONDS per process."""
+    global _last_probe
+    cached = _last_probe
+    if cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_SECONDS:
+        return {**cached[1], "age_seconds": round(time.monotonic() - cached[0], 2)}
+    if not _probe_lock.acquire(blocking=cached is None):
+        # Another thread is probing; answer with the previous result rather than queueing behind it
+        return {**cached[1], "age_seconds": round(time.monotonic() - cached[0], 2)}
+    try:
+        if _last_probe is not cached:  # probed by another thread while we waited
+            return {**_last_probe[1], "age_seconds": round(time.monotonic() - _last_probe[0], 2)}
+        result = _probe_db()
+        _last_probe = (time.monotonic(), result)
+    finally:
+        _probe_lock.release()
+    return {**result, "age_seconds": 0.0}
+
+
+def liveness() -> dict:
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - _started_at)}
+
+
+def readiness() -> tuple[dict, bool]:
+    """Readiness report and whether the worker should receive traffic."""
+    problems = []
+    database = db_status()
+    if not database["ok"]:
+        problems.append("database unreachable")
+    else:
+        if database["latency_ms"] > HEALTH_MAX_DB_LATENCY_MS:
+            problems.append("database slow")
+        if (database["schema_version"] or 0) < db.SCHEMA_VERSION:
+            problems.append("schema out of date")
+
+    pools = db.pool_stats()
+    if any(p["waiting"] > HEALTH_MAX_POOL_WAITING for p in pools.values()):
+        problems.append("connection pool saturated")
+
+    # The cache bypasses itself while the listener is down, so that only degrades performance.
+    listener = "connected" if broker.is_connected() else ("connecting" if broker.is_listening() else "stopped")
+    cache = {**task_cache.stats(), "listener": listener, "serving": task_cache.max_bytes > 0 and listener == "connected"}
+
+    ready = not problems
+    if not ready:
+        metrics.incr("health.not_ready")
+    report = {
+        "status": "ready" if ready else "not_ready",
+        "problems": problems,
+        "database": {**database, "expected_schema_version": db.SCHEMA_VERSION},
+        "pools": pools,
+        "task_cache": cache,
+        "pid": os.getpid(),
+    }
+    return report, ready
@@ -0,0 +1,433 @@
+# Background report jobs: expensive reports (multi-year CFD, full history export, lead-time report) run
+# outside the request. A client submits a job, polls its status and progress, and downloads the result
+# once it is done; the web worker that took the request is free immediately.
+#
+#   python jobs.py                 # dedicated worker process (--workers threads, default 2), runs until killed
+#   python jobs.py --once          # work through the queue, then exit
+#
+# Jobs live in the `report_jobs` table on the user's own shard (shards.py), so any process can run them.
+# They are meant to run in dedicated `python jobs.py` processes; web processes only run worker threads when
+# REPORT_WORKERS > 0 (default 0, except under the dev server), so reports never compete with requests for
+# a gunicorn worker's threads and connections. Submitting a job sends a NOTIFY on its shard that wakes idle
+# workers at once; REPORT_POLL_SECONDS is only a fallback for missed notifications. Workers try every
+# shard's queue in turn and claim queued jobs with FOR UPDATE SKIP LOCKED, skipping users who already have
+# REPORT_MAX_RUNNING_PER_USER jobs running (checked at claim time, so concurrent claims can briefly
+# overshoot it). Queries run under the "export" statement budget. Results are kept for
+# REPORT_RESULT_TTL_SECONDS. A running job heartbeats every REPORT_HEARTBEAT_SECONDS whatever its kind, and
+# jobs whose worker died are re-queued once their heartbeat is older than REPORT_STALE_SECONDS. Moving a
+# user copies their jobs; one running during the move is re-run on the new shard once its copy goes stale.
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Callable, Dict
+from uuid import uuid4
+
+import psycopg
+
+import db
+import metrics
+import queries
+import shards
+from analytics import lead_time_payload
+from db import db_cursor
+from serialization import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# Worker threads per web process; 0 (the default) leaves jobs to dedicated `python jobs.py` processes
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "0"))
+# Jobs of one user that may run at the same time / be queued or running at all
+REPORT_MAX_RUNNING_PER_USER = int(os.getenv("REPORT_MAX_RUNNING_PER_USER", "1"))
+REPORT_MAX_ACTIVE_PER_USER = int(os.getenv("REPORT_MAX_ACTIVE_PER_USER", "5"))
+# How long finished results (and failures) are kept
+REPORT_RESULT_TTL_SECONDS = int(os.getenv("REPORT_RESULT_TTL_SECONDS", "3600"))
+# Running jobs heartbeat this often, and are re-queued without a heartbeat for REPORT_STALE_SECONDS
+REPORT_HEARTBEAT_SECONDS = float(os.getenv("REPORT_HEARTBEAT_SECONDS", "30"))
+REPORT_STALE_SECONDS = int(os.getenv("REPORT_STALE_SECONDS", "300"))
+# Claims per job before it is marked failed
+REPORT_MAX_ATTEMPTS = 3
+# NOTIFY channel announcing newly queued jobs on a shard
+CHANNEL = "report_jobs"
+# Idle workers also check the queue this often, in case a notification was missed while reconnecting
+REPORT_POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", "30"))
+# Seconds between expiry/stale sweeps per process
+REPORT_MAINTENANCE_SECONDS = 60
+# Longest report window, in days
+REPORT_MAX_DAYS = int(os.getenv("REPORT_MAX_DAYS", "3660"))
+# CFD reports are computed one window of this many days at a time (progress is reported per window)
+CFD_CHUNK_DAYS = 365
+
+JOB_COLUMNS = "id::text, kind, params, status, progress, error, created_at, started_at, finished_at, expires_at"
+
+# Queue a job unless the user already has REPORT_MAX_ACTIVE_PER_USER queued or running.
+_SUBMIT = f"""
+INSERT INTO report_jobs (id, user_id, kind, params)
+SELECT %(id)s::uuid, %(user_id)s::int, %(kind)s::text, %(params)s::jsonb
+WHERE (
+    SELECT COUNT(*) FROM report_jobs
+    WHERE user_id = %(user_id)s AND status IN ('queued', 'running')
+) < %(max_active)s
+RETURNING {JOB_COLUMNS}
+"""
+
+# Claim the oldest queued job whose user is under the running limit.
+_CLAIM = """
+UPDATE report_jobs SET
+    status = 'running', started_at = NOW(), heartbeat_at = NOW(), attempts = attempts + 1
+WHERE id = (
+    SELECT j.id FROM report_jobs j
+    WHERE j.status = 'queued'
+      AND (SELECT COUNT(*) FROM report_jobs r WHERE r.user_id = j.user_id AND r.status = 'running') < %s
+    ORDER BY j.created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id::text, user_id, kind, params
+"""
+
+# Record the outcome; a job deleted (cancelled) while running has no row left to update.
+_FINISH = """
+UPDATE report_jobs SET
+    status = %(status)s::text, progress = CASE WHEN %(status)s::text = 'done' THEN 100 ELSE progress END,
+    result = %(result)s, error = %(error)s, finished_at = NOW(),
+    expires_at = NOW() + %(ttl)s * INTERVAL '1 second'
+WHERE id = %(id)s AND status = 'running'
+"""
+
+# Re-queue jobs whose worker stopped heartbeating; give up after REPORT_MAX_ATTEMPTS claims.
+_REQUEUE_STALE = """
+UPDATE report_jobs SET
+    status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+    error = CASE WHEN attempts >= %(max_attempts)s THEN 'Worker stopped responding.' END,
+    finished_at = CASE WHEN attempts >= %(max_attempts)s THEN NOW() END,
+    expires_at = CASE WHEN attempts >= %(max_attempts)s THEN NOW() + %(ttl)s * INTERVAL '1 second' END
+WHERE status = 'running' AND heartbeat_at < NOW() - %(stale)s * INTERVAL '1 second'
+"""
+
+
+class JobCancelled(Exception):
+    """The job's row was deleted while it was running."""
+
+
+class Progress:
+    """Progress callback handed to report functions; each update also heartbeats the job."""
+
+    def __init__(self, job_id: str, shard: int = 0) -> None:
+        self.job_id = job_id
+        self.shard = shard
+
+    def __call__(self, done: int, total: int) -> None:
+        percent = min(99, int(100 * done / total)) if total else 0
+        with db_cursor(shard=self.shard) as cur:
+            cur.execute(
+                "UPDATE report_jobs SET progress = %s, heartbeat_at = NOW() WHERE id = %s AND status = 'running'",
+                (percent, self.job_id),
+            )
+            if cur.rowcount == 0:
+                raise JobCancelled(self.job_id)
+
+
+@contextmanager
+def _heartbeat(job_id: str, shard: int):
+    # Keeps a running job's heartbeat fresh from a side thread, so reports that are one long statement
+    # (history, lead time) aren't taken for abandoned; stops once the job's row is gone (cancelled).
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(REPORT_HEARTBEAT_SECONDS):
+            try:
+                with db_cursor(shard=shard) as cur:
+                    cur.execute(
+                        "UPDATE report_jobs SET heartbeat_at = NOW() WHERE id = %s AND status = 'running'", (job_id,)
+                    )
+                    if cur.rowcount == 0:
+                        return
+            except Exception:
+                logger.warning("Heartbeat for report job %s failed", job_id, exc_info=True)
+
+    thread = threading.Thread(target=beat, name=f"report-heartbeat-{job_id[:8]}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+# ----- Reports: (user_id, days, progress) -> JSON bytes -----
+
+def _user_cursor(user_id: int, writing: bool = False):
+    # The user's shard; reads (and running reports) carry on while the user is being moved
+    return db_cursor(shard=shards.shard_for(user_id, writing=writing))
+
+
+def _cfd_report(user_id: int, days: int, progress: Progress) -> bytes:
+    # Each day's point only depends on that day, so the window is computed in yearly slices (oldest first)
+    # and the JSON arrays are spliced together.
+    today = date.today()
+    parts = []
+    chunks = -(-days // CFD_CHUNK_DAYS)
+    for i in range(chunks):
+        remaining = days - i * CFD_CHUNK_DAYS
+        chunk_days = min(CFD_CHUNK_DAYS, remaining)
+        chunk_end = today - timedelta(days=remaining - chunk_days)
+        with _user_cursor(user_id) as cur:
+            queries.execute(cur, "analytics_cfd", {"user_id": user_id, "days": chunk_days, "today": chunk_end})
+            body = cur.fetchone()[0]
+        if body != "[]":
+            parts.append(body[1:-1])
+        progress(i + 1, chunks)
+    return ("[" + ",".join(parts) + "]").encode("utf-8")
+
+
+def _history_report(user_id: int, days: int, progress: Progress) -> bytes:
+    with _user_cursor(user_id) as cur:
+        queries.execute(cur, "completed_tasks", {"user_id": user_id, "days": days})
+        return cur.fetchone()[0].encode("utf-8")
+
+
+def _lead_time_report(user_id: int, days: int, progress: Progress) -> bytes:
+    with _user_cursor(user_id) as cur:
+        queries.execute(cur, "analytics_lead_time", {"user_id": user_id, "days": days})
+        rows = cur.fetchall()
+    return dumps_bytes(lead_time_payload(rows, days))
+
+
+REPORTS: Dict[str, Callable[[int, int, Progress], bytes]] = {
+    "cfd": _cfd_report,
+    "history": _history_report,
+    "lead_time": _lead_time_report,
+}
+
+
+# ----- Queue API (used by the /api/reports endpoints) -----
+
+def job_payload(row) -> dict:
+    """Status JSON for a report_jobs row selected with JOB_COLUMNS."""
+    job_id, kind, params, status, progress, error, created_at, started_at, finished_at, expires_at = row
+    return {
+        "id": job_id,
+        "kind": kind,
+        "params": params,
+        "status": status,
+        "progress": progress,
+        "error": error,
+        "createdAt": created_at,
+        "startedAt": started_at,
+        "finishedAt": finished_at,
+        "expiresAt": expires_at,
+    }
+
+
+def submit(user_id: int, kind: str, days: int) -> dict | None:
+    """Queue a report; returns its status, or None if the user has too many active jobs."""
+    with _user_cursor(user_id, writing=True) as cur:
+        cur.execute(_SUBMIT, {
+            "id": str(uuid4()), "user_id": user_id, "kind": kind,
+            "params": json.dumps({"days": days}), "max_active": REPORT_MAX_ACTIVE_PER_USER,
+        })
+        row = cur.fetchone()
+        if row is not None:
+            # Delivered on commit to the workers listening on this shard
+            cur.execute("SELECT pg_notify(%s, '')", (CHANNEL,))
+    if row is None:
+        metrics.incr("reports.rejected")
+        return None
+    metrics.incr("reports.submitted")
+    _wakeup.set()
+    return job_payload(row)
+
+
+def get(user_id: int, job_id: str) -> dict | None:
+    with _user_cursor(user_id) as cur:
+        cur.execute(f"SELECT {JOB_COLUMNS} FROM report_jobs WHERE id = %s AND user_id = %s", (job_id, user_id))
+        row = cur.fetchone()
+    return job_payload(row) if row else None
+
+
+def list_jobs(user_id: int, limit: int = 20) -> list[dict]:
+    with _user_cursor(user_id) as cur:
+        cur.execute(
+            f"SELECT {JOB_COLUMNS} FROM report_jobs WHERE user_id = %s ORDER BY created_at DESC LIMIT %s",
+            (user_id, limit),
+        )
+        return [job_payload(row) for row in cur.fetchall()]
+
+
+def result(user_id: int, job_id: str) -> tuple[str, bytes | None] | None:
+    """(status, result bytes) for a job; status "expired" once past its TTL. None if no such job."""
+    with _user_cursor(user_id) as cur:
+        cur.execute(
+            "SELECT status, expires_at < NOW(), result FROM report_jobs WHERE id = %s AND user_id = %s",
+            (job_id, user_id),
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    status, expired, body = row
+    if expired:
+        return "expired", None
+    return status, bytes(body) if body is not None else None
+
+
+def cancel(user_id: int, job_id: str) -> bool:
+    """Delete a job; a running job stops at its next progress update."""
+    with _user_cursor(user_id, writing=True) as cur:
+        cur.execute("DELETE FROM report_jobs WHERE id = %s AND user_id = %s", (job_id, user_id))
+        return cur.rowcount > 0
+
+
+# ----- Workers -----
+
+def _claim() -> tuple[int, tuple] | None:
+    # Shards are tried round-robin, starting one further along each call, so no shard's queue starves
+    global _next_shard
+    count = len(db.SHARD_DSNS)
+    start, _next_shard = _next_shard, (_next_shard + 1) % count
+    for offset in range(count):
+        shard = (start + offset) % count
+        with db_cursor(shard=shard) as cur:
+            cur.execute(_CLAIM, (REPORT_MAX_RUNNING_PER_USER,))
+            job = cur.fetchone()
+        if job is not None:
+            return shard, job
+    return None
+
+
+def run_next() -> bool:
+    """Claim and run one queued job; False if there was nothing to claim."""
+    claimed = _claim()
+    if claimed is None:
+        return False
+    shard, (job_id, user_id, kind, params) = claimed
+    status, body, error = "done", None, None
+    start = time.perf_counter()
+    try:
+        with _heartbeat(job_id, shard):
+            body = REPORTS[kind](user_id, int(params["days"]), Progress(job_id, shard))
+    except JobCancelled:
+        metrics.incr("reports.cancelled")
+        return True
+    except Exception as e:
+        logger.exception("Report job %s (%s) failed", job_id, kind)
+        status, error = "failed", type(e).__name__
+    metrics.observe(f"reports.run.{kind}", time.perf_counter() - start)
+    metrics.incr(f"reports.{status}")
+    with db_cursor(shard=shard) as cur:
+        cur.execute(_FINISH, {"id": job_id, "status": status, "result": body, "error": error,
+                              "ttl": REPORT_RESULT_TTL_SECONDS})
+    return True
+
+
+def maintain() -> dict:
+    """Re-queue jobs abandoned by dead workers and delete expired ones, on every shard."""
+    requeued = expired = 0
+    for shard in range(len(db.SHARD_DSNS)):
+        with db_cursor(shard=shard) as cur:
+            cur.execute(_REQUEUE_STALE, {"max_attempts": REPORT_MAX_ATTEMPTS, "stale": REPORT_STALE_SECONDS,
+                                         "ttl": REPORT_RESULT_TTL_SECONDS})
+            if cur.rowcount:
+                requeued += cur.rowcount
+                cur.execute("SELECT pg_notify(%s, '')", (CHANNEL,))
+            cur.execute("DELETE FROM report_jobs WHERE expires_at < NOW()")
+            expired += cur.rowcount
+    return {"requeued": requeued, "expired": expired}
+
+
+# Set when a job is queued (a NOTIFY on any shard, or a submit in this process) to wake idle workers
+_wakeup = threading.Event()
+# Shard the next claim starts from
+_next_shard = 0
+_maintained_at = 0.0
+_maintain_lock = threading.Lock()
+
+
+def _maybe_maintain() -> None:
+    global _maintained_at
+    if time.monotonic() - _maintained_at < REPORT_MAINTENANCE_SECONDS or not _maintain_lock.acquire(blocking=False):
+        return
+    try:
+        _maintained_at = time.monotonic()
+        result = maintain()
+        if result["requeued"] or result["expired"]:
+            logger.info("Report job maintenance: %s", result)
+    finally:
+        _maintain_lock.release()
+
+
+def _worker_loop(stop_when_idle: bool = False) -> None:
+    db.statement_class.set("export")
+    while True:
+        try:
+            _maybe_maintain()
+            if run_next():
+                continue
+        except Exception:
+            logger.exception("Report worker pass failed")
+        if stop_when_idle:
+            return
+        _wakeup.wait(REPORT_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def _listen_forever(shard: int) -> None:
+    # Wake the workers whenever a job is queued on this shard; reconnects with backoff
+    backoff = 1.0
+    while True:
+        try:
+            with psycopg.connect(db.SHARD_DSNS[shard], autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                backoff = 1.0
+                # Jobs queued before LISTEN took effect are picked up by this pass
+                _wakeup.set()
+                while True:
+                    for _ in conn.notifies(timeout=REPORT_POLL_SECONDS):
+                        _wakeup.set()
+                    conn.execute("SELECT 1")
+        except Exception as e:
+            logger.error("Report job listener (shard %d) failed: %s; retrying in %.0fs", shard, e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+def _start_workers(count: int, stop_when_idle: bool = False, daemon: bool = True) -> list[threading.Thread]:
+    # Worker threads, plus one queue listener per shard unless they stop once the queue is empty
+    if not stop_when_idle:
+        for shard in range(len(db.SHARD_DSNS)):
+            threading.Thread(target=_listen_forever, args=(shard,), name=f"report-listener-{shard}", daemon=True).start()
+    threads = [
+        threading.Thread(target=_worker_loop, args=(stop_when_idle,), name=f"report-worker-{i}", daemon=daemon)
+        for i in range(count)
+    ]
+    for t in threads:
+        t.start()
+    return threads
+
+
+_workers_pid: int | None = None
+
+
+def ensure_workers() -> None:
+    """Start this process's report worker threads (no-op if disabled or already running)."""
+    global _workers_pid
+    if REPORT_WORKERS <= 0 or _workers_pid == os.getpid():
+        return
+    _workers_pid = os.getpid()
+    _start_workers(REPORT_WORKERS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background report jobs.")
+    parser.add_argument("--workers", type=int, default=max(REPORT_WORKERS, 2))
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for t in _start_workers(args.workers, stop_when_idle=args.once, daemon=False):
+        t.join()
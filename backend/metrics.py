@@ -0,0 +1,54 @@
+# In-process metrics registry: thread-safe counters and timing summaries, exposed via /api/metrics.
+# Values are per worker process; scrape each worker (or aggregate upstream) for fleet-wide numbers.
+
+from __future__ import annotations
+
+import threading
+# Monotonic clock for timing blocks
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+_lock = threading.Lock()
+# name -> integer/float counter
+_counters: Dict[str, float] = {}
+# name -> {"count", "total", "max"} (seconds)
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+# Add `value` to the named counter (created on first use)
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+# Record one duration observation (seconds) under `name`
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        entry = _timings.get(name)
+        if entry is None:
+            entry = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+        entry["count"] += 1
+        entry["total"] += seconds
+        if seconds > entry["max"]:
+            entry["max"] = seconds
+
+
+# Context manager: time the enclosed block and record it with observe()
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+# Snapshot of all counters and timings (with derived averages) for reporting
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        timings = {
+            name: {**entry, "avg": entry["total"] / entry["count"] if entry["count"] else 0.0}
+            for name, entry in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
@@ -0,0 +1,192 @@
+# Opt-in profiling of live requests: cProfile call stats, tracemalloc top allocations and sampled call
+# stacks for a fraction of requests (PROFILE_SAMPLE_RATE) or any request carrying X-Profile-Token.
+#
+# Each profiled request writes <stem>.pstats (load with pstats/snakeviz), <stem>.txt (top functions by
+# cumulative time plus top allocations) and <stem>.collapsed (flame-graph input, route name as the root
+# frame) to PROFILE_DIR, keeping the newest PROFILE_KEEP requests. Merge the collapsed files from every
+# worker into one flame graph with:
+#
+#   python profiling.py > requests.folded && flamegraph.pl requests.folded > requests.svg
+#
+# Only one request per process is profiled at a time (the interpreter allows a single active profiler);
+# requests arriving meanwhile are served unprofiled.
+
+from __future__ import annotations
+
+import cProfile
+import glob
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+import metrics
+
+# Fraction of requests profiled without the header (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Requests whose X-Profile-Token header matches are always profiled; unset disables the header
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+# Profiled requests kept on disk; older reports are deleted
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Stack sampling period for the flame-graph export
+PROFILE_STACK_INTERVAL = float(os.getenv("PROFILE_STACK_INTERVAL_MS", "5")) / 1000
+# Frames recorded per allocation / allocation sites and functions listed in the text report
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+_profile_lock = threading.Lock()
+_collapsed_lock = threading.Lock()
+# Aggregated "route;frame;frame count" stacks for this process, served by /api/debug/profile/flamegraph
+_collapsed: Counter = Counter()
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, route: str) -> None:
+        super().__init__(name="profile-stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.route = route
+        self.samples: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(PROFILE_STACK_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                frames.append(self.route)
+                self.samples[";".join(reversed(frames))] += 1
+
+    def stop(self) -> Counter:
+        self._done.set()
+        self.join()
+        return self.samples
+
+
+def should_profile() -> bool:
+    if PROFILE_TOKEN and request.headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _route_name() -> str:
+    return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+
+
+def _rotate() -> None:
+    reports = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.pstats")), key=os.path.getmtime)
+    for path in reports[:max(len(reports) - PROFILE_KEEP, 0)]:
+        stem = path[: -len(".pstats")]
+        for ext in (".pstats", ".txt", ".collapsed"):
+            try:
+                os.remove(stem + ext)
+            except FileNotFoundError:
+                pass
+
+
+def _write_report(route: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                  peak: int, elapsed: float, stacks: Counter) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = "".join(ch if ch.isalnum() else "_" for ch in route).strip("_")
+    stem = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{os.getpid()}-{slug}")
+
+    profiler.dump_stats(stem + ".pstats")
+
+    text = io.StringIO()
+    text.write(f"{route}\nwall time: {elapsed * 1000:.1f} ms\npeak traced memory: {peak / 1024:.1f} KiB\n\n")
+    text.write(f"Top {TOP_ALLOCATIONS} allocation sites still live at end of request:\n")
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        text.write(f"  {stat}\n")
+    text.write("\n")
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    with open(stem + ".txt", "w", encoding="utf-8") as fh:
+        fh.write(text.getvalue())
+
+    with open(stem + ".collapsed", "w", encoding="utf-8") as fh:
+        fh.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+
+    _rotate()
+    return stem
+
+
+def collapsed_stacks() -> str:
+    """This process's aggregated stacks in collapsed (folded) format."""
+    with _collapsed_lock:
+        return "".join(f"{stack} {count}\n" for stack, count in _collapsed.most_common())
+
+
+def merge_collapsed_files(directory: str = PROFILE_DIR) -> str:
+    """Sum the per-request .collapsed files (from every worker) into one folded-stacks document."""
+    merged: Counter = Counter()
+    for path in glob.glob(os.path.join(directory, "*.collapsed")):
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack and count.isdigit():
+                    merged[stack] += int(count)
+    return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+
+def init_app(app) -> None:
+    """Register hooks that profile sampled requests from before_request through teardown."""
+
+    @app.before_request
+    def _start_profile():
+        if not should_profile() or not _profile_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler (debugger, coverage) is already active
+            _profile_lock.release()
+            return
+        route = _route_name()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        sampler = _StackSampler(threading.get_ident(), route)
+        sampler.start()
+        g._profile = (route, profiler, sampler, started_tracing, time.perf_counter())
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        state = g.pop("_profile", None)
+        if state is None:
+            return
+        route, profiler, sampler, started_tracing, start = state
+        try:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            stacks = sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            with _collapsed_lock:
+                _collapsed.update(stacks)
+            _write_report(route, profiler, snapshot, peak, elapsed, stacks)
+            metrics.incr("profiling.requests")
+        except Exception:
+            app.logger.exception("Failed to write request profile for %s", route)
+        finally:
+            _profile_lock.release()
+
+
+if __name__ == "__main__":
+    sys.stdout.write(merge_collapsed_files(sys.argv[1] if len(sys.argv) > 1 else PROFILE_DIR))
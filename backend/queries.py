@@ -0,0 +1,241 @@
+# Named SQL statements for the request hot paths, executed as server-side prepared statements.
+# psycopg prepares each statement once per pooled connection (keyed by its text) and afterwards sends only
+# Bind/Execute, so Postgres skips parse/plan work on every call. Each statement has a fixed shape: partial
+# task updates use one UPDATE whose untouched columns keep their value, instead of per-payload SQL text.
+#
+# Every execution is timed under `sql.<name>` in the metrics registry (GET /api/metrics).
+# Set PG_PREPARE_STATEMENTS=0 behind a transaction-pooling proxy (e.g. PgBouncer < 1.21) that can't
+# keep prepared statements on a server connection.
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict
+
+import metrics
+from analytics import CFD_SQL, DASHBOARD_SQL, LEAD_TIME_SQL, STREAK_SQL, SUMMARY_SELECT
+from counters import USER_COUNTS_SQL
+from events import task_event_sql
+from serialization import COMPLETED_TASK_JSON, TASK_JSON, dumps_bytes
+
+PREPARE = os.getenv("PG_PREPARE_STATEMENTS", "1") != "0"
+
+# CTE bumping the user's list version (task_counters.list_version) once if the `written` CTE changed any
+# task. Clients get the new version with the write's response and in its task event, so they can tell
+# their own changes from other sessions' without refetching the list.
+LIST_VERSION_BUMP = """
+version AS (
+    INSERT INTO task_counters AS c (user_id, list_version)
+    SELECT %(user_id)s::int, 1 WHERE EXISTS (SELECT 1 FROM written)
+    ON CONFLICT (user_id) DO UPDATE SET list_version = c.list_version + 1
+    RETURNING list_version
+)
+"""
+
+
+def publishing(written: str, kind: str, ctes: str = "") -> str:
+    """
+    Single-statement task write: `written` changes one task (returning task_id and body), and the same
+    statement bumps the list version and queues the task event. `ctes` are CTEs the write reads ("a AS
+    (...), "). Returns (body, list_version, notify), or no row when nothing was written.
+    """
+    return f"""
+WITH {ctes}written AS ({written}),
+{LIST_VERSION_BUMP}
+SELECT w.body, v.list_version, {task_event_sql(kind, "w.task_id", "w.body", "v.list_version")}
+FROM written w, version v
+"""
+
+
+# Partial update with one statement shape: NULL parameters leave the column unchanged. completed_at
+# only moves when `completed` flips (set or cleared with it); actionable_done keeps an item's checked
+# state when the same text stays at the same position. Rows the change would leave as they are aren't
+# written, so the result tells "not found" (found = false), "unchanged" (no version bump, no event) and
+# "updated" apart: (found, body, list_version, changed, notify).
+TASK_UPDATE = f"""
+WITH target AS (
+    SELECT {TASK_JSON}::text AS body FROM tasks WHERE user_id = %(user_id)s AND id = %(task_id)s
+),
+written AS (
+    UPDATE tasks SET
+        name = COALESCE(%(name)s::text, name),
+        due_date = COALESCE(%(due_date)s::date, due_date),
+        priority = COALESCE(%(priority)s::text, priority),
+        completed = COALESCE(%(completed)s::boolean, completed),
+        completed_at = CASE
+            WHEN %(completed)s::boolean IS NULL OR completed = %(completed)s::boolean THEN completed_at
+            ELSE %(completed_at)s::timestamptz
+        END,
+        actionable_items = COALESCE(%(actionable_items)s::jsonb, actionable_items),
+        actionable_done = CASE
+            WHEN %(actionable_items)s::jsonb IS NULL THEN actionable_done
+            ELSE (
+                SELECT COALESCE(jsonb_agg(COALESCE(
+                    CASE WHEN tasks.actionable_items -> (n - 1)::int = e THEN tasks.actionable_done -> (n - 1)::int END,
+                    'false'::jsonb) ORDER BY n), '[]'::jsonb)
+                FROM jsonb_array_elements(%(actionable_items)s::jsonb) WITH ORDINALITY AS x(e, n)
+            )
+        END,
+        completion_percent = COALESCE(%(completion_percent)s::int, completion_percent),
+        total_time = COALESCE(%(total_time)s::int, total_time)
+    WHERE user_id = %(user_id)s AND id = %(task_id)s
+        AND (name, due_date, priority, completed, actionable_items, completion_percent, total_time)
+            IS DISTINCT FROM (
+                COALESCE(%(name)s::text, name),
+                COALESCE(%(due_date)s::date, due_date),
+                COALESCE(%(priority)s::text, priority),
+                COALESCE(%(completed)s::boolean, completed),
+                COALESCE(%(actionable_items)s::jsonb, actionable_items),
+                COALESCE(%(completion_percent)s::int, completion_percent),
+                COALESCE(%(total_time)s::int, total_time)
+            )
+    RETURNING id::text AS task_id, {TASK_JSON}::text AS body
+),
+{LIST_VERSION_BUMP}
+SELECT
+    t.body IS NOT NULL,
+    COALESCE(w.body, t.body),
+    COALESCE(v.list_version, c.list_version, 0),
+    w.body IS NOT NULL,
+    CASE WHEN w.body IS NOT NULL THEN {task_event_sql("updated", "w.task_id", "w.body", "v.list_version")} END
+FROM (SELECT 1) AS one
+LEFT JOIN target t ON true
+LEFT JOIN written w ON true
+LEFT JOIN version v ON true
+LEFT JOIN task_counters c ON c.user_id = %(user_id)s
+"""
+
+# Columns TASK_UPDATE accepts (all default to NULL = unchanged)
+TASK_UPDATE_COLUMNS = (
+    "name", "due_date", "priority", "completed", "completed_at",
+    "actionable_items", "completion_percent", "total_time",
+)
+
+# Set-based form of TASK_UPDATE for bulk operations: one UPDATE over every task matching the filter (NULL
+# filter parameters match everything). due_date is either set or shifted by shift_days. Rows the change
+# would leave as they are are skipped, and completed_at only moves when `completed` actually flips, so
+# re-completing done tasks keeps their history. Returns the changed count, (if asked) their ids, and the
+# list version (bumped once per statement, NULL when nothing changed).
+TASK_BULK_UPDATE = f"""
+WITH written AS (
+    UPDATE tasks SET
+        due_date = COALESCE(%(due_date)s::date, due_date + %(shift_days)s::int),
+        priority = COALESCE(%(priority)s::text, priority),
+        completed = COALESCE(%(completed)s::boolean, completed),
+        completed_at = CASE
+            WHEN %(completed)s::boolean IS NULL OR completed = %(completed)s::boolean THEN completed_at
+            ELSE %(completed_at)s::timestamptz
+        END,
+        completion_percent = COALESCE(%(completion_percent)s::int, completion_percent),
+        total_time = COALESCE(%(total_time)s::int, total_time)
+    WHERE user_id = %(user_id)s
+        AND (%(ids)s::uuid[] IS NULL OR id = ANY(%(ids)s::uuid[]))
+        AND (%(priorities)s::text[] IS NULL OR priority = ANY(%(priorities)s::text[]))
+        AND (%(is_completed)s::boolean IS NULL OR completed = %(is_completed)s::boolean)
+        AND (%(due_before)s::date IS NULL OR due_date < %(due_before)s::date)
+        AND (%(due_from)s::date IS NULL OR due_date >= %(due_from)s::date)
+        AND (due_date, priority, completed, completion_percent, total_time) IS DISTINCT FROM (
+            COALESCE(%(due_date)s::date, due_date + %(shift_days)s::int),
+            COALESCE(%(priority)s::text, priority),
+            COALESCE(%(completed)s::boolean, completed),
+            COALESCE(%(completion_percent)s::int, completion_percent),
+            COALESCE(%(total_time)s::int, total_time)
+        )
+    RETURNING id
+),
+{LIST_VERSION_BUMP}
+SELECT COUNT(*), array_agg(id::text ORDER BY id) FILTER (WHERE %(return_ids)s::boolean),
+    (SELECT list_version FROM version)
+FROM written
+"""
+
+# Columns TASK_BULK_UPDATE can set, and the filters it accepts (all default to NULL)
+TASK_BULK_COLUMNS = ("due_date", "priority", "completed", "completed_at", "completion_percent", "total_time")
+TASK_BULK_FILTERS = ("ids", "priorities", "is_completed", "due_before", "due_from")
+
+STATEMENTS: Dict[str, str] = {
+    # Users
+    "user_by_id": "SELECT id, username FROM users WHERE id = %(user_id)s",
+    "user_credentials": "SELECT id, password_hash FROM users WHERE username = %(username)s",
+    # No row back means the username is taken (one statement, no SELECT-then-INSERT race)
+    "user_insert": """
+        INSERT INTO users (username, password_hash) VALUES (%(username)s, %(password_hash)s)
+        ON CONFLICT (username) DO NOTHING
+        RETURNING id
+    """,
+    "user_insert_with_id": """
+        INSERT INTO users (id, username, password_hash) VALUES (%(user_id)s, %(username)s, %(password_hash)s)
+    """,
+    # Tasks
+    "task_list": f"""
+        SELECT COALESCE(json_agg({TASK_JSON} ORDER BY due_date ASC, created_at ASC), '[]')::text
+        FROM tasks
+        WHERE user_id = %(user_id)s
+    """,
+    "task_get": f"SELECT {TASK_JSON}::text FROM tasks WHERE user_id = %(user_id)s AND id = %(task_id)s",
+    "task_exists": "SELECT 1 FROM tasks WHERE user_id = %(user_id)s AND id = %(task_id)s",
+    "task_insert": publishing(f"""
+        INSERT INTO tasks (id, user_id, name, due_date, priority, actionable_items, completion_percent, total_time)
+        VALUES (%(task_id)s, %(user_id)s, %(name)s, %(due_date)s, %(priority)s, %(actionable_items)s::jsonb,
+                %(completion_percent)s, %(total_time)s)
+        RETURNING id::text AS task_id, {TASK_JSON}::text AS body
+    """, "created"),
+    "task_update": TASK_UPDATE,
+    "task_bulk_update": TASK_BULK_UPDATE,
+    "task_delete": publishing("""
+        DELETE FROM tasks WHERE user_id = %(user_id)s AND id = %(task_id)s
+        RETURNING id::text AS task_id, NULL::text AS body
+    """, "deleted"),
+    "task_counts": USER_COUNTS_SQL,
+    # Analytics and history
+    "analytics_summary": SUMMARY_SELECT,
+    "analytics_streak": STREAK_SQL,
+    "analytics_cfd": CFD_SQL,
+    "analytics_dashboard": DASHBOARD_SQL,
+    "analytics_lead_time": LEAD_TIME_SQL,
+    "completed_tasks": f"""
+        SELECT COALESCE(json_agg({COMPLETED_TASK_JSON} ORDER BY completed_at DESC), '[]')::text
+        FROM tasks_all
+        WHERE user_id = %(user_id)s
+            AND completed = true
+            AND completed_at IS NOT NULL
+            AND completed_at >= NOW() - (%(days)s::int) * INTERVAL '1 day'
+    """,
+}
+
+
+def register(name: str, sql: str) -> None:
+    """Add a statement owned by another module (e.g. task_items) to the registry."""
+    existing = STATEMENTS.setdefault(name, sql)
+    if existing != sql:
+        raise ValueError(f"Statement {name!r} is already registered with different SQL")
+
+
+def execute(cur, name: str, params: Dict[str, Any] | None = None):
+    """Run a registered statement (prepared server-side) and record its timing; returns the cursor."""
+    with metrics.timed(f"sql.{name}"):
+        return cur.execute(STATEMENTS[name], params, prepare=PREPARE)
+
+
+def task_update_params(user_id: int, task_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Parameters for TASK_UPDATE from validated {column: value} changes."""
+    params: Dict[str, Any] = dict.fromkeys(TASK_UPDATE_COLUMNS)
+    params.update(changes)
+    if params["actionable_items"] is not None:
+        params["actionable_items"] = dumps_bytes(params["actionable_items"]).decode("utf-8")
+    params["user_id"] = user_id
+    params["task_id"] = task_id
+    return params
+
+
+def task_bulk_params(
+    user_id: int, changes: Dict[str, Any], filters: Dict[str, Any], shift_days: int = 0, return_ids: bool = False
+) -> Dict[str, Any]:
+    """Parameters for TASK_BULK_UPDATE from validated column changes and filters."""
+    params: Dict[str, Any] = dict.fromkeys(TASK_BULK_COLUMNS + TASK_BULK_FILTERS)
+    params.update(changes)
+    params.update(filters)
+    params["user_id"] = user_id
+    params["shift_days"] = shift_days
+    params["return_ids"] = return_ids
+    return params
@@ -0,0 +1,188 @@
+# Due-date scanner: finds open tasks that are due soon or overdue and records one event per task in the
+# `task_outbox` table; a local consumer drains the outbox and publishes the events to SSE subscribers.
+#
+#   python scheduler.py                    # one scan + drain pass, then exit (cron-friendly)
+#   python scheduler.py --batch-size 2000 --due-soon-days 2
+#
+# The scan walks idx_tasks_open_due in (due_date, id) order with keyset pagination, one short read-only
+# batch per transaction; it never locks task rows, so CRUD endpoints don't contend with it. Only the window
+# [today - SCAN_LOOKBACK_DAYS, today + DUE_SOON_DAYS] is scanned, so the cost of a pass is bounded by the
+# tasks near their due date rather than the table size. The outbox's unique key makes re-scans (and several
+# workers scanning at once) idempotent; SKIP LOCKED lets any number of consumers drain concurrently.
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import metrics
+from db import SHARD_DSNS, db_cursor
+from events import publish_task_event
+
+logger = logging.getLogger(__name__)
+
+# Open tasks due within this many days (inclusive of today) get a "due_soon" event
+DUE_SOON_DAYS = int(os.getenv("DUE_SOON_DAYS", "1"))
+# Tasks that became overdue up to this many days ago are still picked up (covers missed runs)
+SCAN_LOOKBACK_DAYS = int(os.getenv("SCAN_LOOKBACK_DAYS", "7"))
+# Rows read per scan transaction / outbox rows claimed per drain transaction
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "1000"))
+# Seconds between background passes; 0 disables the in-process scheduler
+SCAN_INTERVAL_SECONDS = int(os.getenv("SCAN_INTERVAL_SECONDS", "0"))
+
+# Keyset position before every real row: tasks.id is a UUID, so the all-ones value sorts last
+_MAX_UUID = "ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+# One batch: read the next open tasks after the keyset position and enqueue their events.
+# Parameters: after_due, after_id, until, today, limit.
+_SCAN_BATCH = """
+WITH batch AS (
+    SELECT id, user_id, due_date
+    FROM tasks
+    WHERE NOT completed
+      AND (due_date, id) > (%(after_due)s, %(after_id)s::uuid)
+      AND due_date <= %(until)s
+    ORDER BY due_date, id
+    LIMIT %(limit)s
+),
+enqueued AS (
+    INSERT INTO task_outbox (task_id, user_id, kind, due_date)
+    SELECT id, user_id, CASE WHEN due_date < %(today)s THEN 'overdue' ELSE 'due_soon' END, due_date
+    FROM batch
+    ON CONFLICT (task_id, kind, due_date) DO NOTHING
+    RETURNING 1
+),
+last AS (
+    SELECT due_date, id FROM batch ORDER BY due_date DESC, id DESC LIMIT 1
+)
+SELECT (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM enqueued), last.due_date, last.id::text
+FROM (SELECT 1) AS one
+LEFT JOIN last ON TRUE
+"""
+
+# Claim and mark a batch of pending outbox rows; concurrent consumers skip each other's rows.
+_DRAIN_BATCH = """
+WITH claimed AS (
+    SELECT id FROM task_outbox
+    WHERE processed_at IS NULL
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE task_outbox o
+SET processed_at = NOW()
+FROM claimed
+WHERE o.id = claimed.id
+RETURNING o.user_id, o.kind, o.task_id::text
+"""
+
+
+def scan(today: date | None = None, due_soon_days: int = DUE_SOON_DAYS,
+         lookback_days: int = SCAN_LOOKBACK_DAYS, batch_size: int = SCAN_BATCH_SIZE) -> dict:
+    """Scan the due-date window in batches and enqueue outbox events; returns per-run stats."""
+    today = today or date.today()
+    until = today + timedelta(days=due_soon_days)
+    stats = {"scanned": 0, "enqueued": 0, "batches": 0}
+    start = time.perf_counter()
+    for shard in range(len(SHARD_DSNS)):
+        after_due, after_id = today - timedelta(days=lookback_days + 1), _MAX_UUID
+        while True:
+            with metrics.timed("scheduler.scan_batch"), db_cursor(shard=shard) as cur:
+                cur.execute(_SCAN_BATCH, {"after_due": after_due, "after_id": after_id, "until": until,
+                                          "today": today, "limit": batch_size})
+                scanned, enqueued, last_due, last_id = cur.fetchone()
+            stats["batches"] += 1
+            stats["scanned"] += scanned
+            stats["enqueued"] += enqueued
+            if scanned < batch_size:
+                break
+            after_due, after_id = last_due, last_id
+    return _finish("scan", stats, start)
+
+
+def drain(batch_size: int = SCAN_BATCH_SIZE) -> dict:
+    """Publish pending outbox events as task events (same transaction as marking them processed)."""
+    stats = {"delivered": 0, "batches": 0}
+    start = time.perf_counter()
+    for shard in range(len(SHARD_DSNS)):
+        while True:
+            with metrics.timed("scheduler.drain_batch"), db_cursor(shard=shard) as cur:
+                cur.execute(_DRAIN_BATCH, (batch_size,))
+                rows = cur.fetchall()
+                for user_id, kind, task_id in rows:
+                    publish_task_event(cur, user_id, kind, task_id)
+            stats["batches"] += 1
+            stats["delivered"] += len(rows)
+            if len(rows) < batch_size:
+                break
+    return _finish("drain", stats, start)
+
+
+def prune(today: date | None = None, lookback_days: int = SCAN_LOOKBACK_DAYS) -> int:
+    """Drop processed outbox rows that fell out of the scan window (no longer needed for de-duplication)."""
+    today = today or date.today()
+    pruned = 0
+    for shard in range(len(SHARD_DSNS)):
+        with db_cursor(shard=shard) as cur:
+            cur.execute(
+                "DELETE FROM task_outbox WHERE processed_at IS NOT NULL AND due_date < %s",
+                (today - timedelta(days=lookback_days + 1),),
+            )
+            pruned += cur.rowcount
+    return pruned
+
+
+def _finish(phase: str, stats: dict, start: float) -> dict:
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    rows = stats.get("scanned", stats.get("delivered", 0))
+    stats["rows_per_second"] = round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    metrics.observe(f"scheduler.{phase}", elapsed)
+    for key in ("scanned", "enqueued", "delivered"):
+        if key in stats:
+            metrics.incr(f"scheduler.{key}", stats[key])
+    return stats
+
+
+def run_once() -> dict:
+    """One full pass: scan, drain, prune."""
+    return {"scan": scan(), "drain": drain(), "pruned": prune()}
+
+
+_scheduler_pid: int | None = None
+
+
+def ensure_background_scheduler() -> None:
+    """Start the periodic scan/drain thread in this process (no-op if disabled or already running)."""
+    global _scheduler_pid
+    if SCAN_INTERVAL_SECONDS <= 0 or _scheduler_pid == os.getpid():
+        return
+    _scheduler_pid = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                result = run_once()
+                if result["scan"]["enqueued"] or result["drain"]["delivered"]:
+                    logger.info("Due-date scan: %s", result)
+            except Exception:
+                logger.exception("Due-date scheduler pass failed")
+            time.sleep(SCAN_INTERVAL_SECONDS)
+
+    threading.Thread(target=loop, name="due-date-scheduler", daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan tasks for due-soon/overdue events and drain the outbox.")
+    parser.add_argument("--batch-size", type=int, default=SCAN_BATCH_SIZE)
+    parser.add_argument("--due-soon-days", type=int, default=DUE_SOON_DAYS)
+    parser.add_argument("--lookback-days", type=int, default=SCAN_LOOKBACK_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print("scan:", scan(due_soon_days=args.due_soon_days, lookback_days=args.lookback_days, batch_size=args.batch_size))
+    print("drain:", drain(args.batch_size))
+    print("pruned:", prune(lookback_days=args.lookback_days))
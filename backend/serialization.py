@@ -0,0 +1,81 @@
+# Shared JSON serialization: orjson-backed Flask JSON provider plus SQL-side row-to-JSON for task rows.
+# Task rows are rendered to JSON text by Postgres (json_build_object/json_agg) and written to the
+# response as-is, so hot list/create/update paths never build per-row Python dicts.
+
+from __future__ import annotations
+
+# Decimal values from NUMERIC aggregates are not natively supported by orjson
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from flask import current_app
+from flask.json.provider import JSONProvider
+
+import tracing
+
+# Postgres expression producing the public task JSON object for one `tasks` row.
+# DATE columns render as "YYYY-MM-DD", matching the previous .isoformat() output.
+TASK_JSON = """json_build_object(
+    'id', id::text,
+    'name', name,
+    'dueDate', due_date,
+    'priority', priority,
+    'completed', completed,
+    'actionableItems', COALESCE(actionable_items, '[]'::jsonb),
+    'actionableDone', COALESCE(actionable_done, '[]'::jsonb),
+    'completionPercent', completion_percent,
+    'totalTime', COALESCE(total_time, 1)
+)"""
+
+# Postgres expression producing the completed-task history JSON object for one `tasks` row.
+COMPLETED_TASK_JSON = """json_build_object(
+    'id', id::text,
+    'name', name,
+    'dueDate', due_date,
+    'priority', priority,
+    'completedAt', completed_at,
+    'onTime', DATE(completed_at) <= due_date
+)"""
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode to UTF-8 JSON bytes with orjson (dates/datetimes/UUIDs handled natively)."""
+    with tracing.span("serialize.json"):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+def loads(data: str | bytes) -> Any:
+    return orjson.loads(data)
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider so jsonify() and request.get_json() both go through orjson."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
+
+
+def raw_json_response(body: str | bytes, status: int = 200):
+    """Wrap JSON text already produced by the database in a response without re-encoding it."""
+    with tracing.span("serialize.response", **{"response.bytes": len(body)}):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return current_app.response_class(body, status=status, mimetype="application/json")
@@ -0,0 +1,316 @@
+# Hash-sharded users: each user's row, tasks, archive, counters, outbox and report jobs live in exactly one
+# shard database (db.SHARD_DSNS), so write throughput grows with the number of primaries.
+#
+#   python shards.py status                     # users per shard
+#   python shards.py move <user_id> <shard>     # move one user's data to another shard, online
+#   python shards.py rebalance --limit 1000     # move users whose hash placement changed (after adding shards)
+#
+# Shard 0 holds the user directory (user_directory: user_id, username -> shard, state) and allocates user
+# ids from its users_id_seq, so ids are unique across shards. New users are placed by a hash of their id;
+# the directory records the placement, so adding shards never moves anyone implicitly. Processes cache
+# directory entries for SHARD_MAP_TTL_SECONDS. With a single shard (the default) nothing is looked up.
+#
+# Moving a user: the directory marks them "moving", which makes db_cursor(user_id) refuse writes for that
+# user (503 + Retry-After) once every process has refreshed its cache, while reads continue from the source.
+# Their rows are then copied, the directory is flipped to the target, and the source copy is deleted after
+# another cache interval. Other users are unaffected; the moved user's writes pause for roughly
+# 2 * (SHARD_MAP_TTL_SECONDS + SHARD_MOVE_GRACE_SECONDS) plus the copy time.
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from typing import Dict, Iterable
+
+import psycopg
+from flask import jsonify
+
+import db
+import metrics
+from archive import ensure_partitions
+from events import publish_task_event
+
+logger = logging.getLogger(__name__)
+
+# How long a process trusts a cached directory entry
+SHARD_MAP_TTL_SECONDS = float(os.getenv("SHARD_MAP_TTL_SECONDS", "10"))
+# Extra wait during moves for transactions that started before the map change (above the crud budget)
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv("SHARD_MOVE_GRACE_SECONDS", "5"))
+# Cached directory entries per process before the cache is reset wholesale
+MAX_CACHED_USERS = 100_000
+# Event ids reserve 8 bits for the shard (see next_task_event_id in db.py)
+MAX_SHARDS = 256
+# Seconds clients are told to wait while their data is being moved
+RETRY_AFTER_SECONDS = 5
+
+# Per-user tables copied by a move, parents first (deleting the users row cascades to all but task_outbox)
+MOVED_TABLES = ("users", "tasks", "tasks_archive", "report_jobs", "task_outbox")
+# Serial keys the target assigns itself (copying them would collide with its own sequence)
+FRESH_KEY_COLUMNS = {"task_outbox": "id"}
+
+if len(db.SHARD_DSNS) > MAX_SHARDS:
+    raise RuntimeError(f"At most {MAX_SHARDS} shards are supported, got {len(db.SHARD_DSNS)}")
+
+# Knuth multiplicative hash of the id modulo the shard count, so consecutive ids spread evenly.
+# placement() is the same formula in Python.
+_ALLOCATE = """
+INSERT INTO user_directory (user_id, username, shard)
+SELECT id, %(username)s, (id * 2654435761 %% 4294967296) %% %(shards)s
+FROM (SELECT nextval('users_id_seq') AS id) AS new_id
+ON CONFLICT (username) DO NOTHING
+RETURNING user_id, shard
+"""
+
+# user_id -> (fetched_at monotonic, shard, state)
+_cache: Dict[int, tuple[float, int, str]] = {}
+
+
+class UserMoving(Exception):
+    """The user's data is being moved between shards; writes must wait."""
+
+
+def sharded() -> bool:
+    return len(db.SHARD_DSNS) > 1
+
+
+def placement(user_id: int, shards: int | None = None) -> int:
+    """Hash placement of a user id over `shards` shards (defaults to the configured count)."""
+    return (user_id * 2654435761 % 4294967296) % (shards or len(db.SHARD_DSNS))
+
+
+def _lookup(user_id: int) -> tuple[int, str]:
+    now = time.monotonic()
+    entry = _cache.get(user_id)
+    if entry is not None and now - entry[0] < SHARD_MAP_TTL_SECONDS:
+        return entry[1], entry[2]
+    with db.db_cursor(shard=0) as cur:
+        cur.execute("SELECT shard, state FROM user_directory WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+    metrics.incr("shards.directory_lookup")
+    # Unknown ids (no such user) resolve to their hash placement, where they won't be found either
+    shard, state = row if row else (placement(user_id), "active")
+    if len(_cache) >= MAX_CACHED_USERS:
+        _cache.clear()
+    _cache[user_id] = (now, shard, state)
+    return shard, state
+
+
+def shard_for(user_id: int, writing: bool = True) -> int:
+    """Shard holding the user's data; raises UserMoving for writes while the user is being moved."""
+    if not sharded():
+        return 0
+    shard, state = _lookup(user_id)
+    if writing and state == "moving":
+        metrics.incr("shards.moving_rejected")
+        raise UserMoving(user_id)
+    return shard
+
+
+def allocate_user(username: str) -> tuple[int, int] | None:
+    """Reserve a globally unique id and a shard for a new username; None if the name is taken."""
+    with db.db_cursor(shard=0) as cur:
+        cur.execute(_ALLOCATE, {"username": username, "shards": len(db.SHARD_DSNS)})
+        return cur.fetchone()
+
+
+def release_user(user_id: int) -> None:
+    """Undo allocate_user() when creating the user's row on its shard failed."""
+    with db.db_cursor(shard=0) as cur:
+        cur.execute("DELETE FROM user_directory WHERE user_id = %s", (user_id,))
+
+
+def locate_username(username: str) -> int | None:
+    """User id for a username from the directory (for login)."""
+    with db.db_cursor(shard=0) as cur:
+        cur.execute("SELECT user_id FROM user_directory WHERE username = %s", (username,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def init_app(app) -> None:
+    """Answer requests for users that are being moved with 503 + Retry-After."""
+
+    @app.errorhandler(UserMoving)
+    def _user_moving(exc):
+        response = jsonify({"message": "Your data is being moved. Please try again in a few seconds."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+        return response
+
+
+# ----- Moving users between shards (CLI) -----
+
+def _columns(conn: psycopg.Connection, table: str) -> list[str]:
+    rows = conn.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = %s AND table_schema = current_schema() "
+        "ORDER BY ordinal_position",
+        (table,),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _copy_user(user_id: int, source: int, target: int) -> dict:
+    # Stream the user's rows from source to target with binary COPY, in one target transaction.
+    # Column lists are explicit because ALTER TABLE migrations can leave shards with different column order.
+    copied = {}
+    key = {table: "user_id" for table in MOVED_TABLES}
+    key["users"] = "id"
+    with psycopg.connect(db.SHARD_DSNS[source]) as src, psycopg.connect(db.SHARD_DSNS[target]) as dst:
+        with dst.cursor() as cur:
+            span = src.execute(
+                "SELECT min(completed_at)::date, max(completed_at)::date FROM tasks_archive WHERE user_id = %s",
+                (user_id,),
+            ).fetchone()
+            if span[0] is not None:
+                ensure_partitions(cur, span[0], span[1])
+            for table in MOVED_TABLES:
+                cols = ", ".join(c for c in _columns(src, table) if c != FRESH_KEY_COLUMNS.get(table))
+                with src.cursor().copy(
+                    f"COPY (SELECT {cols} FROM {table} WHERE {key[table]} = {int(user_id)}) TO STDOUT (FORMAT BINARY)"
+                ) as out, cur.copy(f"COPY {table} ({cols}) FROM STDIN (FORMAT BINARY)") as inp:
+                    for chunk in out:
+                        inp.write(chunk)
+                copied[table] = cur.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE {key[table]} = %s", (user_id,)
+                ).fetchone()[0]
+            # Counters were rebuilt by the target's triggers; the list version carries over so clients
+            # never see an earlier version again
+            version = src.execute(
+                "SELECT list_version FROM task_counters WHERE user_id = %s", (user_id,)
+            ).fetchone()
+            if version is not None:
+                cur.execute(
+                    "INSERT INTO task_counters AS c (user_id, list_version) VALUES (%s, %s) "
+                    "ON CONFLICT (user_id) DO UPDATE SET list_version = EXCLUDED.list_version",
+                    (user_id, version[0]),
+                )
+        dst.commit()
+    return copied
+
+
+def _delete_user(shard: int, user_id: int) -> None:
+    # Removes the user's rows on one shard (tasks, archive and report jobs cascade; triggers fix the counters)
+    with db.db_cursor(shard=shard) as cur:
+        cur.execute("DELETE FROM task_outbox WHERE user_id = %s", (user_id,))
+        cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+
+def move_users(moves: Dict[int, int], wait: float | None = None) -> list[dict]:
+    """
+    Move users to target shards ({user_id: shard}); returns one result per user.
+
+    Users are fenced together, so a batch waits for the cache intervals only twice in total.
+    A user whose copy fails is marked active on its source shard again.
+    """
+    wait = SHARD_MAP_TTL_SECONDS + SHARD_MOVE_GRACE_SECONDS if wait is None else wait
+    sources: Dict[int, int] = {}
+    with db.db_cursor(shard=0) as cur:
+        for user_id, target in moves.items():
+            if not 0 <= target < len(db.SHARD_DSNS):
+                raise ValueError(f"No shard {target}")
+            cur.execute(
+                "UPDATE user_directory SET state = 'moving' "
+                "WHERE user_id = %s AND state = 'active' AND shard <> %s RETURNING shard",
+                (user_id, target),
+            )
+            row = cur.fetchone()
+            if row is not None:
+                sources[user_id] = row[0]
+    results = [{"user_id": u, "moved": False, "reason": "not found, already moving or already there"}
+               for u in moves if u not in sources]
+    if not sources:
+        return results
+
+    # Every process now refuses writes for these users, and transactions begun before the fence are done
+    time.sleep(wait)
+    moved: Dict[int, dict] = {}
+    for user_id, source in sources.items():
+        target = moves[user_id]
+        try:
+            moved[user_id] = _copy_user(user_id, source, target)
+        except Exception as e:
+            logger.exception("Copying user %s from shard %s to %s failed", user_id, source, target)
+            try:
+                _delete_user(target, user_id)
+            except Exception:
+                logger.exception("Cleaning up user %s on shard %s failed", user_id, target)
+            results.append({"user_id": user_id, "moved": False, "reason": type(e).__name__})
+
+    with db.db_cursor(shard=0) as cur:
+        for user_id in sources:
+            if user_id in moved:
+                cur.execute(
+                    "UPDATE user_directory SET shard = %s, state = 'active', moved_at = NOW() WHERE user_id = %s",
+                    (moves[user_id], user_id),
+                )
+            else:
+                cur.execute("UPDATE user_directory SET state = 'active' WHERE user_id = %s", (user_id,))
+    for user_id in moved:
+        # Open task lists refetch from the new shard (and per-process caches drop the user)
+        with db.db_cursor(shard=moves[user_id]) as cur:
+            publish_task_event(cur, user_id, "bulk", None)
+
+    # Readers still on the old map entry keep reading the (unchanged) source copy until it expires
+    time.sleep(wait)
+    for user_id, copied in moved.items():
+        _delete_user(sources[user_id], user_id)
+        metrics.incr("shards.moved")
+        results.append({"user_id": user_id, "moved": True, "from": sources[user_id], "to": moves[user_id], "rows": copied})
+    return results
+
+
+def misplaced(limit: int) -> Dict[int, int]:
+    """Users whose directory shard differs from their hash placement over the current shard count."""
+    with db.db_cursor(shard=0) as cur:
+        cur.execute("SELECT user_id, shard FROM user_directory WHERE state = 'active' ORDER BY user_id")
+        moves: Dict[int, int] = {}
+        for user_id, shard in cur:
+            target = placement(user_id)
+            if target != shard:
+                moves[user_id] = target
+                if len(moves) >= limit:
+                    break
+    return moves
+
+
+def status() -> Dict[int, dict]:
+    with db.db_cursor(shard=0) as cur:
+        cur.execute("SELECT shard, state, COUNT(*) FROM user_directory GROUP BY shard, state ORDER BY shard, state")
+        result: Dict[int, dict] = {i: {} for i in range(len(db.SHARD_DSNS))}
+        for shard, state, count in cur.fetchall():
+            result.setdefault(shard, {})[state] = count
+    return result
+
+
+def _batches(items: Dict[int, int], size: int) -> Iterable[Dict[int, int]]:
+    keys = list(items)
+    for i in range(0, len(keys), size):
+        yield {k: items[k] for k in keys[i:i + size]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and rebalance user shards.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="users per shard")
+    move = sub.add_parser("move", help="move one user to a shard")
+    move.add_argument("user_id", type=int)
+    move.add_argument("shard", type=int)
+    rebalance = sub.add_parser("rebalance", help="move users to their hash placement")
+    rebalance.add_argument("--limit", type=int, default=1000)
+    rebalance.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "status":
+        for shard, counts in status().items():
+            print(f"shard {shard}: {counts}")
+    elif args.command == "move":
+        print(move_users({args.user_id: args.shard}))
+    else:
+        pending = misplaced(args.limit)
+        print(f"{len(pending)} users to move")
+        for batch in _batches(pending, args.batch_size):
+            for result in move_users(batch):
+                print(result)
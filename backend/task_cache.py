@@ -0,0 +1,127 @@
+# Per-process cache of each user's serialized task list (the GET /api/tasks body), bounded by total bytes
+# with LRU eviction. Entries are dropped by the task event listener (events.py): every task write path
+# publishes a NOTIFY, which reaches the listener in every worker on every node within milliseconds.
+#
+# Correctness rules:
+#   * the cache is bypassed while this process's LISTEN connection is down, and entries filled under an
+#     earlier listener connection are ignored (events published in between were never seen);
+#   * a fill only lands if no invalidation for that user arrived while the query was running;
+#   * a session that wrote within CACHE_FRESH_SECONDS reads from the database, so its own write is visible
+#     even before the NOTIFY arrives;
+#   * entries expire after TASK_CACHE_TTL_SECONDS as a backstop.
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from events import broker
+
+# Total bytes of cached bodies per process; 0 disables the cache
+TASK_CACHE_MAX_BYTES = int(os.getenv("TASK_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Bodies larger than this share of the budget are never cached
+MAX_ENTRY_FRACTION = 0.25
+TASK_CACHE_TTL_SECONDS = float(os.getenv("TASK_CACHE_TTL_SECONDS", "300"))
+# Sessions that wrote this recently bypass the cache (read-your-writes across workers)
+CACHE_FRESH_SECONDS = float(os.getenv("TASK_CACHE_FRESH_SECONDS", "2"))
+# Event types that don't change the task list
+IGNORED_EVENTS = {"due_soon", "overdue"}
+# Per-user invalidation counters kept before they are reset wholesale
+MAX_TRACKED_USERS = 100_000
+
+
+class TaskListCache:
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # user_id -> (body, stored_at monotonic, listener epoch)
+        self._entries: OrderedDict[int, tuple[bytes, float, int]] = OrderedDict()
+        self._bytes = 0
+        # user_id -> invalidation count; a fill started before an invalidation is discarded
+        self._generations: dict[int, int] = {}
+        # Bumped by clear(); tickets from before a clear are stale
+        self._clears = 0
+
+    def usable(self, last_write_at: float | None = None) -> bool:
+        if self.max_bytes <= 0:
+            return False
+        if last_write_at is not None and time.time() - last_write_at < CACHE_FRESH_SECONDS:
+            return False
+        broker.ensure_listener()
+        return broker.is_connected()
+
+    def get(self, user_id: int) -> bytes | None:
+        epoch = broker.epoch()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                metrics.incr("task_cache.miss")
+                return None
+            body, stored_at, entry_epoch = entry
+            if entry_epoch != epoch or time.monotonic() - stored_at > self.ttl:
+                self._drop(user_id)
+                metrics.incr("task_cache.miss")
+                return None
+            self._entries.move_to_end(user_id)
+        metrics.incr("task_cache.hit")
+        return body
+
+    def ticket(self, user_id: int) -> tuple[int, int, int]:
+        """Taken before querying; put() only stores if nothing invalidated the user since."""
+        with self._lock:
+            return self._clears, broker.epoch(), self._generations.get(user_id, 0)
+
+    def put(self, user_id: int, body: bytes, ticket: tuple[int, int, int]) -> None:
+        if len(body) > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            if ticket != (self._clears, broker.epoch(), self._generations.get(user_id, 0)):
+                metrics.incr("task_cache.stale_fill")
+                return
+            self._drop(user_id)
+            self._entries[user_id] = (body, time.monotonic(), ticket[1])
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                metrics.incr("task_cache.evict")
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            if len(self._generations) >= MAX_TRACKED_USERS:
+                self._clear_locked()
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._drop(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def on_event(self, payload: dict) -> None:
+        """Task event hook: drop the user's cached list."""
+        if payload.get("type") in IGNORED_EVENTS:
+            return
+        self.invalidate(int(payload["user"]))
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._generations.clear()
+        self._bytes = 0
+        self._clears += 1
+
+    def _drop(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+task_cache = TaskListCache(TASK_CACHE_MAX_BYTES, TASK_CACHE_TTL_SECONDS)
+broker.add_hook(task_cache.on_event)
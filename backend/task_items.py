@@ -0,0 +1,106 @@
+# Item-level actionable-item operations (add, edit/check, toggle, remove, reorder) as single JSONB updates.
+# `actionable_items` holds the item texts and `actionable_done` the aligned checked flags; each operation
+# rewrites only those two arrays in one statement and re-derives completion_percent inside Postgres; the
+# same statement bumps the list version and publishes the task event (queries.publishing).
+
+from __future__ import annotations
+
+import queries
+from serialization import TASK_JSON
+
+# Current row, locked, with the done-flags padded/truncated to the item count (older rows store '[]').
+# Parameters: user_id, task_id.
+_CURRENT = """
+cur AS (
+    SELECT
+        t.id AS task_id,
+        t.actionable_items AS items,
+        (
+            SELECT COALESCE(jsonb_agg(COALESCE(t.actionable_done -> (n - 1), 'false'::jsonb) ORDER BY n), '[]'::jsonb)
+            FROM generate_series(1, jsonb_array_length(t.actionable_items)) AS n
+        ) AS done
+    FROM tasks t
+    WHERE t.user_id = %(user_id)s AND t.id = %(task_id)s
+    FOR UPDATE
+)
+"""
+
+# Move element `from_index` to `to_index` (0-based) by sorting on a fractional key.
+_REORDER = """(
+    SELECT COALESCE(jsonb_agg(e ORDER BY
+        CASE WHEN n - 1 = %(from_index)s
+            THEN %(to_index)s + CASE WHEN %(from_index)s < %(to_index)s THEN 0.5 ELSE -0.5 END
+            ELSE n - 1
+        END), '[]'::jsonb)
+    FROM jsonb_array_elements({array}) WITH ORDINALITY AS x(e, n)
+)"""
+
+# operation -> (new items expression, new done expression, guard on the current row)
+OPERATIONS = {
+    "add": (
+        "items || jsonb_build_array(%(text)s::text)",
+        "done || '[false]'::jsonb",
+        "true",
+    ),
+    "set": (
+        "CASE WHEN %(text)s::text IS NULL THEN items ELSE jsonb_set(items, ARRAY[%(index)s::text], to_jsonb(%(text)s::text)) END",
+        "CASE WHEN %(done)s::boolean IS NULL THEN done ELSE jsonb_set(done, ARRAY[%(index)s::text], to_jsonb(%(done)s::boolean)) END",
+        "%(index)s < jsonb_array_length(items)",
+    ),
+    "toggle": (
+        "items",
+        "jsonb_set(done, ARRAY[%(index)s::text], to_jsonb(NOT (done ->> %(index)s::int)::boolean))",
+        "%(index)s < jsonb_array_length(items)",
+    ),
+    "remove": (
+        "items - %(index)s::int",
+        "done - %(index)s::int",
+        # At least one actionable item must remain
+        "%(index)s < jsonb_array_length(items) AND jsonb_array_length(items) > 1",
+    ),
+    "reorder": (
+        _REORDER.format(array="items"),
+        _REORDER.format(array="done"),
+        "%(from_index)s < jsonb_array_length(items) AND %(to_index)s < jsonb_array_length(items)",
+    ),
+}
+
+
+def _statement(operation: str) -> str:
+    items_expr, done_expr, guard = OPERATIONS[operation]
+    return queries.publishing(f"""
+    UPDATE tasks
+    SET actionable_items = next.new_items,
+        actionable_done = next.new_done,
+        completion_percent = (
+            SELECT COALESCE(ROUND(100.0 * COUNT(*) FILTER (WHERE d = 'true'::jsonb) / NULLIF(COUNT(*), 0)), 0)::int
+            FROM jsonb_array_elements(next.new_done) AS d
+        )
+    FROM next
+    WHERE tasks.id = next.task_id
+    RETURNING tasks.id::text AS task_id, {TASK_JSON}::text AS body
+    """, "updated", ctes=f"""{_CURRENT},
+    next AS (
+        SELECT task_id, {items_expr} AS new_items, {done_expr} AS new_done
+        FROM cur
+        WHERE {guard}
+    ),
+    """)
+
+
+STATEMENTS = {name: _statement(name) for name in OPERATIONS}
+for _name, _sql in STATEMENTS.items():
+    queries.register(f"item_{_name}", _sql)
+
+
+def apply_item_operation(cur, user_id: int, task_id: str, operation: str, **params) -> tuple[str, int] | None:
+    """
+    Run one item operation and queue its task event; returns the updated task JSON and the list version,
+    or None if the task is missing or the operation's guard failed (index out of range, last item, ...).
+    """
+    values = {"user_id": user_id, "task_id": task_id, "text": None, "done": None, "index": 0,
+              "from_index": 0, "to_index": 0}
+    values.update(params)
+    queries.execute(cur, f"item_{operation}", values)
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else None
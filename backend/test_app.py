@@ -271,3 +271,894 @@ class TestTaskCompletion:
         assert response.status_code == 200
         updated_task = json.loads(response.data)
         assert updated_task['completed'] is False
+
+
+class TestTaskEvents:
+    """Test the live task event stream."""
+
+    def test_task_events_unauthorized(self, client):
+        """Test the event stream requires authentication."""
+        response = client.get('/api/tasks/events')
+        assert response.status_code == 401
+
+    def test_task_events_content_type(self, logged_in_client):
+        """Test the event stream is served as text/event-stream."""
+        response = logged_in_client.get('/api/tasks/events')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        response.close()
+
+    def _broker(self, monkeypatch):
+        from events import TaskEventBroker
+        broker = TaskEventBroker()
+        monkeypatch.setattr(broker, 'ensure_listener', lambda: None)
+        return broker
+
+    def _event(self, event_id, user_id=1):
+        return json.dumps({
+            'id': event_id, 'user': user_id, 'type': 'updated', 'taskId': 't', 'task': {'name': 'x' * 100},
+        })
+
+    def test_replay_follows_arrival_order(self, monkeypatch):
+        """Test resume replays events that arrived after the last one seen, even with a smaller id."""
+        broker = self._broker(monkeypatch)
+        first = broker.subscribe(1)
+        # Id 100 was taken first but committed after 101
+        broker.dispatch(self._event(101))
+        broker.dispatch(self._event(100))
+        broker.unsubscribe(first)
+        sub = broker.subscribe(1, last_event_id=101)
+        event_id, _, data = sub.queue.get_nowait()
+        assert event_id == 100
+        # Replayed events are id-only; the live stream carried the task
+        assert 'task' not in json.loads(data)
+        assert sub.queue.empty()
+
+    def test_unknown_last_event_id_resets(self, monkeypatch):
+        """Test resuming from an event this process doesn't hold tells the client to refetch."""
+        broker = self._broker(monkeypatch)
+        broker.subscribe(1)
+        broker.dispatch(self._event(5))
+        sub = broker.subscribe(1, last_event_id=3)
+        assert sub.queue.get_nowait()[1] == 'reset'
+
+    def test_replay_kept_only_for_subscribed_users(self, monkeypatch):
+        """Test events for users without a recent stream on this worker aren't buffered."""
+        import events
+        broker = self._broker(monkeypatch)
+        broker.dispatch(self._event(1, user_id=7))
+        assert 7 not in broker._recent
+        sub = broker.subscribe(8)
+        broker.unsubscribe(sub)
+        monkeypatch.setattr(events, 'REPLAY_LINGER_SECONDS', 0)
+        broker.dispatch(self._event(2, user_id=8))
+        assert 8 not in broker._recent
+
+    def test_replay_buffers_are_capped_per_user(self, monkeypatch):
+        """Test the least recently active user's replay ring is evicted past SSE_REPLAY_USERS."""
+        import events
+        monkeypatch.setattr(events, 'REPLAY_USERS', 2)
+        broker = self._broker(monkeypatch)
+        for user_id in (1, 2, 3):
+            broker.subscribe(user_id)
+        broker.dispatch(self._event(1, user_id=1))
+        broker.dispatch(self._event(2, user_id=2))
+        broker.dispatch(self._event(3, user_id=1))
+        broker.dispatch(self._event(4, user_id=3))
+        assert list(broker._recent) == [1, 3]
+        assert broker.subscribe(2, last_event_id=2).queue.get_nowait()[1] == 'reset'
+
+    def test_task_events_busy_when_streams_exhausted(self, logged_in_client, monkeypatch):
+        """Test a worker at its stream cap answers with a reconnect delay instead of holding a thread."""
+        import threading
+        import events
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        monkeypatch.setattr(events, '_stream_slots', slots)
+        response = logged_in_client.get('/api/tasks/events')
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == events.sse_busy()
+        assert events.sse_busy() == f'retry: {events.BUSY_RETRY_MS}\n\n'
+
+    def test_closing_a_stream_frees_its_slot(self, logged_in_client, monkeypatch):
+        """Test the stream slot is released when the response is closed."""
+        import threading
+        import events
+        monkeypatch.setattr(events, '_stream_slots', threading.BoundedSemaphore(1))
+        response = logged_in_client.get('/api/tasks/events')
+        assert not events.acquire_stream_slot()
+        response.close()
+        assert events.acquire_stream_slot()
+        events.release_stream_slot()
+
+
+class TestResponseCompression:
+    """Test negotiated response compression."""
+
+    def test_large_response_is_gzipped(self, logged_in_client):
+        """Test a large JSON body is compressed when the client accepts gzip."""
+        import gzip
+        response = logged_in_client.get('/api/analytics/cfd?days=90', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers.get('Content-Encoding') == 'gzip'
+        data = json.loads(gzip.decompress(response.data))
+        assert len(data) == 90
+
+    def test_small_response_is_not_compressed(self, client):
+        """Test bodies under the size threshold are sent uncompressed."""
+        response = client.get('/api/me', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+
+class TestDashboardEndpoint:
+    """Test the combined dashboard endpoint."""
+
+    def test_dashboard_unauthorized(self, client):
+        """Test dashboard requires authentication."""
+        response = client.get('/api/analytics/dashboard')
+        assert response.status_code == 401
+
+    def test_dashboard_nests_existing_shapes(self, logged_in_client):
+        """Test dashboard returns summary, cfd and streak in their usual shapes."""
+        response = logged_in_client.get('/api/analytics/dashboard?days=7')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert 'on_time_rate' in data['summary']
+        assert data['summary']['time_window_days'] == 7
+        assert len(data['cfd']) == 7
+        assert 'on_time_streak_days' in data['streak']
+
+
+class TestAdmissionControl:
+    """Test rate limiting and window clamping."""
+
+    def test_login_burst_is_rate_limited(self, client):
+        """Test repeated logins past the burst get 429 with Retry-After."""
+        app.config['ADMISSION_ENABLED'] = True
+        try:
+            statuses = [
+                client.post('/api/login', json={'username': '', 'password': ''}).status_code
+                for _ in range(30)
+            ]
+            response = client.post('/api/login', json={'username': '', 'password': ''})
+        finally:
+            app.config.pop('ADMISSION_ENABLED')
+        assert 429 in statuses
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+
+    def test_limits_are_split_between_workers(self, monkeypatch):
+        """Test deployment-wide limits are divided by the worker count, never below one request."""
+        import admission
+        monkeypatch.setattr(admission, 'WORKER_COUNT', 4)
+        monkeypatch.setenv('ADMISSION_CRUD_BURST', '60')
+        monkeypatch.setenv('ADMISSION_AUTH_BURST', '2')
+        assert admission._per_worker('ADMISSION_CRUD_BURST', 60) == 15
+        assert admission._per_worker('ADMISSION_AUTH_BURST', 10) == 1
+        assert admission._rate_per_worker('ADMISSION_CRUD_RATE', 20) == 5
+
+    def test_forwarded_client_address_with_trusted_proxy(self):
+        """Test anonymous clients are keyed on X-Forwarded-For only when a proxy is trusted."""
+        import admission
+        from flask import Flask, request
+
+        def remote_addr(proxies):
+            proxied = Flask(__name__)
+            proxied.config['TRUSTED_PROXIES'] = proxies
+            admission.init_app(proxied)
+            proxied.add_url_rule('/addr', 'addr', lambda: request.remote_addr)
+            response = proxied.test_client().get('/addr', headers={'X-Forwarded-For': '203.0.113.7'})
+            return response.get_data(as_text=True)
+
+        assert remote_addr(1) == '203.0.113.7'
+        assert remote_addr(0) == '127.0.0.1'
+
+    def test_cfd_window_is_clamped(self, logged_in_client):
+        """Test an oversized days parameter is clamped instead of scanned."""
+        response = logged_in_client.get('/api/analytics/cfd?days=3650')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert len(data) <= 366
+
+
+class TestActionableItems:
+    """Test item-level actionable item operations."""
+
+    def _create(self, client, items):
+        response = client.post('/api/tasks', json={
+            'name': 'Item Task',
+            'dueDate': '2099-12-31',
+            'priority': 'P2',
+            'actionableItems': items,
+        })
+        return json.loads(response.data)['id']
+
+    def test_toggle_updates_completion_percent(self, logged_in_client):
+        """Test toggling one of two items yields 50% completion."""
+        task_id = self._create(logged_in_client, ['a', 'b'])
+        response = logged_in_client.post(f'/api/tasks/{task_id}/items/0/toggle')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['actionableDone'] == [True, False]
+        assert data['completionPercent'] == 50
+
+    def test_add_remove_and_reorder(self, logged_in_client):
+        """Test add, reorder and remove keep items and flags aligned."""
+        task_id = self._create(logged_in_client, ['a', 'b'])
+        logged_in_client.post(f'/api/tasks/{task_id}/items', json={'text': 'c'})
+        logged_in_client.post(f'/api/tasks/{task_id}/items/2/toggle')
+        response = logged_in_client.post(f'/api/tasks/{task_id}/items/reorder', json={'from': 2, 'to': 0})
+        data = json.loads(response.data)
+        assert data['actionableItems'] == ['c', 'a', 'b']
+        assert data['actionableDone'] == [True, False, False]
+        response = logged_in_client.delete(f'/api/tasks/{task_id}/items/0')
+        data = json.loads(response.data)
+        assert data['actionableItems'] == ['a', 'b']
+        assert data['completionPercent'] == 0
+
+    def test_patch_item_list_keeps_unchanged_flags(self, logged_in_client):
+        """Test PATCHing a whole item list keeps done flags for unchanged items and resets changed ones."""
+        task_id = self._create(logged_in_client, ['a', 'b', 'c'])
+        logged_in_client.post(f'/api/tasks/{task_id}/items/0/toggle')
+        logged_in_client.post(f'/api/tasks/{task_id}/items/2/toggle')
+        response = logged_in_client.patch(f'/api/tasks/{task_id}', json={'actionableItems': ['a', 'edited', 'c']})
+        assert response.status_code == 200
+        assert json.loads(response.data)['actionableDone'] == [True, False, True]
+        response = logged_in_client.patch(f'/api/tasks/{task_id}', json={'actionableItems': ['c', 'edited', 'a']})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['actionableItems'] == ['c', 'edited', 'a']
+        assert data['actionableDone'] == [False, False, False]
+
+    def test_cannot_remove_last_item(self, logged_in_client):
+        """Test the last remaining item cannot be removed."""
+        task_id = self._create(logged_in_client, ['only'])
+        response = logged_in_client.delete(f'/api/tasks/{task_id}/items/0')
+        assert response.status_code == 400
+
+
+class TestWriteCoalescer:
+    """Test PATCH coalescing: batching, failed flushes and the read overlay."""
+
+    def test_changes_to_one_task_are_batched(self):
+        """Test several submissions inside the window are written as one merged call."""
+        import time
+        from coalesce import WriteCoalescer
+        calls = []
+        coalescer = WriteCoalescer(0.05, lambda user_id, task_id, changes: calls.append((task_id, changes)))
+        coalescer.submit(1, 't', {'completion_percent': 10})
+        coalescer.submit(1, 't', {'completion_percent': 20, 'priority': 'P1'})
+        time.sleep(0.3)
+        assert calls == [('t', {'completion_percent': 20, 'priority': 'P1'})]
+        assert coalescer.pending_for(1) == {}
+
+    def test_failed_flush_is_requeued(self):
+        """Test a failing flush raises to the caller and keeps its changes for the next attempt."""
+        from coalesce import WriteCoalescer
+        calls = []
+
+        def apply(user_id, task_id, changes):
+            calls.append(changes)
+            if len(calls) == 1:
+                raise RuntimeError('database down')
+
+        coalescer = WriteCoalescer(60, apply)
+        coalescer.submit(1, 't', {'priority': 'P1'})
+        with pytest.raises(RuntimeError):
+            coalescer.flush_all()
+        assert coalescer.pending_for(1) == {'t': {'priority': 'P1'}}
+        coalescer.flush_all()
+        assert calls == [{'priority': 'P1'}, {'priority': 'P1'}]
+        assert coalescer.take_failed(1) == []
+
+    def test_flush_given_up_is_reported(self, monkeypatch):
+        """Test changes dropped after the last attempt are reported once through take_failed()."""
+        import coalesce
+
+        def apply(user_id, task_id, changes):
+            raise RuntimeError('database down')
+
+        monkeypatch.setattr(coalesce, 'MAX_FLUSH_ATTEMPTS', 1)
+        coalescer = coalesce.WriteCoalescer(60, apply)
+        coalescer.submit(1, 't', {'priority': 'P1'})
+        with pytest.raises(RuntimeError):
+            coalescer.flush_all()
+        assert coalescer.pending_for(1) == {}
+        assert coalescer.take_failed(1) == ['t']
+        assert coalescer.take_failed(1) == []
+
+    def test_overlay_and_flush_before_item_operation(self, logged_in_client, monkeypatch):
+        """Test pending changes show in the list and are written before an item operation."""
+        import app as app_module
+        from coalesce import WriteCoalescer
+        coalescer = WriteCoalescer(60, app_module._flush_coalesced_changes)
+        monkeypatch.setattr(app_module, 'write_coalescer', coalescer)
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Coalesced',
+            'dueDate': '2099-12-31',
+            'priority': 'P3',
+            'actionableItems': ['a', 'b'],
+        })
+        task_id = json.loads(response.data)['id']
+
+        assert logged_in_client.patch(f'/api/tasks/{task_id}', json={'priority': 'P1'}).status_code == 200
+        tasks = json.loads(logged_in_client.get('/api/tasks').data)
+        assert next(t for t in tasks if t['id'] == task_id)['priority'] == 'P1'
+        assert coalescer.pending_for(json.loads(logged_in_client.get('/api/me').data)['id'])
+
+        data = json.loads(logged_in_client.post(f'/api/tasks/{task_id}/items/0/toggle').data)
+        assert data['priority'] == 'P1'
+        assert data['actionableDone'] == [True, False]
+
+
+class TestTaskCounters:
+    """Test the trigger-maintained task counters endpoint."""
+
+    def _counts(self, client):
+        response = client.get('/api/tasks/counts')
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    def test_counts_unauthorized(self, client):
+        """Test counts require authentication."""
+        response = client.get('/api/tasks/counts')
+        assert response.status_code == 401
+
+    def test_counts_follow_task_changes(self, logged_in_client):
+        """Test create, complete and delete move the open/overdue/completed counts."""
+        from db import db_cursor
+        before = self._counts(logged_in_client)
+        # The API rejects past due dates, so create the task due later and move it back in SQL
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Overdue Task',
+            'dueDate': '2099-12-31',
+            'priority': 'P1',
+            'actionableItems': ['a'],
+        })
+        task_id = json.loads(response.data)['id']
+        user_id = json.loads(logged_in_client.get('/api/me').data)['id']
+        with db_cursor(user_id) as cur:
+            cur.execute("UPDATE tasks SET due_date = DATE '2000-01-01' WHERE id = %s", (task_id,))
+
+        created = self._counts(logged_in_client)
+        assert created['open'] == before['open'] + 1
+        assert created['overdue'] == before['overdue'] + 1
+
+        logged_in_client.patch(f'/api/tasks/{task_id}', json={'completed': True})
+        completed = self._counts(logged_in_client)
+        assert completed['open'] == before['open']
+        assert completed['overdue'] == before['overdue']
+        assert completed['completed']['P1'] == before['completed']['P1'] + 1
+
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+        assert self._counts(logged_in_client) == before
+
+
+class TestDueDateScheduler:
+    """Test the batched due-date scanner and its outbox."""
+
+    def test_overdue_task_enqueued_once(self, logged_in_client):
+        """Test a scan enqueues one overdue event per task and re-scans are idempotent."""
+        import uuid
+        from datetime import date
+        import scheduler
+        from db import db_cursor
+
+        # The API rejects past due dates, so the overdue task is seeded directly
+        user_id = json.loads(logged_in_client.get('/api/me').data)['id']
+        task_id = str(uuid.uuid4())
+        with db_cursor(user_id) as cur:
+            cur.execute(
+                "INSERT INTO tasks (id, user_id, name, due_date, priority, actionable_items)"
+                " VALUES (%s, %s, 'Old Task', DATE '2000-01-01', 'P3', '[\"a\"]'::jsonb)",
+                (task_id, user_id),
+            )
+
+        for _ in range(2):
+            stats = scheduler.scan(today=date(2000, 1, 3), batch_size=2)
+            assert stats['scanned'] >= 1
+        scheduler.drain()
+
+        with db_cursor(user_id) as cur:
+            cur.execute(
+                "SELECT kind, processed_at IS NOT NULL FROM task_outbox WHERE task_id = %s",
+                (task_id,),
+            )
+            assert cur.fetchall() == [('overdue', True)]
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+
+
+class TestRequestProfiling:
+    """Test header-triggered request profiling."""
+
+    def test_profile_header_writes_reports(self, logged_in_client, monkeypatch, tmp_path):
+        """Test a request with the profile token writes pstats, text and collapsed-stack files."""
+        import profiling
+        monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+        monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+
+        response = logged_in_client.get('/api/analytics/cfd?days=7', headers={'X-Profile-Token': 'secret'})
+        assert response.status_code == 200
+        suffixes = sorted(path.suffix for path in tmp_path.iterdir())
+        assert suffixes == ['.collapsed', '.pstats', '.txt']
+        report = next(tmp_path.glob('*.txt')).read_text()
+        assert 'GET /api/analytics/cfd' in report
+
+    def test_flamegraph_requires_token(self, client, monkeypatch):
+        """Test the collapsed-stack export is forbidden without the profile token."""
+        import profiling
+        monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+        assert client.get('/api/debug/profile/flamegraph').status_code == 403
+        response = client.get('/api/debug/profile/flamegraph', headers={'X-Profile-Token': 'secret'})
+        assert response.status_code == 200
+
+
+class TestRequestTracing:
+    """Test request tracing spans and traceparent propagation."""
+
+    def test_traceparent_continues_trace_with_db_spans(self, logged_in_client, monkeypatch):
+        """Test a sampled traceparent yields one trace with handler, db and serialization spans."""
+        import tracing
+        exported = []
+        monkeypatch.setattr(tracing, 'ENABLED', True)
+        monkeypatch.setattr(tracing, 'export', exported.append)
+
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        response = logged_in_client.get('/api/tasks', headers={
+            'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01',
+        })
+        assert response.status_code == 200
+        assert response.headers['traceparent'].startswith(f'00-{trace_id}-')
+
+        spans = exported[0]
+        names = {span.name for span in spans}
+        assert {'GET /api/tasks', 'db.acquire', 'db.execute', 'db.commit', 'serialize.response'} <= names
+        assert all(span.trace_id == trace_id for span in spans)
+        root = next(span for span in spans if span.name == 'GET /api/tasks')
+        assert root.parent_id == '00f067aa0ba902b7'
+        assert tracing.to_otlp(spans)['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    def test_unsampled_request_exports_nothing(self, logged_in_client, monkeypatch):
+        """Test requests are not traced when sampling is off and no sampled parent is given."""
+        import tracing
+        exported = []
+        monkeypatch.setattr(tracing, 'ENABLED', True)
+        monkeypatch.setattr(tracing, 'TRACE_SAMPLE_RATE', 0.0)
+        monkeypatch.setattr(tracing, 'export', exported.append)
+
+        logged_in_client.get('/api/tasks')
+        assert exported == []
+
+
+class TestCors:
+    """Test the centralized CORS middleware."""
+
+    ORIGIN = 'http://localhost:5173'
+
+    def test_preflight_short_circuits_with_max_age(self, client):
+        """Test an allowed preflight gets 204 with cached allow headers."""
+        response = client.options('/api/tasks', headers={
+            'Origin': self.ORIGIN,
+            'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'content-type',
+        })
+        assert response.status_code == 204
+        assert response.headers['Access-Control-Allow-Origin'] == self.ORIGIN
+        assert response.headers['Access-Control-Allow-Credentials'] == 'true'
+        assert response.headers['Access-Control-Allow-Headers'] == 'content-type'
+        assert int(response.headers['Access-Control-Max-Age']) > 0
+
+    def test_disallowed_origin_gets_no_cors_headers(self, client):
+        """Test responses to unknown origins carry no allow-origin header."""
+        response = client.post('/api/login', json={'username': '', 'password': ''},
+                               headers={'Origin': 'http://evil.example'})
+        assert response.status_code == 400
+        assert 'Access-Control-Allow-Origin' not in response.headers
+
+    def test_error_responses_carry_cors_headers(self, client):
+        """Test handler error paths get CORS headers from the middleware."""
+        response = client.post('/api/register', json={'username': 'ab', 'password': 'x'},
+                               headers={'Origin': self.ORIGIN})
+        assert response.status_code == 400
+        assert response.headers['Access-Control-Allow-Origin'] == self.ORIGIN
+
+
+class TestPreparedStatements:
+    """Test the named statement registry and fixed-shape task update."""
+
+    def test_partial_updates_share_one_statement(self, logged_in_client):
+        """Test different partial PATCH payloads run the same registered UPDATE and are timed."""
+        import metrics
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Shape Task',
+            'dueDate': '2099-12-31',
+            'priority': 'P2',
+            'actionableItems': ['a', 'b'],
+        })
+        task_id = json.loads(response.data)['id']
+        before = metrics.snapshot()['timings'].get('sql.task_update', {}).get('count', 0)
+
+        logged_in_client.patch(f'/api/tasks/{task_id}', json={'name': 'Renamed'})
+        response = logged_in_client.patch(f'/api/tasks/{task_id}', json={'completed': True, 'completionPercent': 100})
+        data = json.loads(response.data)
+        assert data['name'] == 'Renamed'
+        assert data['completed'] is True
+        assert data['completionPercent'] == 100
+        assert data['actionableItems'] == ['a', 'b']
+        assert metrics.snapshot()['timings']['sql.task_update']['count'] == before + 2
+
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+
+
+class TestStatementTimeouts:
+    """Test cancelled queries map to clean 503 responses."""
+
+    def test_cancelled_query_returns_503(self, logged_in_client, monkeypatch):
+        """Test a statement timeout surfaces as 503 with Retry-After."""
+        import psycopg
+        import queries
+
+        def cancelled(cur, name, params=None):
+            raise psycopg.errors.QueryCanceled("canceling statement due to statement timeout")
+
+        monkeypatch.setattr(queries, 'execute', cancelled)
+        response = logged_in_client.get('/api/tasks/counts')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+
+class TestTaskListCache:
+    """Test the per-user task-list cache and its NOTIFY invalidation."""
+
+    def test_cache_hit_and_invalidation(self, logged_in_client, monkeypatch):
+        """Test repeated lists are served from cache and a write invalidates them."""
+        import time
+        import metrics
+        import task_cache as task_cache_module
+        from events import broker
+        monkeypatch.setattr(task_cache_module, 'CACHE_FRESH_SECONDS', 0)
+
+        logged_in_client.get('/api/tasks')
+        deadline = time.time() + 5
+        while not broker.is_connected() and time.time() < deadline:
+            time.sleep(0.05)
+        assert broker.is_connected()
+
+        logged_in_client.get('/api/tasks')
+        hits = metrics.snapshot()['counters'].get('task_cache.hit', 0)
+        logged_in_client.get('/api/tasks')
+        assert metrics.snapshot()['counters']['task_cache.hit'] == hits + 1
+
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Cache Task',
+            'dueDate': '2099-12-31',
+            'priority': 'P3',
+            'actionableItems': ['a'],
+        })
+        task_id = json.loads(response.data)['id']
+        deadline = time.time() + 2
+        ids = []
+        while time.time() < deadline:
+            ids = [t['id'] for t in json.loads(logged_in_client.get('/api/tasks').data)]
+            if task_id in ids:
+                break
+            time.sleep(0.02)
+        assert task_id in ids
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+
+
+class TestLeadTimeDistribution:
+    """Test lead-time percentiles and histogram."""
+
+    def test_lead_time_unauthorized(self, client):
+        """Test lead-time endpoint requires authentication."""
+        response = client.get('/api/analytics/lead-time')
+        assert response.status_code == 401
+
+    def test_lead_time_shape(self, logged_in_client):
+        """Test lead-time returns percentiles and a histogram per group."""
+        response = logged_in_client.get('/api/analytics/lead-time?days=30')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['time_window_days'] == 30
+        assert set(data['by_priority']) == {'P1', 'P2', 'P3'}
+        assert set(data['by_timeliness']) == {'on_time', 'late'}
+        for key in ('count', 'p50', 'p75', 'p90', 'p95', 'histogram'):
+            assert key in data['overall']
+        assert len(data['overall']['histogram']) == len(data['buckets'])
+        assert sum(data['overall']['histogram']) == data['overall']['count']
+
+    def test_sqlite_fallback_matches_interpolated_percentiles(self):
+        """Test the SQLite query reproduces percentile_cont and bucket counts."""
+        import sqlite3
+        from analytics import LEAD_TIME_SQL_SQLITE, lead_time_payload
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute(
+            'CREATE TABLE tasks (user_id INTEGER, priority TEXT, due_date DATE, completed INTEGER, '
+            'created_at TIMESTAMP, completed_at TIMESTAMP)'
+        )
+        hours = [0.5, 2, 10, 30, 100, 500]
+        for h in hours:
+            conn.execute(
+                "INSERT INTO tasks VALUES (1, 'P1', DATE('now'), 1, "
+                "datetime('now', ?), datetime('now', '-1 hours'))",
+                (f'-{h + 1} hours',),
+            )
+        rows = conn.execute(LEAD_TIME_SQL_SQLITE, {'user_id': 1, 'days': 30}).fetchall()
+        data = lead_time_payload(rows, 30, sqlite=True)
+
+        overall = data['overall']
+        assert overall['count'] == 6
+        assert overall['p50'] == pytest.approx(20.0, abs=0.01)
+        assert overall['p90'] == pytest.approx(300.0, abs=0.01)
+        assert overall['histogram'] == [1, 1, 1, 1, 1, 0, 1, 0]
+        assert data['by_priority']['P1']['count'] == 6
+        assert data['by_priority']['P2']['count'] == 0
+        assert data['by_timeliness']['on_time']['count'] == 6
+
+
+class TestBulkOperations:
+    """Test filter-based bulk task updates."""
+
+    def _create(self, client, priority, due_date='2099-12-31'):
+        response = client.post('/api/tasks', json={
+            'name': f'Bulk {priority}',
+            'dueDate': due_date,
+            'priority': priority,
+            'actionableItems': ['a'],
+        })
+        return json.loads(response.data)['id']
+
+    def test_bulk_complete_by_priority(self, logged_in_client):
+        """Test one request completes every matching task and returns their ids."""
+        p3 = [self._create(logged_in_client, 'P3') for _ in range(2)]
+        p1 = self._create(logged_in_client, 'P1')
+        response = logged_in_client.post('/api/tasks/bulk', json={
+            'filter': {'priority': 'P3', 'ids': p3 + [p1]},
+            'set': {'completed': True},
+            'returnIds': True,
+        })
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['updated'] == 2
+        assert sorted(data['ids']) == sorted(p3)
+
+        tasks = {t['id']: t for t in json.loads(logged_in_client.get('/api/tasks').data)}
+        assert all(tasks[i]['completed'] for i in p3)
+        assert tasks[p1]['completed'] is False
+
+        # Already completed tasks are left alone
+        response = logged_in_client.post('/api/tasks/bulk', json={
+            'filter': {'ids': p3}, 'set': {'completed': True},
+        })
+        assert json.loads(response.data) == {'updated': 0}
+        for task_id in p3 + [p1]:
+            logged_in_client.delete(f'/api/tasks/{task_id}')
+
+    def test_bulk_shift_days(self, logged_in_client):
+        """Test shiftDays moves due dates of matching tasks."""
+        task_id = self._create(logged_in_client, 'P2', '2099-01-01')
+        response = logged_in_client.post('/api/tasks/bulk', json={
+            'filter': {'ids': [task_id]}, 'shiftDays': 7,
+        })
+        assert json.loads(response.data)['updated'] == 1
+        tasks = {t['id']: t for t in json.loads(logged_in_client.get('/api/tasks').data)}
+        assert tasks[task_id]['dueDate'] == '2099-01-08'
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+
+    def test_bulk_validation(self, logged_in_client):
+        """Test bulk requests are validated like single updates."""
+        response = logged_in_client.post('/api/tasks/bulk', json={'set': {'completed': True}})
+        assert response.status_code == 400
+        response = logged_in_client.post('/api/tasks/bulk', json={'filter': {}, 'set': {'priority': 'P9'}})
+        assert response.status_code == 400
+        response = logged_in_client.post('/api/tasks/bulk', json={
+            'filter': {'overdue': True}, 'set': {'dueDate': '2099-01-01'}, 'shiftDays': 1,
+        })
+        assert response.status_code == 400
+        response = logged_in_client.post('/api/tasks/bulk', json={'filter': {}})
+        assert response.status_code == 400
+
+    def test_bulk_unauthorized(self, client):
+        """Test bulk updates require authentication."""
+        response = client.post('/api/tasks/bulk', json={'filter': {}, 'shiftDays': 1})
+        assert response.status_code == 401
+
+
+class TestSingleStatementWrites:
+    """Test write paths return the list version and tell not-found from unchanged."""
+
+    def test_register_duplicate_username(self, client, registered_user):
+        """Test registering a taken username is rejected by the insert itself."""
+        response = client.post('/api/register', json=registered_user)
+        assert response.status_code == 400
+        assert 'already exists' in json.loads(response.data)['message']
+
+    def test_writes_return_list_version(self, logged_in_client):
+        """Test create, update and delete each bump the list version returned in X-List-Version."""
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Versioned',
+            'dueDate': '2099-12-31',
+            'priority': 'P2',
+            'actionableItems': ['a'],
+        })
+        assert response.status_code == 201
+        created = int(response.headers['X-List-Version'])
+        task_id = json.loads(response.data)['id']
+
+        response = logged_in_client.patch(f'/api/tasks/{task_id}', json={'priority': 'P1'})
+        assert response.status_code == 200
+        assert int(response.headers['X-List-Version']) == created + 1
+
+        response = logged_in_client.delete(f'/api/tasks/{task_id}')
+        assert response.status_code == 204
+        assert int(response.headers['X-List-Version']) == created + 2
+
+    def test_unchanged_update_keeps_version(self, logged_in_client):
+        """Test a PATCH that changes nothing answers 200 with the task and the same version."""
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Same',
+            'dueDate': '2099-12-31',
+            'priority': 'P3',
+            'actionableItems': ['a'],
+        })
+        task_id = json.loads(response.data)['id']
+        version = response.headers['X-List-Version']
+
+        response = logged_in_client.patch(f'/api/tasks/{task_id}', json={'priority': 'P3', 'name': 'Same'})
+        assert response.status_code == 200
+        assert json.loads(response.data)['priority'] == 'P3'
+        assert response.headers['X-List-Version'] == version
+        logged_in_client.delete(f'/api/tasks/{task_id}')
+
+    def test_update_missing_task(self, logged_in_client):
+        """Test a PATCH for an unknown task is 404."""
+        import uuid
+        response = logged_in_client.patch(f'/api/tasks/{uuid.uuid4()}', json={'priority': 'P1'})
+        assert response.status_code == 404
+
+
+class TestShardMoves:
+    """Test the write fence applied while a user's data is being moved between shards."""
+
+    def _moving(self, monkeypatch):
+        import shards
+        monkeypatch.setattr(shards, 'sharded', lambda: True)
+        monkeypatch.setattr(shards, '_lookup', lambda user_id: (0, 'moving'))
+
+    def test_reads_work_while_moving(self, logged_in_client, monkeypatch):
+        """Test the task list and user lookup are served while the user is marked moving."""
+        user = json.loads(logged_in_client.get('/api/me').data)
+        self._moving(monkeypatch)
+        assert logged_in_client.get('/api/tasks').status_code == 200
+        assert logged_in_client.get(f"/api/users/{user['id']}").status_code == 200
+
+    def test_writes_fenced_while_moving(self, logged_in_client, monkeypatch):
+        """Test writes answer 503 with Retry-After while the user is marked moving."""
+        self._moving(monkeypatch)
+        response = logged_in_client.post('/api/tasks', json={
+            'name': 'Fenced',
+            'dueDate': '2099-12-31',
+            'priority': 'P2',
+            'actionableItems': ['a'],
+        })
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+
+
+class TestHealthChecks:
+    """Test liveness and readiness endpoints."""
+
+    def test_liveness(self, client):
+        """Test liveness answers without authentication."""
+        response = client.get('/api/health/live')
+        assert response.status_code == 200
+        assert json.loads(response.data)['status'] == 'ok'
+
+    def test_readiness_reports_dependencies(self, client):
+        """Test readiness reports DB latency, schema version, pools and cache state."""
+        import db
+        response = client.get('/api/health/ready')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['status'] == 'ready'
+        assert data['database']['schema_version'] == db.SCHEMA_VERSION
+        assert data['database']['latency_ms'] >= 0
+        assert any(p['max'] == db.POOL_MAX_SIZE for p in data['pools'].values())
+        assert 'listener' in data['task_cache']
+
+    def test_readiness_probe_is_cached(self, client, monkeypatch):
+        """Test repeated readiness checks reuse the cached DB probe."""
+        import health
+        client.get('/api/health/ready')
+        calls = []
+        monkeypatch.setattr(health.db, 'probe_shard', lambda shard, timeout: calls.append(shard))
+        client.get('/api/health/ready')
+        assert calls == []
+
+    def test_readiness_fails_when_database_unreachable(self, client, monkeypatch):
+        """Test a failed DB probe makes the worker not ready."""
+        import health
+
+        def fail(shard, timeout):
+            raise OSError('connection refused')
+        monkeypatch.setattr(health, '_last_probe', None)
+        monkeypatch.setattr(health.db, 'probe_shard', fail)
+        response = client.get('/api/health/ready')
+        assert response.status_code == 503
+        data = json.loads(response.data)
+        assert 'database unreachable' in data['problems']
+
+
+class TestReportJobs:
+    """Test background report jobs."""
+
+    def _wait(self, client, job_id, timeout=15):
+        # Web workers don't run jobs by default; drain the queue here as `python jobs.py` would
+        import time
+        import jobs
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = json.loads(client.get(f'/api/reports/{job_id}').data)
+            if job['status'] in ('done', 'failed'):
+                return job
+            if not jobs.run_next():
+                time.sleep(0.1)
+        return job
+
+    def test_every_report_kind_heartbeats(self, monkeypatch):
+        """Test a report that never reports progress still refreshes its heartbeat while it runs."""
+        import time
+        from contextlib import contextmanager
+        import jobs
+        beats = []
+
+        class FakeCursor:
+            rowcount = 1
+
+            def execute(self, sql, params=None):
+                beats.append(sql)
+
+        @contextmanager
+        def fake_cursor(*args, **kwargs):
+            yield FakeCursor()
+
+        monkeypatch.setattr(jobs, 'db_cursor', fake_cursor)
+        monkeypatch.setattr(jobs, 'REPORT_HEARTBEAT_SECONDS', 0.02)
+        with jobs._heartbeat('job-id', 0):
+            time.sleep(0.2)
+        count = len(beats)
+        assert count >= 2 and all('heartbeat_at' in sql for sql in beats)
+        time.sleep(0.1)
+        assert len(beats) == count
+
+    def test_report_runs_in_background(self, logged_in_client):
+        """Test a submitted report is queued, completed and downloadable."""
+        response = logged_in_client.post('/api/reports', json={'kind': 'cfd', 'days': 800})
+        assert response.status_code == 202
+        job = json.loads(response.data)
+        assert job['status'] == 'queued'
+        assert response.headers['Location'] == f"/api/reports/{job['id']}"
+
+        job = self._wait(logged_in_client, job['id'])
+        assert job['status'] == 'done'
+        assert job['progress'] == 100
+        response = logged_in_client.get(f"/api/reports/{job['id']}/result")
+        assert response.status_code == 200
+        assert len(json.loads(response.data)) == 800
+        assert job['id'] in [j['id'] for j in json.loads(logged_in_client.get('/api/reports').data)]
+
+        assert logged_in_client.delete(f"/api/reports/{job['id']}").status_code == 204
+        assert logged_in_client.get(f"/api/reports/{job['id']}").status_code == 404
+
+    def test_report_validation(self, logged_in_client):
+        """Test unknown kinds and out-of-range windows are rejected."""
+        assert logged_in_client.post('/api/reports', json={'kind': 'everything'}).status_code == 400
+        response = logged_in_client.post('/api/reports', json={'kind': 'history', 'days': 0})
+        assert response.status_code == 400
+
+    def test_reports_unauthorized(self, client):
+        """Test report endpoints require authentication."""
+        assert client.post('/api/reports', json={'kind': 'cfd'}).status_code == 401
+        assert client.get('/api/reports').status_code == 401
@@ -7,6 +7,7 @@ These tests verify that:
 """
 
 import os
+import pytest
 from dotenv import load_dotenv
 from db import db_cursor
 
@@ -30,3 +31,295 @@ def test_db_cursor_connection():
 
     assert row is not None, "No row returned from SELECT 1"
     assert row[0] == 1, "SELECT 1 did not return 1"
+
+
+def test_db_read_cursor_falls_back_to_primary():
+    """A read right after a write is served by the primary (not in recovery)."""
+    import time
+    from db import db_read_cursor
+
+    with db_read_cursor(fresh_since=time.time()) as cur:
+        cur.execute("SELECT pg_is_in_recovery()")
+        assert cur.fetchone()[0] is False
+
+
+@pytest.mark.skipif(not os.getenv("PGREPLICA_DSNS"), reason="PGREPLICA_DSNS not configured")
+def test_db_read_cursor_uses_replica():
+    """With a caught-up replica configured, plain reads are routed to it."""
+    from db import db_read_cursor
+
+    with db_read_cursor() as cur:
+        cur.execute("SELECT pg_is_in_recovery()")
+        assert cur.fetchone()[0] is True
+
+
+def test_statement_budget_cancels_long_query():
+    """Queries in a budget class are cancelled server-side once they exceed its timeout."""
+    import psycopg
+    import db
+
+    db.STATEMENT_TIMEOUTS_MS["test_tiny"] = 50
+    token = db.statement_class.set("test_tiny")
+    try:
+        with pytest.raises(psycopg.errors.QueryCanceled):
+            with db.db_cursor() as cur:
+                cur.execute("SELECT pg_sleep(2)")
+    finally:
+        db.statement_class.reset(token)
+    assert db.metrics.snapshot()["counters"]["db.cancelled.statement_timeout.test_tiny"] >= 1
+
+
+def test_statement_budget_is_scoped_to_the_transaction():
+    """Budget classes share one pool per database and their timeout doesn't outlive the transaction."""
+    import db
+
+    token = db.statement_class.set("analytics")
+    try:
+        with db.db_cursor() as cur:
+            cur.execute("SELECT setting::int FROM pg_settings WHERE name = 'statement_timeout'")
+            assert cur.fetchone()[0] == db.STATEMENT_TIMEOUTS_MS["analytics"]
+    finally:
+        db.statement_class.reset(token)
+    with db.db_cursor() as cur:
+        cur.execute("SELECT setting = reset_val FROM pg_settings WHERE name = 'statement_timeout'")
+        assert cur.fetchone()[0] is True
+    assert len(db._pools) <= len(db.SHARD_DSNS) + len(db.REPLICA_DSNS)
+
+
+def test_shard_placement_spreads_sequential_ids():
+    """Consecutive user ids are spread evenly over the shards by the placement hash."""
+    from shards import placement
+
+    counts = [0] * 4
+    for user_id in range(1, 4001):
+        counts[placement(user_id, 4)] += 1
+    assert min(counts) > 900 and max(counts) < 1100
+
+
+@pytest.mark.skipif(not os.getenv("PGSHARD_DSNS"), reason="PGSHARD_DSNS not configured")
+def test_move_user_between_shards():
+    """Moving a user copies their rows to the target shard, flips the directory and drops the source copy."""
+    import uuid
+    import db
+    import shards
+
+    db.init_schema()
+    username = f"shard-move-{uuid.uuid4().hex[:8]}"
+    user_id, source = shards.allocate_user(username)
+    with db_cursor(shard=source) as cur:
+        cur.execute("INSERT INTO users (id, username, password_hash) VALUES (%s, %s, 'x')", (user_id, username))
+        cur.execute(
+            "INSERT INTO tasks (id, user_id, name, due_date, priority) VALUES (%s, %s, 'moved task', CURRENT_DATE, 'P1')",
+            (uuid.uuid4(), user_id),
+        )
+    target = (source + 1) % len(db.SHARD_DSNS)
+
+    [result] = shards.move_users({user_id: target}, wait=0)
+    assert result["moved"] is True
+    shards._cache.clear()
+    assert shards.shard_for(user_id) == target
+    with db_cursor(shard=target) as cur:
+        cur.execute("SELECT COUNT(*) FROM tasks WHERE user_id = %s", (user_id,))
+        assert cur.fetchone()[0] == 1
+    with db_cursor(shard=source) as cur:
+        cur.execute("SELECT COUNT(*) FROM users WHERE id = %s", (user_id,))
+        assert cur.fetchone()[0] == 0
+
+
+def _user_on_shard(shard: int) -> int:
+    # Allocate usernames until one is placed on `shard`, releasing the others, and create its users row
+    import uuid
+    import shards
+
+    while True:
+        username = f"shard-user-{uuid.uuid4().hex[:8]}"
+        user_id, placed = shards.allocate_user(username)
+        if placed == shard:
+            break
+        shards.release_user(user_id)
+    with db_cursor(shard=shard) as cur:
+        cur.execute("INSERT INTO users (id, username, password_hash) VALUES (%s, %s, 'x')", (user_id, username))
+    return user_id
+
+
+@pytest.mark.skipif(not os.getenv("PGSHARD_DSNS"), reason="PGSHARD_DSNS not configured")
+def test_report_job_for_user_on_other_shard():
+    """Reports are queued on the user's own shard and follow the user when it moves."""
+    import db
+    import jobs
+    import shards
+
+    db.init_schema()
+    user_id = _user_on_shard(1)
+    job = jobs.submit(user_id, "history", 30)
+    assert job is not None and job["status"] == "queued"
+    with db_cursor(shard=1) as cur:
+        cur.execute("SELECT COUNT(*) FROM report_jobs WHERE user_id = %s", (user_id,))
+        assert cur.fetchone()[0] == 1
+
+    [result] = shards.move_users({user_id: 0}, wait=0)
+    assert result["moved"] is True
+    shards._cache.clear()
+    assert jobs.get(user_id, job["id"])["status"] == "queued"
+
+
+def _streak_for(on_time_days_ago, late_days_ago=()):
+    # Fresh user with one task completed on time `n` days ago for each n (and late ones), then the streak
+    import uuid
+    from datetime import date
+    import db
+    from analytics import STREAK_SQL
+
+    db.init_schema()
+    user_id = _user_on_shard(0)
+    with db_cursor(shard=0) as cur:
+        for days_ago, due_offset in [(n, 0) for n in on_time_days_ago] + [(n, -1) for n in late_days_ago]:
+            cur.execute(
+                """
+                INSERT INTO tasks (id, user_id, name, due_date, priority, completed, completed_at)
+                VALUES (%(id)s, %(user_id)s, 'streak', CURRENT_DATE - %(ago)s::int + %(due)s::int, 'P2', true,
+                        (CURRENT_DATE - %(ago)s::int) + INTERVAL '12 hours')
+                """,
+                {"id": uuid.uuid4(), "user_id": user_id, "ago": days_ago, "due": due_offset},
+            )
+        cur.execute(STREAK_SQL, {"user_id": user_id, "today": date.today()})
+        return cur.fetchone()[0]
+
+
+def test_streak_tolerates_one_missing_day():
+    """A single missing day keeps the streak going; two end it. Only on-time days are counted."""
+    assert _streak_for([0, 2, 3, 6]) == 3
+    assert _streak_for([0, 1, 2]) == 3
+
+
+def test_streak_ignores_late_days():
+    """A day with only late completions counts as a missing day."""
+    assert _streak_for([0, 3], late_days_ago=[1, 2]) == 1
+
+
+def test_streak_is_current_from_today_or_yesterday():
+    """The streak counts when the latest on-time day is today or yesterday, and is 0 from two days ago."""
+    assert _streak_for([1, 2]) == 2
+    assert _streak_for([2, 3]) == 0
+    assert _streak_for([]) == 0
+
+
+def test_streak_follows_deletes_and_uncompletes():
+    """The stored streak is recounted when an on-time day inside the run goes away."""
+    import uuid
+    from datetime import date
+    import db
+    from analytics import STREAK_SQL
+
+    db.init_schema()
+    user_id = _user_on_shard(0)
+    ids = {}
+    with db_cursor(shard=0) as cur:
+        # Oldest first, so every insert takes the O(1) extend path
+        for days_ago in (4, 3, 2, 1, 0):
+            ids[days_ago] = uuid.uuid4()
+            cur.execute(
+                """
+                INSERT INTO tasks (id, user_id, name, due_date, priority, completed, completed_at)
+                VALUES (%(id)s, %(user_id)s, 'streak', CURRENT_DATE, 'P2', true,
+                        (CURRENT_DATE - %(ago)s::int) + INTERVAL '12 hours')
+                """,
+                {"id": ids[days_ago], "user_id": user_id, "ago": days_ago},
+            )
+        params = {"user_id": user_id, "today": date.today()}
+        cur.execute(STREAK_SQL, params)
+        assert cur.fetchone()[0] == 5
+
+        # Two missing days (2 and 3) end the run at day 1
+        cur.execute("DELETE FROM tasks WHERE id = %s", (ids[2],))
+        cur.execute("UPDATE tasks SET completed = false, completed_at = NULL WHERE id = %s", (ids[3],))
+        cur.execute(STREAK_SQL, params)
+        assert cur.fetchone()[0] == 2
+
+        cur.execute("DELETE FROM tasks WHERE id = %s", (ids[0],))
+        cur.execute(STREAK_SQL, params)
+        assert cur.fetchone()[0] == 1
+
+
+def _old_completed_tasks(user_id, count, days_ago=200):
+    # Insert `count` tasks completed `days_ago` days ago for the user on shard 0
+    import uuid
+
+    with db_cursor(shard=0) as cur:
+        for _ in range(count):
+            cur.execute(
+                """
+                INSERT INTO tasks (id, user_id, name, due_date, priority, completed, created_at, completed_at)
+                VALUES (%s, %s, 'old', CURRENT_DATE - %s::int, 'P3', true,
+                        NOW() - (%s::int + 10) * INTERVAL '1 day', NOW() - %s::int * INTERVAL '1 day')
+                """,
+                (uuid.uuid4(), user_id, days_ago, days_ago, days_ago),
+            )
+
+
+def _task_locations(user_id):
+    with db_cursor(shard=0) as cur:
+        cur.execute(
+            "SELECT (SELECT COUNT(*) FROM tasks WHERE user_id = %(u)s),"
+            " (SELECT COUNT(*) FROM tasks_archive WHERE user_id = %(u)s),"
+            " (SELECT COUNT(*) FROM tasks_all WHERE user_id = %(u)s)",
+            {"u": user_id},
+        )
+        return cur.fetchone()
+
+
+def test_archive_moves_old_tasks_in_batches():
+    """Old completed tasks move in batches into a monthly partition and stay readable through tasks_all."""
+    from datetime import date, timedelta
+    import archive
+    import db
+
+    db.init_schema()
+    archive.archive_all(90)
+    user_id = _user_on_shard(0)
+    _old_completed_tasks(user_id, 5)
+
+    assert archive.archive_batch(90, batch_size=2) == 2
+    assert _task_locations(user_id) == (3, 2, 5)
+    assert archive.archive_all(90, batch_size=2, pause=0) == 3
+    assert _task_locations(user_id) == (0, 5, 5)
+
+    month = date.today() - timedelta(days=200)
+    with db_cursor(shard=0) as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"tasks_archive_{month:%Y_%m}",))
+        assert cur.fetchone()[0] is True
+
+
+def test_archive_skips_while_lock_is_held():
+    """A pass that can't take the archive advisory lock moves nothing."""
+    import psycopg
+    import archive
+    import db
+
+    db.init_schema()
+    user_id = _user_on_shard(0)
+    _old_completed_tasks(user_id, 1)
+    with psycopg.connect(db.SHARD_DSNS[0], autocommit=True) as holder:
+        holder.execute("SELECT pg_advisory_lock(%s)", (archive.ARCHIVE_LOCK_KEY,))
+        assert archive.archive_batch(90) == 0
+    assert _task_locations(user_id) == (1, 0, 1)
+    archive.archive_all(90)
+
+
+def test_cfd_counts_archived_tasks_as_done():
+    """Tasks archived before the CFD window are Done on every day of it."""
+    import json
+    from datetime import date
+    import archive
+    import db
+    from analytics import CFD_SQL
+
+    db.init_schema()
+    user_id = _user_on_shard(0)
+    _old_completed_tasks(user_id, 3)
+    archive.archive_all(90)
+    with db_cursor(shard=0) as cur:
+        cur.execute(CFD_SQL, {"user_id": user_id, "days": 30, "today": date.today()})
+        points = json.loads(cur.fetchone()[0])
+    assert len(points) == 30
+    assert all(p["done"] == 3 and p["backlog"] == 0 and p["in_progress"] == 0 for p in points)
@@ -0,0 +1,59 @@
+# Per-endpoint statement budgets: each request runs its queries on the pool for its endpoint class
+# (crud / analytics / export, see db.STATEMENT_TIMEOUTS_MS), so Postgres cancels anything over budget.
+# Cancelled queries, whether over budget or abandoned by a disconnected client, become a 503 with
+# Retry-After instead of a 500, and are counted under db.cancelled.* in the metrics registry.
+
+from __future__ import annotations
+
+from typing import Dict
+
+import psycopg
+from flask import g, jsonify, request
+
+import db
+from admission import ENDPOINT_CLASSES
+
+# Flask endpoint name -> statement budget class; unlisted endpoints use "crud".
+# Auth endpoints are ordinary short queries; history exports scan the most rows and report downloads
+# transfer the largest values.
+TIMEOUT_CLASSES: Dict[str, str] = {
+    **{endpoint: ("crud" if cls == "auth" else cls) for endpoint, cls in ENDPOINT_CLASSES.items()},
+    "completed_tasks": "export",
+    "report_result": "export",
+}
+DEFAULT_CLASS = "crud"
+# Seconds clients are told to wait before retrying a cancelled request
+RETRY_AFTER_SECONDS = 1
+
+
+def init_app(app) -> None:
+    """Register hooks that select the statement budget per request and map cancellations to 503."""
+
+    @app.before_request
+    def _select_budget():
+        budget_class = TIMEOUT_CLASSES.get(request.endpoint or "", DEFAULT_CLASS)
+        sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+        g._statement_budget = (db.statement_class.set(budget_class), db.client_socket.set(sock))
+
+    @app.teardown_request
+    def _clear_budget(exc):
+        tokens = g.pop("_statement_budget", None)
+        if tokens is None:
+            return
+        try:
+            db.statement_class.reset(tokens[0])
+            db.client_socket.reset(tokens[1])
+        except ValueError:  # teardown running in a different context (streamed responses)
+            db.statement_class.set(None)
+            db.client_socket.set(None)
+
+    @app.errorhandler(psycopg.errors.QueryCanceled)
+    def _query_cancelled(exc):
+        if isinstance(exc, db.ClientDisconnected):
+            app.logger.info("Cancelled query for disconnected client on %s", request.path)
+        else:
+            app.logger.warning("Statement timeout on %s: %s", request.path, exc)
+        response = jsonify({"message": "The request took too long to process. Please try again."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+        return response
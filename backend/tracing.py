@@ -0,0 +1,287 @@
+# Lightweight request tracing: one trace per sampled request with spans for the handler, database
+# acquire/execute/commit, serialization and password hashing, exported as OTLP/JSON.
+#
+#   TRACE_EXPORT=traces.jsonl                              # append one OTLP/JSON document per trace
+#   TRACE_EXPORT=http://localhost:4318/v1/traces           # POST to an OTLP/HTTP collector
+#   TRACE_SAMPLE_RATE=0.1                                  # fraction of requests traced (default 0.1)
+#
+# An incoming W3C `traceparent` header continues the caller's trace (same trace id, caller's span as
+# parent) and its sampled flag forces sampling. Tracing is off when TRACE_EXPORT is unset; every hook then
+# returns after a single check, and span()/traced_cursor() cost one ContextVar lookup.
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List
+
+import orjson
+from flask import g, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# File path or http(s) collector URL; empty disables tracing
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+ENABLED = bool(TRACE_EXPORT)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "todoapp-backend")
+# Finished traces waiting for the exporter; more are dropped rather than blocking requests
+EXPORT_QUEUE_SIZE = 1000
+# Longest SQL text recorded on a db.execute span
+MAX_STATEMENT_CHARS = 1000
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; finished spans are appended to their trace's span list."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "error", "trace")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, trace: List["Span"],
+                 kind: int = KIND_INTERNAL, attributes: Dict[str, Any] | None = None) -> None:
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error: str | None = None
+        self.trace = trace
+        self.end_ns = 0
+        self.start_ns = time.time_ns()
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self.trace.append(self)
+
+    def child(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> "Span":
+        return Span(name, self.trace_id, self.span_id, self.trace, kind, attributes)
+
+
+class _NoopSpan:
+    """Returned by start_span() when the current request is not traced."""
+
+    __slots__ = ()
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def current_trace_id() -> str | None:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+    """Start a child of the current span without making it current; call .end() when done."""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return parent.child(name, kind, **attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+    """Time the block as a child span of the current one (no-op outside a traced request)."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, kind, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+class _TracedCursor:
+    """Cursor proxy recording a db.execute span per statement; everything else is delegated."""
+
+    __slots__ = ("_cur",)
+
+    def __init__(self, cur) -> None:
+        self._cur = cur
+
+    def execute(self, query, params=None, **kwargs):
+        text = query if isinstance(query, str) else str(query)
+        with span("db.execute", KIND_CLIENT, **{"db.system": "postgresql",
+                                                "db.statement": " ".join(text.split())[:MAX_STATEMENT_CHARS]}) as s:
+            result = self._cur.execute(query, params, **kwargs)
+            if s is not None:
+                s.attributes["db.rows"] = self._cur.rowcount
+            return result
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def traced_cursor(cur):
+    """Wrap a cursor for statement spans when the current request is traced, else return it unchanged."""
+    return _TracedCursor(cur) if _current.get() is not None else cur
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None if absent/invalid."""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+# --- OTLP/JSON export ---
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(s: Span) -> dict:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": s.kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [_attribute(k, v) for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(spans: List[Span]) -> dict:
+    """An OTLP ExportTraceServiceRequest (JSON encoding) for one trace's spans."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME),
+                                        _attribute("process.pid", os.getpid())]},
+            "scopeSpans": [{"scope": {"name": "todoapp.tracing"}, "spans": [_otlp_span(s) for s in spans]}],
+        }]
+    }
+
+
+def _write(document: bytes) -> None:
+    if TRACE_EXPORT.startswith(("http://", "https://")):
+        req = urllib.request.Request(TRACE_EXPORT, data=document, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req, timeout=5).close()
+    else:
+        with open(TRACE_EXPORT, "ab") as fh:
+            fh.write(document + b"\n")
+
+
+_export_queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+_exporter_pid: int | None = None
+_exporter_lock = threading.Lock()
+
+
+def _export_loop() -> None:
+    while True:
+        spans = _export_queue.get()
+        try:
+            _write(orjson.dumps(to_otlp(spans)))
+            metrics.incr("tracing.exported_spans", len(spans))
+        except Exception:
+            metrics.incr("tracing.export_errors")
+            logger.exception("Trace export to %s failed", TRACE_EXPORT)
+
+
+def export(spans: List[Span]) -> None:
+    """Hand a finished trace to the background exporter (started per process, after any fork)."""
+    global _exporter_pid
+    if _exporter_pid != os.getpid():
+        with _exporter_lock:
+            if _exporter_pid != os.getpid():
+                threading.Thread(target=_export_loop, name="trace-exporter", daemon=True).start()
+                _exporter_pid = os.getpid()
+    try:
+        _export_queue.put_nowait(spans)
+    except queue.Full:
+        metrics.incr("tracing.dropped_traces")
+
+
+def init_app(app) -> None:
+    """Register hooks that open a server span per sampled request and export the trace at teardown."""
+
+    @app.before_request
+    def _start_trace():
+        if not ENABLED:
+            return
+        parent = parse_traceparent(request.headers.get("traceparent"))
+        sampled = parent[2] if parent and parent[2] else random.random() < TRACE_SAMPLE_RATE
+        if not sampled:
+            return
+        trace_id, parent_id = (parent[0], parent[1]) if parent else (os.urandom(16).hex(), None)
+        route = request.url_rule.rule if request.url_rule else request.path
+        root = Span(f"{request.method} {route}", trace_id, parent_id, [], KIND_SERVER, {
+            "http.method": request.method,
+            "http.route": route,
+            "http.target": request.full_path.rstrip("?"),
+            "flask.endpoint": request.endpoint or "",
+        })
+        g._trace = (root, _current.set(root))
+
+    @app.after_request
+    def _tag_response(response):
+        state = g.get("_trace")
+        if state is not None:
+            root = state[0]
+            root.attributes["http.status_code"] = response.status_code
+            response.headers["traceparent"] = f"00-{root.trace_id}-{root.span_id}-01"
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        state = g.pop("_trace", None)
+        if state is None:
+            return
+        root, token = state
+        if exc is not None:
+            root.error = f"{type(exc).__name__}: {exc}"
+        try:
+            _current.reset(token)
+        except ValueError:  # teardown running in a different context (streamed responses)
+            _current.set(None)
+        root.end()
+        export(root.trace)
@@ -0,0 +1,7 @@
+# Production WSGI entry point: `gunicorn -c gunicorn.conf.py wsgi:app` (run from backend/).
+# Importing app performs the one-time startup work (connectivity log, schema ensure); with preload_app
+# this happens once in the master, and connection pools/caches are created lazily in each worker.
+
+from app import app
+
+__all__ = ["app"]
@@ -2,6 +2,16 @@ const RAW_BASE_URL =
   import.meta.env.VITE_API_BASE_URL ?? 'http://localhost:5000'
 const API_BASE_URL = RAW_BASE_URL.replace(/\/$/, '')
 
+// Task list versions produced by this tab's writes (X-List-Version). Their task events carry the same
+// version and were already applied from the write's response, so subscribers don't refetch for them.
+const ownVersions = new Set()
+const MAX_OWN_VERSIONS = 100
+
+function rememberOwnVersion(version) {
+  ownVersions.add(String(version))
+  if (ownVersions.size > MAX_OWN_VERSIONS) ownVersions.delete(ownVersions.values().next().value)
+}
+
 async function request(path, { method = 'GET', body, headers } = {}) {
   const config = { method, headers: headers ?? {}, credentials: 'include' }
 
@@ -17,6 +27,8 @@ async function request(path, { method = 'GET', body, headers } = {}) {
   }
 
   const response = await fetch(`${API_BASE_URL}${path}`, config)
+  const listVersion = response.headers.get('X-List-Version')
+  if (response.ok && listVersion) rememberOwnVersion(listVersion)
   const text = await response.text()
   const data = text ? JSON.parse(text) : null
 
@@ -37,6 +49,11 @@ export function fetchTasks() {
   return request('/api/tasks')
 }
 
+// Open / overdue / due-today / completed-per-priority counts without downloading the list
+export function fetchTaskCounts() {
+  return request('/api/tasks/counts')
+}
+
 export function createTask({ name, dueDate, priority, actionableItems, completionPercent }) {
   return request('/api/tasks', {
     method: 'POST',
@@ -55,17 +72,73 @@ export function deleteTask(id) {
   return request(`/api/tasks/${id}`, { method: 'DELETE' })
 }
 
+// Actionable items: item-level operations; each returns the updated task
+export function addTaskItem(id, text) {
+  return request(`/api/tasks/${id}/items`, { method: 'POST', body: { text } })
+}
+
+export function updateTaskItem(id, index, updates) {
+  return request(`/api/tasks/${id}/items/${index}`, { method: 'PATCH', body: updates })
+}
+
+export function toggleTaskItem(id, index) {
+  return request(`/api/tasks/${id}/items/${index}/toggle`, { method: 'POST' })
+}
+
+export function removeTaskItem(id, index) {
+  return request(`/api/tasks/${id}/items/${index}`, { method: 'DELETE' })
+}
+
+export function reorderTaskItems(id, from, to) {
+  return request(`/api/tasks/${id}/items/reorder`, { method: 'POST', body: { from, to } })
+}
+
+// Set-based update of every task matching filter, e.g. bulkUpdateTasks({ overdue: true }, { shiftDays: 7 })
+// or bulkUpdateTasks({ priority: 'P3' }, { set: { completed: true }, returnIds: true }) -> { updated, ids? }
+export function bulkUpdateTasks(filter, { set, shiftDays, returnIds } = {}) {
+  return request('/api/tasks/bulk', { method: 'POST', body: { filter, set, shiftDays, returnIds } })
+}
+
+// Live task changes over Server-Sent Events; EventSource reconnects and resumes via Last-Event-ID.
+// onChange receives (type, data); "bulk" (many tasks changed at once) and "reset" (events were missed) mean
+// the list should be refetched. Events for this tab's own writes are skipped.
+// Returns an unsubscribe function.
+export function subscribeTaskEvents(onChange) {
+  if (typeof EventSource === 'undefined') return () => {}
+  const source = new EventSource(`${API_BASE_URL}/api/tasks/events`, { withCredentials: true })
+  for (const type of ['created', 'updated', 'deleted', 'bulk', 'reset']) {
+    source.addEventListener(type, (event) => {
+      const data = event.data ? JSON.parse(event.data) : null
+      if (data && data.version != null && ownVersions.has(String(data.version))) return
+      onChange(type, data)
+    })
+  }
+  return () => source.close()
+}
+
+// Current user, fetched once per session and seeded by register/login so page loads skip /api/me
+let currentUser = null
+
+function rememberUser(promise) {
+  currentUser = promise
+  promise.catch(() => {
+    if (currentUser === promise) currentUser = null
+  })
+  return promise
+}
+
 export function register({ username, password }) {
   const form = new URLSearchParams({ username, password })
-  return request('/api/register', { method: 'POST', body: form })
+  return rememberUser(request('/api/register', { method: 'POST', body: form }))
 }
 
 export function login({ username, password }) {
   const form = new URLSearchParams({ username, password })
-  return request('/api/login', { method: 'POST', body: form })
+  return rememberUser(request('/api/login', { method: 'POST', body: form }))
 }
 
 export function logout() {
+  currentUser = null
   return request('/api/logout', { method: 'POST' })
 }
 
@@ -74,7 +147,7 @@ export function fetchUser(userId) {
 }
 
 export function getCurrentUser() {
-  return request('/api/me')
+  return currentUser ?? rememberUser(request('/api/me'))
 }
 
 // Analytics APIs
@@ -86,10 +159,37 @@ export function fetchAnalyticsCFD(days = 30) {
   return request(`/api/analytics/cfd?days=${days}`)
 }
 
+// Summary, CFD and streak in a single request: { summary, cfd, streak }
+export function fetchDashboard(days = 30) {
+  return request(`/api/analytics/dashboard?days=${days}`)
+}
+
 export function fetchAnalyticsStreak() {
   return request('/api/analytics/streak')
 }
 
+// Lead-time percentiles (hours) and histogram: { overall, by_priority, by_timeliness, buckets }
+export function fetchLeadTime(days = 90) {
+  return request(`/api/analytics/lead-time?days=${days}`)
+}
+
 export function fetchCompletedTasks(days = 365) {
   return request(`/api/completed-tasks?days=${days}`)
 }
+
+// Background reports: submit, poll fetchReport(id).status until "done", then fetchReportResult(id)
+export function submitReport(kind, days) {
+  return request('/api/reports', { method: 'POST', body: { kind, days } })
+}
+
+export function fetchReport(id) {
+  return request(`/api/reports/${id}`)
+}
+
+export function fetchReportResult(id) {
+  return request(`/api/reports/${id}/result`)
+}
+
+export function cancelReport(id) {
+  return request(`/api/reports/${id}`, { method: 'DELETE' })
+}
@@ -1,6 +1,6 @@
 import { Outlet, NavLink, useNavigate } from 'react-router-dom'
 import { useEffect, useState } from 'react'
-import { fetchTasks, logout } from '../api'
+import { fetchTaskCounts, logout } from '../api'
 
 export default function Layout() {
   const [auth, setAuth] = useState({ username: '', isLoggedIn: false })
@@ -13,7 +13,7 @@ export default function Layout() {
 
   const checkAuth = async () => {
     try {
-      await fetchTasks()
+      await fetchTaskCounts()
       setAuth({ isLoggedIn: true })
     } catch {
       setAuth({ isLoggedIn: false })
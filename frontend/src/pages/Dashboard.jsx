@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { fetchAnalyticsSummary, fetchAnalyticsCFD, fetchAnalyticsStreak, logout, getCurrentUser } from '../api'
+import { fetchDashboard, logout, getCurrentUser } from '../api'
 import { AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts'
 
 export default function Dashboard() {
@@ -57,11 +57,11 @@ export default function Dashboard() {
     setLoading(true)
     setError('')
     try {
-      const [summaryData, cfdDataResponse, streakData] = await Promise.all([
-        fetchAnalyticsSummary(timeWindow),
-        fetchAnalyticsCFD(timeWindow),
-        fetchAnalyticsStreak().catch(() => ({ on_time_streak_days: 0 }))
-      ])
+      const {
+        summary: summaryData,
+        cfd: cfdDataResponse,
+        streak: streakData = { on_time_streak_days: 0 },
+      } = await fetchDashboard(timeWindow)
 
       // Normalize dates to local Date objects
       const normalizedCFD = cfdDataResponse.map((item) => {
@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { createTask, deleteTask, fetchTasks, updateTask, logout, getCurrentUser } from '../api'
+import { createTask, deleteTask, fetchTasks, updateTask, logout, getCurrentUser, subscribeTaskEvents } from '../api'
 
 // Parse "YYYY-MM-DD" as a local date (no timezone shift)
 const parseLocalDate = (isoDate) => {
@@ -44,6 +44,13 @@ export default function Tasks() {
     loadUser()
   }, [])
 
+  // Refresh when tasks change in another tab or device (this tab's own writes are filtered out in api.js)
+  useEffect(() => {
+    return subscribeTaskEvents(() => {
+      loadTasks()
+    })
+  }, [])
+
   // Close menu when clicking outside
   useEffect(() => {
     const handleClickOutside = (event) => {
@@ -142,13 +149,15 @@ export default function Tasks() {
         completed: isCompleted,
       }
 
+      // The response is the saved row, so the list is updated in place instead of refetched
       if (editingTask) {
-        await updateTask(editingTask.id, taskData)
+        const updated = await updateTask(editingTask.id, taskData)
+        setTasks((current) => current.map((task) => (task.id === updated.id ? updated : task)))
       } else {
-        await createTask(taskData)
+        const created = await createTask(taskData)
+        setTasks((current) => [...current, created])
       }
       
-      await loadTasks()
       setShowModal(false)
     } catch (error) {
       alert(error.message || 'Failed to save task')
@@ -159,7 +168,7 @@ export default function Tasks() {
     if (window.confirm('Are you sure you want to delete this task?')) {
       try {
         await deleteTask(id)
-        await loadTasks()
+        setTasks((current) => current.filter((task) => task.id !== id))
       } catch (error) {
         alert(error.message || 'Failed to delete task')
       }
@@ -8,13 +8,8 @@ import * as api from '../api'
 
 // Mock API module
 vi.mock('../api', () => ({
-  fetchAnalyticsSummary: vi.fn(),
-  fetchAnalyticsCFD: vi.fn(),
+  fetchDashboard: vi.fn(),
   fetchCompletedTasks: vi.fn(),
-  // Extra mocks for new Dashboard code
-  fetchAnalyticsStreak: vi.fn(() =>
-    Promise.resolve({ on_time_streak_days: 0 })
-  ),
   getCurrentUser: vi.fn(() =>
     Promise.resolve({ username: 'User' })
   ),
@@ -27,10 +22,7 @@ describe('Dashboard Page', () => {
   })
 
   it('renders loading state initially', async () => {
-    api.fetchAnalyticsSummary.mockImplementation(
-      () => new Promise(() => {})
-    )
-    api.fetchAnalyticsCFD.mockImplementation(
+    api.fetchDashboard.mockImplementation(
       () => new Promise(() => {})
     )
 
@@ -60,9 +52,11 @@ describe('Dashboard Page', () => {
       { date: '2025-11-21', backlog: 4, in_progress: 3, done: 4 }
     ]
 
-    api.fetchAnalyticsSummary.mockResolvedValue(mockSummary)
-    api.fetchAnalyticsCFD.mockResolvedValue(mockCFD)
-    api.fetchAnalyticsStreak.mockResolvedValue({ on_time_streak_days: 2 })
+    api.fetchDashboard.mockResolvedValue({
+      summary: mockSummary,
+      cfd: mockCFD,
+      streak: { on_time_streak_days: 2 }
+    })
     api.getCurrentUser.mockResolvedValue({ username: 'Test User' })
 
     render(
@@ -87,8 +81,7 @@ describe('Dashboard Page', () => {
   })
 
   it('handles API errors gracefully', async () => {
-    api.fetchAnalyticsSummary.mockRejectedValue(new Error('API Error'))
-    api.fetchAnalyticsCFD.mockRejectedValue(new Error('API Error'))
+    api.fetchDashboard.mockRejectedValue(new Error('API Error'))
 
     render(
       <BrowserRouter>
@@ -103,14 +96,17 @@ describe('Dashboard Page', () => {
   })
 
   it('renders time window filter buttons', async () => {
-    api.fetchAnalyticsSummary.mockResolvedValue({
-      total_completed: 5,
-      completed_on_time: 3,
-      on_time_rate: 0.6,
-      tasks_completed_this_week: 2,
-      avg_completion_days: 2.0
+    api.fetchDashboard.mockResolvedValue({
+      summary: {
+        total_completed: 5,
+        completed_on_time: 3,
+        on_time_rate: 0.6,
+        tasks_completed_this_week: 2,
+        avg_completion_days: 2.0
+      },
+      cfd: [],
+      streak: { on_time_streak_days: 0 }
     })
-    api.fetchAnalyticsCFD.mockResolvedValue([])
 
     render(
       <BrowserRouter>
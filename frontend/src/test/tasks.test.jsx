@@ -12,6 +12,7 @@ vi.mock('../api', () => ({
   createTask: vi.fn(),
   updateTask: vi.fn(),
   deleteTask: vi.fn(),
+  subscribeTaskEvents: vi.fn(() => () => {}),
 }))
 
 const renderTasksPage = () => {